@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+asyncio implementation of the FUDI protocol and of the Purity client.
+
+It mirrors the Twisted implementation of the fudi, client and process
+modules, with asyncio futures instead of Deferreds. Patches are made
+with the same canvas module.
+
+Needs Python 3.4 or later. Any event loop implementing the asyncio API
+can be used.
+"""
+import codecs
+import collections
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+from purity.codec import to_fudi
+from purity.codec import encode_messages
+from purity.codec import FUDIParser
+from purity.codec import Dispatcher
+from purity import server
+from purity import canvas
+
+VERBOSE = False
+
+if asyncio is not None:
+    _Protocol = asyncio.Protocol
+    _SubprocessProtocol = asyncio.SubprocessProtocol
+else:
+    _Protocol = object
+    _SubprocessProtocol = object
+
+class ManagedProcessError(Exception):
+    """
+    Raised by PureDataProcess
+    """
+    pass
+
+def _get_loop(loop=None):
+    """
+    Returns the given event loop, or the current one.
+    """
+    if asyncio is None:
+        raise RuntimeError("The asyncio module is needed for purity.aio.")
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    return loop
+
+def _chain(future, callback, result):
+    """
+    Calls callback with the result of a future once it is done.
+    If it failed, sets its exception on the result future instead.
+    The callback is not called if the result future is already done.
+    """
+    def _done(future):
+        if result.done():
+            return
+        if future.cancelled():
+            result.cancel()
+        elif future.exception() is not None:
+            result.set_exception(future.exception())
+        else:
+            try:
+                callback(future.result())
+            except Exception as e:
+                if not result.done():
+                    result.set_exception(e)
+    future.add_done_callback(_done)
+
+class FUDIProtocol(_Protocol):
+    """
+    FUDI protocol implementation for asyncio.
+    """
+    def __init__(self, dispatcher=None, encoding="utf-8"):
+        self.dispatcher = dispatcher
+        self.encoding = encoding
+        self.transport = None
+        self.parser = FUDIParser()
+        self.paused = False
+        self._decoder = codecs.getincrementaldecoder(encoding)("replace")
+        self._drain_waiters = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.resume_writing()
+
+    def data_received(self, data):
+        for message in self.parser.feed(self._decoder.decode(data)):
+            self.message_received(message[0], message[1:])
+
+    def message_received(self, selector, atoms):
+        """
+        Called for every FUDI message received.
+        Calls the callbacks registered for its selector.
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.dispatch(self, selector, atoms)
+
+    def send_message(self, selector, *atoms):
+        """
+        Converts int, float, string to FUDI atoms and sends them.
+        """
+        txt = to_fudi(selector, *atoms)
+        if VERBOSE:
+            print("FUDI: %s" % (txt.strip()))
+        self.transport.write(txt.encode(self.encoding))
+
+    def send_messages(self, messages):
+        """
+        Converts many messages to FUDI and sends them in a single write.
+        :param messages: iterable of lists of atoms. The first atom of each list is its selector.
+        """
+        txt = encode_messages(messages)
+        if txt:
+            self.transport.write(txt.encode(self.encoding))
+
+    def send_encoded(self, txt, count=1):
+        """
+        Sends text that is already encoded in FUDI.
+        """
+        self.transport.write(txt.encode(self.encoding))
+
+    def pause_writing(self):
+        """
+        Called by the transport when its buffer is full.
+        """
+        self.paused = True
+
+    def resume_writing(self):
+        """
+        Called by the transport when its buffer has been drained.
+        """
+        self.paused = False
+        waiters = self._drain_waiters
+        self._drain_waiters = []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(True)
+
+    def wait_for_drain(self):
+        """
+        Returns a future which is done once the transport buffer is drained.
+        """
+        waiter = _get_loop().create_future()
+        if self.paused:
+            self._drain_waiters.append(waiter)
+        else:
+            waiter.set_result(True)
+        return waiter
+
+class FUDIServerFactory(object):
+    """
+    Factory for FUDI receivers.
+
+    You should attach FUDI message callbacks to an instance of this.
+    """
+    def __init__(self):
+        self.dispatcher = Dispatcher()
+
+    def __call__(self):
+        return FUDIProtocol(self.dispatcher)
+
+    def register_message(self, selector, callback):
+        """
+        Registers a listener for a message selector.
+        @see purity.fudi.FUDIServerFactory.register_message
+        """
+        if not callable(callback):
+            raise TypeError("Callback '%s' is not callable" % repr(callback))
+        self.dispatcher.subscribe(selector, callback)
+
+    def unregister_message(self, selector, callback):
+        """
+        Removes a listener for a message selector.
+        """
+        self.dispatcher.unsubscribe(selector, callback)
+
+    def set_default_handler(self, callback):
+        """
+        Sets the listener for the messages with no other listener.
+        """
+        self.dispatcher.set_default_handler(callback)
+
+    def listen(self, port, host="localhost", loop=None):
+        """
+        Starts listening for FUDI connections.
+        :return: future whose result is an asyncio Server.
+        """
+        loop = _get_loop(loop)
+        return loop.create_task(loop.create_server(self, host, port))
+
+def create_FUDI_client(host, port, loop=None):
+    """
+    Creates a FUDI sender.
+    :return: future whose result is the FUDIProtocol once connected.
+    """
+    loop = _get_loop(loop)
+    result = loop.create_future()
+    task = loop.create_task(loop.create_connection(FUDIProtocol, host, port))
+    _chain(task, lambda transport_protocol: result.set_result(transport_protocol[1]), result)
+    return result
+
+class _PureDataProcessProtocol(_SubprocessProtocol):
+    """
+    Gives the events of the Pure Data process to its PureDataProcess.
+    """
+    def __init__(self, manager):
+        self.manager = manager
+
+    def connection_made(self, transport):
+        self.manager._on_connection_made(transport)
+
+    def pipe_data_received(self, fd, data):
+        self.manager._on_output(data)
+
+    def process_exited(self):
+        self.manager._on_process_exited()
+
+class PureDataProcess(object):
+    """
+    Pure Data process managed with asyncio.
+
+    Works like purity.process.ProcessManager, for a PureData launcher.
+    """
+    STATE_IDLE = "IDLE"
+    STATE_STARTING = "STARTING"
+    STATE_RUNNING = "RUNNING"
+    STATE_STOPPING = "STOPPING"
+    STATE_STOPPED = "STOPPED"
+    STATE_ERROR = "ERROR"
+
+    def __init__(self, loop=None, check_delay=2.0, log_max_size=100, **pd_kwargs):
+        """
+        :param pd_kwargs: Keyword arguments for purity.server.PureData.
+        """
+        self.loop = _get_loop(loop)
+        self.check_delay = check_delay
+        self.pure_data = server.PureData(**pd_kwargs)
+        self.command = None # built by start()
+        self.output = collections.deque(maxlen=log_max_size)
+        self.state = self.STATE_IDLE
+        self._transport = None
+        self._exited = None
+        self._spawning = None # task spawning the process
+
+    def start(self):
+        """
+        Starts Pure Data.
+        :return: future which is done once it has been running for check_delay seconds.
+        """
+        def _cb_spawned(transport_protocol):
+            self.loop.call_later(self.check_delay, _check)
+        def _check():
+            if result.done():
+                return
+            if self.state == self.STATE_RUNNING:
+                result.set_result(True)
+            else:
+                result.set_exception(ManagedProcessError(
+                    "Could not start Pure Data. Its state is %s. Here is its output:\n%s" %
+                    (self.state, self.get_output())))
+        if self.command is None:
+            self.pure_data.write_patch()
+            self.command = self.pure_data.get_command()
+        result = self.loop.create_future()
+        self._exited = self.loop.create_future()
+        self.output.clear()
+        self.state = self.STATE_STARTING
+        task = self.loop.create_task(self.loop.subprocess_exec(
+            lambda: _PureDataProcessProtocol(self), *self.command))
+        _chain(task, _cb_spawned, result)
+        def _eb_spawn(task):
+            self._spawning = None
+            if self.state == self.STATE_STARTING and (task.cancelled() or task.exception() is not None):
+                self.state = self.STATE_ERROR
+        task.add_done_callback(_eb_spawn)
+        self._spawning = task
+        return result
+
+    def stop(self):
+        """
+        Kills Pure Data.
+        If it is still being spawned, cancels its start.
+        :return: future which is done once it has exited.
+        """
+        if self.state not in (self.STATE_RUNNING, self.STATE_STARTING) or self._transport is None:
+            if self._spawning is not None:
+                self._spawning.cancel()
+            self.state = self.STATE_STOPPED
+            result = self.loop.create_future()
+            result.set_result(True)
+            if self._exited is not None and not self._exited.done():
+                self._exited.set_result(True)
+            return result
+        self.state = self.STATE_STOPPING
+        self._transport.kill()
+        return self._exited
+
+    def get_output(self):
+        """
+        Returns the last lines printed by Pure Data.
+        """
+        return "\n".join(self.output)
+
+    def _on_connection_made(self, transport):
+        self._transport = transport
+        if self.state == self.STATE_STARTING:
+            self.state = self.STATE_RUNNING
+
+    def _on_output(self, data):
+        for line in data.decode("utf-8", "replace").splitlines():
+            self.output.append(line)
+
+    def _on_process_exited(self):
+        if self.state == self.STATE_STOPPING:
+            self.state = self.STATE_STOPPED
+        else:
+            self.state = self.STATE_ERROR
+        if self._transport is not None:
+            self._transport.close()
+        if not self._exited.done():
+            self._exited.set_result(True)
+
+class PurityClient(object):
+    """
+    Dynamic patching Pure Data message sender for asyncio.
+    @see purity.client.PurityClient
+    """
+    def __init__(self, receive_port=15555, send_port=17777, loop=None):
+        self.receive_port = receive_port
+        self.send_port = send_port
+        self.loop = _get_loop(loop)
+        self.client_protocol = None
+        self.fudi_server = None
+        self.pure_data = None # PureDataProcess
+        self._server = None # asyncio Server
+        self._server_startup_future = None
+
+    def register_message(self, selector, callback):
+        """
+        Registers a listener for a message selector.
+        @see purity.fudi.FUDIServerFactory.register_message
+        """
+        if self.fudi_server is not None:
+            self.fudi_server.register_message(selector, callback)
+
+    def start_purity_receiver(self):
+        """
+        You need to call this before launching the pd patch!
+        :return: future which is done when Pd sends __first_connected__
+        """
+        def _cb_listening(server):
+            self._server = server
+        self._server_startup_future = self.loop.create_future()
+        self.fudi_server = FUDIServerFactory()
+        self.fudi_server.register_message("__first_connected__", self.on_first_connected)
+        listening = self.fudi_server.listen(self.receive_port, loop=self.loop)
+        _chain(listening, _cb_listening, self._server_startup_future)
+        return self._server_startup_future
+
+    def start_purity_sender(self):
+        """
+        Starts purity sender.
+        :return: future whose result is the FUDIProtocol.
+        """
+        def _cb_connected(protocol):
+            self.client_protocol = protocol
+            result.set_result(protocol)
+        result = self.loop.create_future()
+        _chain(create_FUDI_client("localhost", self.send_port, self.loop), _cb_connected, result)
+        return result
+
+    def on_first_connected(self, protocol, *args):
+        """
+        Receives FUDI __first_connected__ when the Pure Data application
+        is ready and can send FUDI message to Python.
+        """
+        if not self._server_startup_future.done():
+            self._server_startup_future.set_result(self.fudi_server)
+
+    def send_message(self, selector, *args):
+        """
+        Send a message to pure data
+        """
+        if self.client_protocol is not None:
+            self.client_protocol.send_message(selector, *args)
+        else:
+            print("Could not send %s" % (str(args)))
+
+    def send_messages(self, messages):
+        """
+        Sends many messages to pure data at once.
+        :param messages: iterable of lists of atoms. The first atom of each list is its selector.
+        """
+        if self.client_protocol is not None:
+            self.client_protocol.send_messages(messages)
+        else:
+            print("Could not send %s" % (str(messages)))
+
+    def send_encoded(self, txt, count=1):
+        """
+        Sends text that is already encoded in FUDI.
+        """
+        if self.client_protocol is not None:
+            self.client_protocol.send_encoded(txt, count)
+        else:
+            print("Could not send %s" % (txt.strip()))
+
+    def create_patch(self, patch, delay=0.01):
+        """
+        Sends the creation messages for a subpatch.
+
+        :param delay: Duration in seconds between each message. If 0, all
+        messages are sent at once.
+        :return: future
+        """
+        def _drip():
+            try:
+                mess = messages.pop(0)
+            except IndexError:
+                result.set_result(True)
+            else:
+                self.send_message(*mess)
+                self.loop.call_later(delay, _drip)
+        result = self.loop.create_future()
+        messages = patch.get_fudi()
+        patch.mark_materialized()
+        if not delay:
+            self.send_messages(messages)
+            result.set_result(True)
+        else:
+            _drip()
+        return result
+
+    def update_patch(self, patch):
+        """
+        Sends only what changed in a subpatch since it was created or 
+        last updated.
+        @see purity.client.PurityClient.update_patch
+        """
+        messages = patch.get_edit_script()
+        if messages:
+            self.send_messages(messages)
+        return len(messages)
+
+    def open_patch(self, patch, directory=None):
+        """
+        Writes a subpatch to a .pd file that Pd opens in a new window, as
+        [pd NAME]. For big patches, it is much faster than create_patch(). 
+        It can then be changed with update_patch().
+        :return: str The file name.
+        @see purity.canvas.open_pd_file
+        """
+        message, file_name = canvas.open_pd_file(patch, directory)
+        self.send_message(*message)
+        return file_name
+
+    def quit(self):
+        """
+        Closes the sockets and stops Pure Data if we launched it.
+        :return: future
+        """
+        if self.client_protocol is not None and self.client_protocol.transport is not None:
+            self.client_protocol.transport.close()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self.pure_data is not None:
+            return self.pure_data.stop()
+        result = self.loop.create_future()
+        result.set_result(True)
+        return result
+
+def create_simple_client(loop=None, **pd_kwargs):
+    """
+    Starts the Purity receiver, launches Pure Data and then starts
+    the Purity sender.
+    @see purity.client.create_simple_client
+    :return: future whose result is a PurityClient.
+    """
+    def _cb_both_started(results):
+        _chain(purity_client.start_purity_sender(),
+            lambda protocol: result.set_result(purity_client), result)
+    loop = _get_loop(loop)
+    result = loop.create_future()
+    purity_client = PurityClient(receive_port=15555, send_port=17777, loop=loop)
+    receiver = purity_client.start_purity_receiver()
+    purity_client.pure_data = PureDataProcess(loop=loop, **pd_kwargs)
+    started = purity_client.pure_data.start()
+    _chain(asyncio.gather(receiver, started), _cb_both_started, result)
+    return result
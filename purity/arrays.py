@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Transfer of NumPy arrays to Pure Data arrays.
+
+A Pd array sets its values from the list it receives: the first number
+is the index of the first value to set. The values are converted to
+32-bit floats like in Pd and sent in chunks, each formatted at once, so
+that no line is longer than MAX_LINE bytes.
+
+Needs NumPy. Does not use Twisted.
+"""
+import time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAX_LINE = 4096 # bytes per FUDI message
+PRECISION = 9 # significant digits for an exact 32-bit float
+
+def get_chunk_size(name, precision=PRECISION, max_line=MAX_LINE):
+    """
+    Returns how many values fit in a message, whatever their value.
+    """
+    header = len("%s %d" % (name, 2 ** 31)) + len(" ;\r\n")
+    # sign, digits, point and exponent, such as " -1.2345678e-05"
+    width = precision + 7
+    return max(1, (max_line - header) // width)
+
+def encode_array(name, values, onset=0, precision=PRECISION, max_line=MAX_LINE):
+    """
+    Encodes the messages that write values to a Pd array.
+    :param name: str Name of the array.
+    :param values: sequence of numbers, such as a NumPy array.
+    :param onset: int Index of the first value in the Pd array.
+    :param precision: int Number of significant digits of the values.
+    :return: tuple of the FUDI text and the number of messages in it.
+    """
+    values = numpy.asarray(values, dtype=numpy.float32).ravel().astype(numpy.float64).tolist()
+    chunk_size = get_chunk_size(name, precision, max_line)
+    atom = " %%.%dg" % (precision)
+    name = name.replace("%", "%%") # the line is a format string
+    lines = []
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        line = "%s %d" % (name, onset + start) + atom * len(chunk) + " ;\r\n"
+        lines.append(line % tuple(chunk))
+    return "".join(lines), len(lines)
+
+def send_array(purity_client, name, values, onset=0, precision=PRECISION, resize=False):
+    """
+    Writes values to a Pd array.
+    :param purity_client: Any client with send_message() and send_encoded().
+    :param resize: bool Resizes the array to onset plus the number of values first.
+    :return: dict with the number of samples, bytes and messages sent, the
+    duration in seconds to encode and write them, and the number of
+    samples per second.
+    """
+    start = time.time()
+    if resize:
+        purity_client.send_message(name, "resize", onset + len(values))
+    txt, count = encode_array(name, values, onset, precision)
+    purity_client.send_encoded(txt, count)
+    duration = time.time() - start
+    stats = {
+        "samples": len(values),
+        "bytes": len(txt),
+        "messages": count,
+        "duration": duration,
+        "samples_per_second": None,
+        }
+    if duration > 0:
+        stats["samples_per_second"] = len(values) / duration
+    return stats
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Compares the memory used by a generated patch stored with the classes of
+purity.canvas and with a purity.compact.CompactPatch.
+
+Each storage is measured in a new process, by the growth of its maximum
+resident set size while the patch is built. The durations to build the patch, to collect the
+garbage and to compute its FUDI lists are also given.
+"""
+import gc
+import os
+import resource
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+from purity import canvas
+from purity import compact
+
+def make_edges(num_objects, edges_per_object):
+    """
+    Connects each object to the next ones.
+    """
+    edges = []
+    for i in range(num_objects - edges_per_object):
+        for j in range(edges_per_object):
+            edges.append((i, 0, i + j + 1, j % 2))
+    return edges
+
+def build(engine, num_objects, edges):
+    if engine == "compact":
+        patch = compact.CompactPatch("__main__")
+    else:
+        patch = canvas.get_main_patch()
+    for i in range(num_objects):
+        patch.obj("*~", i % 16)
+    patch.connect_many(edges)
+    return patch
+
+def get_max_rss():
+    """
+    Returns the maximum resident set size of this process, in bytes.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return usage
+    return usage * 1024
+
+def measure(engine, num_objects, edges_per_object):
+    edges = make_edges(num_objects, edges_per_object)
+    before = get_max_rss()
+    start = time.time()
+    patch = build(engine, num_objects, edges)
+    built = time.time()
+    gc.collect()
+    collected = time.time()
+    size = get_max_rss() - before
+    patch.get_fudi()
+    done = time.time()
+    print("%8s: %d objects, %d connections: %.1f MB, build %f s, gc %f s, get_fudi %f s" % (engine, 
+        num_objects, len(edges), size / 1048576.0, built - start, collected - built, done - collected))
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--num-objects", type="int", default=100000, \
+        help="Number of objects in the patch.")
+    parser.add_option("-e", "--edges-per-object", type="int", default=4, \
+        help="Number of connections per object.")
+    parser.add_option("-s", "--storage", type="string", \
+        help="Measures only canvas or compact, in this process.")
+    (options, args) = parser.parse_args()
+    if options.storage is not None:
+        measure(options.storage, options.num_objects, options.edges_per_object)
+    else:
+        for engine in ["canvas", "compact"]:
+            subprocess.call([sys.executable, os.path.abspath(__file__), "-s", engine, 
+                "-n", str(options.num_objects), "-e", str(options.edges_per_object)])
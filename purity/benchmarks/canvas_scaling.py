@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Measures how long it takes to build generated patches of 100 to 100000
+objects, with four connections per object.
+
+Each size is built with connect(), with connect_many() and, up to a
+limit, with the former linear check of the objects list in connect().
+Like timeit, the garbage collector is disabled while connecting.
+"""
+import gc
+import random
+import time
+from optparse import OptionParser
+from purity import canvas
+
+def make_edges(num_objects, edges_per_object):
+    """
+    Returns random edges between objects with 4 inlets and 4 outlets.
+    """
+    edges = set()
+    while len(edges) < num_objects * edges_per_object:
+        edges.add((random.randrange(num_objects), random.randrange(4), random.randrange(num_objects), random.randrange(4)))
+    return sorted(edges)
+
+def make_objects(num_objects):
+    patch = canvas.get_main_patch()
+    for i in range(num_objects):
+        patch.obj("expr", "$f1", "$f2", "$f3", "$f4")
+    return patch
+
+def build_connect(num_objects, edges):
+    patch = make_objects(num_objects)
+    objects = patch.objects
+    gc.collect()
+    gc.disable()
+    start = time.time()
+    for from_index, outlet, to_index, inlet in edges:
+        patch.connect(objects[from_index], outlet, objects[to_index], inlet)
+    return time.time() - start
+
+def build_connect_many(num_objects, edges):
+    patch = make_objects(num_objects)
+    gc.collect()
+    gc.disable()
+    start = time.time()
+    patch.connect_many(edges)
+    return time.time() - start
+
+def build_linear(num_objects, edges):
+    """
+    Former connect(): a scan of the objects list for both ends of each edge.
+    """
+    patch = make_objects(num_objects)
+    objects = patch.objects
+    gc.collect()
+    gc.disable()
+    start = time.time()
+    for from_index, outlet, to_index, inlet in edges:
+        from_object = objects[from_index]
+        to_object = objects[to_index]
+        if from_object not in patch.objects or to_object not in patch.objects:
+            raise canvas.PureError("not in subpatch")
+        patch.connections.append(canvas.Connection(from_object, outlet, to_object, inlet))
+    return time.time() - start
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-m", "--max-objects", type="int", default=100000, \
+        help="Number of objects of the biggest patch.")
+    parser.add_option("-e", "--edges-per-object", type="int", default=4, \
+        help="Number of connections per object.")
+    parser.add_option("-l", "--linear-limit", type="int", default=5000, \
+        help="Biggest patch built with the former linear check.")
+    (options, args) = parser.parse_args()
+    num_objects = 100
+    while num_objects <= options.max_objects:
+        edges = make_edges(num_objects, options.edges_per_object)
+        results = []
+        for name, function in [("connect", build_connect), ("connect_many", build_connect_many), ("linear", build_linear)]:
+            if name == "linear" and num_objects > options.linear_limit:
+                continue
+            try:
+                duration = function(num_objects, edges)
+            finally:
+                gc.enable()
+            results.append("%s %f s" % (name, duration))
+        print("%6d objects, %6d edges: %s" % (num_objects, len(edges), ", ".join(results)))
+        num_objects *= 10
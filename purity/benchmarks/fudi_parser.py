@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Compares the throughput of the FUDIParser with the former split-based
+parsing done in FUDIProtocol.lineReceived.
+
+The corpus is either a file containing FUDI messages as Pd sends them,
+or a generated one that looks like meter and analysis values.
+"""
+import random
+import time
+from optparse import OptionParser
+from purity import fudi
+
+def make_corpus(num_messages=100000):
+    """
+    Generates FUDI data like what Pd sends when streaming analysis values.
+    """
+    lines = []
+    for i in range(num_messages):
+        kind = i % 4
+        if kind == 0:
+            lines.append("meter %d %f;\n" % (i % 8, random.uniform(-100.0, 0.0)))
+        elif kind == 1:
+            lines.append("pitch %f %f;\n" % (random.uniform(20.0, 2000.0), random.random()))
+        elif kind == 2:
+            lines.append("bins %s;\n" % (" ".join(["%f" % (random.random()) for j in range(8)])))
+        else:
+            lines.append("state %d playing bang;\n" % (i))
+    return "".join(lines)
+
+def split_in_chunks(data, size=1460):
+    """
+    Splits data as a TCP transport would deliver it.
+    """
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def legacy_parse(chunks):
+    """
+    Former parsing: LineReceiver splitting + lineReceived.
+    """
+    count = 0
+    buf = ""
+    for chunk in chunks:
+        lines = (buf + chunk).split(";")
+        buf = lines.pop(-1)
+        for data in lines:
+            message = data.split(";")[0].strip()
+            atoms = message.split()
+            if len(atoms) > 0:
+                output = []
+                selector = atoms[0]
+                for atom in atoms[1:]:
+                    atom = atom.strip()
+                    if atom.isdigit():
+                        output.append(int(atom))
+                    else:
+                        try:
+                            val = float(atom)
+                            output.append(atom)
+                        except ValueError:
+                            output.append(str(atom))
+                count += 1
+    return count
+
+def new_parse(chunks):
+    """
+    Parsing using the FUDIParser.
+    """
+    count = 0
+    parser = fudi.FUDIParser()
+    for chunk in chunks:
+        count += len(parser.feed(chunk))
+    return count
+
+def run(chunks, function, repeat=3):
+    """
+    Returns the best time and the number of messages parsed.
+    """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        count = function(chunks)
+        duration = time.time() - start
+        if best is None or duration < best:
+            best = duration
+    return best, count
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-f", "--file", type="string", \
+        help="File containing recorded FUDI messages.")
+    parser.add_option("-n", "--num-messages", type="int", default=100000, \
+        help="Number of messages to generate if no file is given.")
+    (options, args) = parser.parse_args()
+    if options.file is not None:
+        corpus = open(options.file).read()
+    else:
+        corpus = make_corpus(options.num_messages)
+    chunks = split_in_chunks(corpus)
+    for name, function in [("legacy", legacy_parse), ("FUDIParser", new_parse)]:
+        duration, count = run(chunks, function)
+        print("%12s: %d messages in %f s: %d messages/s" % (name, count, duration, count / duration))
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Compares updating a patch in Pd by clearing and creating it again with
+sending the edit script of the changes.
+
+The patch is a chain of objects. Each edit changes the arguments of a
+few of them, adds an object and removes a connection.
+
+It also measures get_fudi() on a tree of subpatches, the first time,
+when nothing changed and when a single object changed.
+"""
+import random
+import time
+from optparse import OptionParser
+from purity import canvas
+from purity import codec
+
+def make_patch(num_objects):
+    patch = canvas.get_main_patch()
+    previous = patch.obj("inlet~")
+    for i in range(num_objects):
+        current = patch.obj("*~", i)
+        patch.connect(previous, 0, current, 0)
+        previous = current
+    return patch
+
+def edit(patch, num_changes):
+    for obj in random.sample(patch.objects, num_changes):
+        obj.args = [random.random()]
+    added = patch.obj("outlet~")
+    patch.connect(patch.objects[-2], 0, added, 0)
+    index = random.randrange(len(patch.connections))
+    patch.connections = patch.connections[:index] + patch.connections[index + 1:]
+
+def rebuild(patch):
+    """
+    Former way: clear the subpatch and create everything again.
+    """
+    mess_list = patch.get_fudi()
+    return [patch.clear()] + mess_list
+
+def update(patch):
+    return patch.get_edit_script()
+
+def run(function, num_objects, num_edits, num_changes):
+    """
+    :return: tuple of the duration in seconds and the number of messages and bytes.
+    """
+    random.seed(0)
+    patch = make_patch(num_objects)
+    patch.mark_materialized()
+    duration = 0.0
+    messages = 0
+    size = 0
+    for i in range(num_edits):
+        edit(patch, num_changes)
+        objects = list(patch.objects)
+        connections = list(patch.connections)
+        start = time.time()
+        mess_list = function(patch)
+        size += len(codec.encode_messages(mess_list))
+        duration += time.time() - start
+        messages += len(mess_list)
+        # clear() empties the model
+        patch.objects = objects
+        patch.connections = connections
+        for index, obj in enumerate(patch.objects):
+            obj.id = index
+        patch.mark_materialized()
+    return duration, messages, size
+
+def run_tree(num_objects, num_subpatches):
+    """
+    :return: tuple of the durations in seconds of get_fudi() the first
+    time, again and after changing an object.
+    """
+    patch = canvas.get_main_patch()
+    subpatches = [patch.subpatch("sub%d" % (i)) for i in range(num_subpatches)]
+    for subpatch in subpatches:
+        previous = subpatch.obj("inlet~")
+        for i in range(num_objects // num_subpatches):
+            current = subpatch.obj("*~", i)
+            subpatch.connect(previous, 0, current, 0)
+            previous = current
+    durations = []
+    for i in range(3):
+        if i == 2:
+            subpatches[0].objects[1].args = [0.5]
+        start = time.time()
+        patch.get_fudi()
+        durations.append(time.time() - start)
+    return tuple(durations)
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--num-objects", type="int", default=1000, \
+        help="Number of objects in the patch.")
+    parser.add_option("-e", "--num-edits", type="int", default=20, \
+        help="Number of times the patch is edited.")
+    parser.add_option("-c", "--num-changes", type="int", default=3, \
+        help="Number of objects whose arguments change in each edit.")
+    (options, args) = parser.parse_args()
+    for name, function in [("rebuild", rebuild), ("edit script", update)]:
+        duration, messages, size = run(function, options.num_objects, options.num_edits, options.num_changes)
+        print("%12s: %f s, %d messages, %d bytes" % (name, duration, messages, size))
+    first, unchanged, changed = run_tree(options.num_objects * 10, 10)
+    print("%12s: first %f s, unchanged %f s, one change %f s" % ("get_fudi", first, unchanged, changed))
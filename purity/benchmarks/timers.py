@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Compares scheduling many timers, such as note-offs, with the reactor's
+callLater and with a TimerWheel.
+
+Each run schedules the timers with random delays, cancels some of them
+and then advances a fake time until they have all been called.
+"""
+import random
+import time
+from optparse import OptionParser
+from twisted.internet import base
+from twisted.internet import task
+from purity import timerwheel
+
+class _FakeTimeReactor(base.ReactorBase):
+    """
+    Reactor whose time is set by the benchmark. It is never run.
+    """
+    def __init__(self):
+        self.now = 0.0
+        base.ReactorBase.__init__(self)
+    def seconds(self):
+        return self.now
+    def installWaker(self):
+        pass
+
+def run_call_later(delays, cancel_every, step):
+    """
+    Schedules with callLater and fires using runUntilCurrent().
+    :return: tuple of durations in seconds to schedule, cancel and fire.
+    """
+    reactor = _FakeTimeReactor()
+    called = []
+    start = time.time()
+    calls = [reactor.callLater(delay, called.append, None) for delay in delays]
+    scheduled = time.time()
+    for call in calls[::cancel_every]:
+        call.cancel()
+    cancelled = time.time()
+    end = max(delays) + step
+    while reactor.now < end:
+        reactor.now += step
+        reactor.runUntilCurrent()
+    return scheduled - start, cancelled - scheduled, time.time() - cancelled, len(called)
+
+def run_wheel(delays, cancel_every, step):
+    """
+    Schedules with a TimerWheel and fires using a fake clock.
+    :return: tuple of durations in seconds to schedule, cancel and fire.
+    """
+    clock = task.Clock()
+    wheel = timerwheel.TimerWheel()
+    wheel.clock = clock
+    called = []
+    start = time.time()
+    timers = [wheel.call_later(delay, called.append, None) for delay in delays]
+    scheduled = time.time()
+    for timer in timers[::cancel_every]:
+        timer.cancel()
+    cancelled = time.time()
+    end = max(delays) + step
+    while clock.seconds() < end:
+        clock.advance(step)
+    return scheduled - start, cancelled - scheduled, time.time() - cancelled, len(called)
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--num-timers", type="int", default=50000, \
+        help="Number of timers to schedule.")
+    parser.add_option("-d", "--max-delay", type="float", default=10.0, \
+        help="Maximum delay of the timers in seconds.")
+    parser.add_option("-c", "--cancel-every", type="int", default=2, \
+        help="Cancels one timer out of that many.")
+    parser.add_option("-s", "--step", type="float", default=0.005, \
+        help="Duration in seconds of a reactor iteration.")
+    (options, args) = parser.parse_args()
+    delays = [random.uniform(0.0, options.max_delay) for i in range(options.num_timers)]
+    for name, function in [("callLater", run_call_later), ("TimerWheel", run_wheel)]:
+        schedule, cancel, fire, count = function(delays, options.cancel_every, options.step)
+        print("%12s: schedule %f s, cancel %f s, fire %f s (%d called), total %f s" % (name, schedule, cancel, fire, count, schedule + cancel + fire))
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Blocking Purity client, using plain sockets and subprocess.
+
+Meant for scripts and batch jobs that launch Pd, create a patch, send a
+few messages and quit. It does not use Twisted. Every method returns
+once it is done, or raises a PurityTimeoutError.
+
+Usage::
+
+  from purity import blocking
+  from purity import canvas
+  client = blocking.create_simple_client(nogui=True)
+  main = canvas.get_main_patch()
+  ...
+  client.create_patch(main)
+  client.send_message("pd", "dsp", 1)
+  client.quit()
+"""
+import os
+import time
+import socket
+import subprocess
+
+from purity.codec import to_fudi
+from purity.codec import encode_messages
+from purity.codec import FUDIParser
+from purity.codec import Dispatcher
+from purity import server
+from purity import canvas
+
+VERBOSE = False
+
+if str is bytes: # Python 2
+    def _to_bytes(txt):
+        return txt
+    def _from_bytes(data):
+        return data
+else:
+    def _to_bytes(txt):
+        return txt.encode("utf-8")
+    def _from_bytes(data):
+        return data.decode("utf-8", "replace")
+
+class PurityTimeoutError(Exception):
+    """
+    Raised when Pure Data does not answer in time.
+    """
+    pass
+
+class PurityClient(object):
+    """
+    Dynamic patching Pure Data message sender, without an event loop.
+    @see purity.client.PurityClient
+    """
+    def __init__(self, receive_port=15555, send_port=17777, host="localhost", timeout=10.0):
+        """
+        :param timeout: float Maximum duration in seconds to wait for Pure Data.
+        """
+        self.receive_port = receive_port
+        self.send_port = send_port
+        self.host = host
+        self.timeout = timeout
+        self.dispatcher = Dispatcher()
+        self.pd_process = None # subprocess.Popen
+        self._listener = None # socket Pd's [netsend] connects to
+        self._receiver = None # socket connected to Pd's [netsend]
+        self._sender = None # socket connected to Pd's [netreceive]
+        self._parser = FUDIParser()
+        self._received = [] # messages read but not dispatched yet
+
+    def register_message(self, selector, callback):
+        """
+        Registers a listener for a message selector.
+        It is called by poll() and wait_for().
+        @see purity.fudi.FUDIServerFactory.register_message
+        """
+        if not callable(callback):
+            raise TypeError("Callback '%s' is not callable" % repr(callback))
+        self.dispatcher.subscribe(selector, callback)
+
+    def start_purity_receiver(self):
+        """
+        Listens for the connection from Pure Data.
+        You need to call this before launching the pd patch!
+        """
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((self.host, self.receive_port))
+        self._listener.listen(1)
+
+    def launch_pd(self, **pd_kwargs):
+        """
+        Starts Pure Data with the Purity patch. Does not wait for it.
+        :param pd_kwargs: Keyword arguments for purity.server.PureData.
+        """
+        pure_data = server.PureData(**pd_kwargs)
+        pure_data.write_patch()
+        command = pure_data.get_command()
+        if VERBOSE:
+            print("Running command %s" % (" ".join(command)))
+        devnull = open(os.devnull, "w")
+        try:
+            self.pd_process = subprocess.Popen(command, stdout=devnull, stderr=devnull)
+        finally:
+            devnull.close()
+
+    def wait_for_first_connected(self):
+        """
+        Waits until Pure Data connects to us and sends __first_connected__.
+        """
+        deadline = time.time() + self.timeout
+        self._listener.settimeout(self.timeout)
+        try:
+            self._receiver, address = self._listener.accept()
+        except socket.timeout:
+            raise PurityTimeoutError("Pure Data did not connect to port %d." % (self.receive_port))
+        self._wait_for("__first_connected__", deadline)
+
+    def start_purity_sender(self):
+        """
+        Connects to the [netreceive] of Pure Data.
+        Retries until it is listening or the timeout is reached.
+        """
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                self._sender = socket.create_connection((self.host, self.send_port), self.timeout)
+            except socket.error:
+                if time.time() >= deadline:
+                    raise PurityTimeoutError("Could not connect to Pure Data on port %d." % (self.send_port))
+                time.sleep(0.01)
+            else:
+                break
+        self._sender.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send_message(self, selector, *args):
+        """
+        Send a message to pure data
+        """
+        self._sender.sendall(_to_bytes(to_fudi(selector, *args)))
+
+    def send_messages(self, messages):
+        """
+        Sends many messages to pure data in a single write.
+        :param messages: iterable of lists of atoms. The first atom of each list is its selector.
+        """
+        txt = encode_messages(messages)
+        if txt:
+            self._sender.sendall(_to_bytes(txt))
+
+    def send_encoded(self, txt, count=1):
+        """
+        Sends text that is already encoded in FUDI.
+        """
+        self._sender.sendall(_to_bytes(txt))
+
+    def send_array(self, name, values, onset=0, precision=None, resize=False):
+        """
+        Writes values to a Pd array.
+        :param precision: int Number of significant digits. Defaults to purity.arrays.PRECISION.
+        @see purity.arrays.send_array
+        """
+        from purity import arrays # imports NumPy
+        if precision is None:
+            precision = arrays.PRECISION
+        return arrays.send_array(self, name, values, onset, precision, resize)
+
+    def create_patch(self, patch):
+        """
+        Sends the creation messages for a subpatch, all at once.
+        """
+        self.send_messages(patch.get_fudi())
+        patch.mark_materialized()
+
+    def update_patch(self, patch):
+        """
+        Sends only what changed in a subpatch since it was created or 
+        last updated.
+        @see purity.client.PurityClient.update_patch
+        """
+        messages = patch.get_edit_script()
+        if messages:
+            self.send_messages(messages)
+        return len(messages)
+
+    def open_patch(self, patch, directory=None):
+        """
+        Writes a subpatch to a .pd file that Pd opens in a new window, as
+        [pd NAME]. For big patches, it is much faster than create_patch(). 
+        It can then be changed with update_patch().
+        :return: str The file name.
+        @see purity.canvas.open_pd_file
+        """
+        message, file_name = canvas.open_pd_file(patch, directory)
+        self.send_message(*message)
+        return file_name
+
+    def poll(self, timeout=0.0):
+        """
+        Reads the messages from Pure Data and calls their listeners.
+        :param timeout: float Maximum duration in seconds to wait for data.
+        :return: int Number of messages dispatched.
+        """
+        self._read(timeout)
+        return self._dispatch_received()
+
+    def wait_for(self, selector, timeout=None):
+        """
+        Waits for a message from Pure Data, calling the listeners of the
+        other messages received meanwhile.
+        :return: list of atoms of that message.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        return self._wait_for(selector, time.time() + timeout)
+
+    def quit(self):
+        """
+        Closes the sockets and stops Pure Data if we launched it.
+        """
+        for sock in (self._sender, self._receiver, self._listener):
+            if sock is not None:
+                sock.close()
+        self._sender = None
+        self._receiver = None
+        self._listener = None
+        if self.pd_process is not None:
+            if self.pd_process.poll() is None:
+                self.pd_process.kill()
+            self.pd_process.wait()
+            self.pd_process = None
+
+    def _read(self, timeout):
+        """
+        Reads what is available from Pure Data and parses it.
+        """
+        self._receiver.settimeout(timeout)
+        try:
+            data = self._receiver.recv(65536)
+        except socket.timeout:
+            return
+        if not data:
+            raise socket.error("Pure Data closed the connection.")
+        self._received.extend(self._parser.feed(_from_bytes(data)))
+
+    def _dispatch_received(self):
+        messages = self._received
+        self._received = []
+        for message in messages:
+            self.dispatcher.dispatch(self, message[0], message[1:])
+        return len(messages)
+
+    def _wait_for(self, selector, deadline):
+        while True:
+            while self._received:
+                message = self._received.pop(0)
+                if message[0] == selector:
+                    return message[1:]
+                self.dispatcher.dispatch(self, message[0], message[1:])
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise PurityTimeoutError("Did not receive %s from Pure Data." % (selector))
+            self._read(remaining)
+
+def create_simple_client(timeout=10.0, **pd_kwargs):
+    """
+    Starts the Purity receiver, launches Pure Data, waits for it and
+    connects to it.
+    :param pd_kwargs: Keyword arguments for purity.server.PureData.
+    :return: PurityClient
+    """
+    client = PurityClient(timeout=timeout)
+    client.start_purity_receiver()
+    try:
+        client.launch_pd(**pd_kwargs)
+        client.wait_for_first_connected()
+        client.start_purity_sender()
+    except:
+        client.quit()
+        raise
+    return client
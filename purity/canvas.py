@@ -30,32 +30,44 @@ See the client module for an implementation of this using the FUDI
 protocol for Twisted.
 
 One could write a non-asynchronous version of this. (no network here)
+
+The FUDI lists of the elements are computed once and kept until the 
+element, or one of its children, changes. Setting an attribute such as 
+args or pos is detected, but changing a list in place is not: call 
+changed() on the Box or invalidate() on the SubPatch after that.
+
+A SubPatch indexes its objects and the connections from and to each of 
+them, so that connecting is not slower in big patches. The indexes are 
+updated when its objects or connections lists are set, but not when they
+are changed in place.
+
+Objects and connections are removed with delete(), replace() and 
+disconnect(). They return the messages that do the same in Pd right 
+away, for what was already sent to it, and renumber the objects like Pd.
+
+The objects whose position is not given are placed by the SubPatch
+along their connections when its FUDI lists are computed. 
+@see purity.layout
+
+Big patches load faster from a file than by sending each object: 
+save_pd_file() writes a subpatch to a .pd file that Pd can open.
 """
-import random 
+import atexit
+import os
+import shutil
+import tempfile
 from zope import interface
+from purity import layout
 
 VERBOSE = False
 VERY_VERBOSE = False
 
-_gen_pos_indexes = {}
-
-def _gen_position(parent, be_random=False):
+class PureError(Exception):
     """
-    Generates positions for an object within a parent patch.
-    Keeps track of the previous object Y position using 
-    the memory address of the parent object as a key in the dict.
+    Raised when an element cannot be added to a patch.
     """
-    global _gen_pos_indexes
-    parent_id = id(parent)
-    increment = 25 # distance between objects in the patches.
-    if parent_id not in _gen_pos_indexes.keys():
-        _gen_pos_indexes[parent_id] = 0 # start at 0
-    if be_random:
-        return [random.randrange(10, 300), random.randrange(10, 200)]
-    else:
-        _gen_pos_indexes[parent_id] += increment # and then increment
-        return [100, _gen_pos_indexes[parent_id]] # object pos
-    
+    pass
+
 class IElement(interface.Interface):
     """
     Any Pure Data Element. (e.g. box, connection, subpatch)
@@ -86,22 +98,25 @@ class IElement(interface.Interface):
         :param obj: An Element.
         """
 
+@interface.implementer(IElement)
 class Box(object):
     """
     Base implementation of a Pure Data box.
     Pd defines four kinds of boxes, implemented as subclasses:
     object, message, gui object (unimplemented), and comment (unimplemented).
     """
-    interface.implements(IElement)
 
     # The message to send to tell Pd to create an object of this type.
     # Should be specified by the subclass.
     FUDI_NAME = None
+    # Attributes that change the FUDI list.
+    _FUDI_ATTRIBUTES = frozenset(["name", "args", "pos", "parent"])
 
     def __init__(self, name, *args, **keywords):
         """
         Keywords: pos, x, y
         """
+        self._line = None # cached FUDI list, with the parent's target
         self.parent = None
         self.name = name
         self.args = list(args)
@@ -110,12 +125,38 @@ class Box(object):
             self.pos[0] = keywords["x"]
         if "y" in keywords:
             self.pos[1] = keywords["y"]
+        # placed by the parent unless given
+        self.auto_position = not ("pos" in keywords or "x" in keywords or "y" in keywords)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self._FUDI_ATTRIBUTES:
+            self.changed()
+        elif name == "id" and self.parent is not None:
+            self.parent.invalidate() # its connections
+
+    def changed(self):
+        """
+        Drops the cached FUDI list of this box and of its parents.
+        """
+        self._line = None
+        if self.parent is not None:
+            self.parent.invalidate()
+
+    def _get_line(self):
+        """
+        Returns the cached FUDI list to create this box in its parent.
+        """
+        if self._line is None:
+            self._line = ["pd-%s" % (self.parent.name)] + self.get_fudi()
+        return self._line
 
     def set_parent(self, obj):
         self.parent = obj
 
     def set_position(self, x, y):
         self.pos = [x, y]
+        self.auto_position = False
 
     def connect(self, other, outlet=0, inlet=0):
         """
@@ -166,13 +207,13 @@ class Receive(Obj):
         """
         if self.purity_client is not None:
             self.purity_client.send_message(self.receive_symbol, *args)
-        return [self.receive_symbol] + args
+        return [self.receive_symbol] + list(args)
 
+@interface.implementer(IElement)
 class Connection(object):
     """
     Connection between two Pure Data objects.
     """
-    interface.implements(IElement)
     def __init__(self, from_object, from_outlet, to_object, to_inlet):
         self.parent = None
         self.from_object = from_object
@@ -191,6 +232,7 @@ class Connection(object):
     def set_parent(self, obj):
         self.parent = obj
 
+@interface.implementer(IElement)
 class SubPatch(object):
     """
     Pure Data Subpatch. 
@@ -198,16 +240,84 @@ class SubPatch(object):
     The default name is "__main__" for the [pd __main__] subpatch.
     It can be found in purity/data/dynamic_patch.pd
     """
-    interface.implements(IElement)
+    # Attributes that change the FUDI lists.
+    _FUDI_ATTRIBUTES = frozenset(["name", "visible", "pos", "objects", "connections", "parent"])
+
     def __init__(self, name, visible=False):
+        self._fudi = None # cached FUDI lists
         self.parent = None
         self.name = name
         self.visible = visible
         self.objects = []
         self.connections = []
-        # self.pos = [0, 0]
-        self.pos = _gen_position(self)
+        self.pos = [0, 0]
+        self.auto_position = True # placed by the parent unless set
+        self._layout_dirty = True
+        self._materialized = None # what Pd has. See mark_materialized()
     
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self._FUDI_ATTRIBUTES:
+            if name == "name":
+                # the children use it as their target
+                for obj in getattr(self, "objects", []):
+                    if isinstance(obj, SubPatch):
+                        obj.invalidate()
+                    else:
+                        obj.changed()
+            self.invalidate()
+        elif name == "id" and self.parent is not None:
+            self.parent.invalidate()
+        if name == "objects":
+            self._members = set(value)
+            self._layout_dirty = True
+        elif name == "connections":
+            self._index_connections()
+            self._layout_dirty = True
+
+    def _index_connections(self):
+        """
+        Indexes the connections by their key and by the objects they connect.
+        """
+        self._connection_keys = set()
+        self._outgoing = {} # connections by their from_object
+        self._incoming = {} # connections by their to_object
+        for conn in self.connections:
+            self._index_connection(conn)
+
+    def _index_connection(self, conn):
+        self._connection_keys.add(_connection_key(conn))
+        self._outgoing.setdefault(conn.from_object, []).append(conn)
+        self._incoming.setdefault(conn.to_object, []).append(conn)
+
+    def has_object(self, obj):
+        """
+        Tells if an object is in this subpatch.
+        """
+        return obj in self._members
+
+    def get_connections_from(self, obj):
+        """
+        Returns the connections from the outlets of an object.
+        """
+        return list(self._outgoing.get(obj, []))
+
+    def get_connections_to(self, obj):
+        """
+        Returns the connections to the inlets of an object.
+        """
+        return list(self._incoming.get(obj, []))
+
+    def invalidate(self):
+        """
+        Drops the cached FUDI lists of this subpatch and of its parents.
+        """
+        if self._fudi is not None:
+            self._fudi = None
+            # the parents are not cached either if it was not
+            if self.parent is not None:
+                self.parent.invalidate()
+
     def set_parent(self, obj):
         self.parent = obj
     
@@ -215,41 +325,204 @@ class SubPatch(object):
         """
         Return FUDI lists for the whole subpatch.
         Objects and connections
+
+        They are only computed again if something changed. The lists in 
+        the returned list are shared with the cache and must not be modified.
         """
+        return list(self._get_cached_fudi())
+
+    def _get_cached_fudi(self):
+        if self._fudi is None:
+            if self.parent is not None:
+                self.parent.update_layout()
+            self.update_layout()
+            self._fudi = self._make_fudi()
+        return self._fudi
+
+    def update_layout(self):
+        """
+        Places the objects whose position was not set, if objects or 
+        connections changed since it was last done. 
+        
+        The objects that are in Pd already are not moved: the new ones are
+        placed below them.
+        @see purity.layout.layered_layout
+        """
+        if not self._layout_dirty:
+            return
+        self._layout_dirty = False
+        fixed = set()
+        top = layout.MARGIN
+        if self._materialized is not None:
+            for obj, description, pos in self._materialized["objects"]:
+                fixed.add(obj)
+                top = max(top, pos[1] + layout.ROW_HEIGHT)
+        movable = [obj for obj in self.objects if obj.auto_position and obj not in fixed]
+        if not movable:
+            return
+        indexes = dict([(obj, index) for index, obj in enumerate(movable)])
+        edges = []
+        for conn in self.connections:
+            if conn.from_object in indexes and conn.to_object in indexes:
+                edges.append((indexes[conn.from_object], indexes[conn.to_object]))
+        widths = [layout.estimate_width(_get_text(obj)) for obj in movable]
+        for obj, pos in zip(movable, layout.layered_layout(widths, edges, top)):
+            if obj.pos != pos:
+                obj.pos = pos
+
+    def _make_fudi(self):
         result = []
         if self.name != "__main__":
-            # TODO: random position... 
-            # pos = _gen_position(self)
             pos = self.pos
             l = ["pd-%s" % (self.parent.name), "obj", pos[0], pos[1], "pd", self.name]
             result.append(l)
         if VERY_VERBOSE:
-            print "objects"
+            print("objects")
         for obj in self.objects: 
-            # obj.pos = # _gen_position(self)
             if type(obj) is SubPatch: # subpatch
-                result.extend(obj.get_fudi())
+                result.extend(obj._get_cached_fudi())
             else: # standard obj
-                l = ["pd-%s" % (self.name)]
-                l.extend(obj.get_fudi())
+                l = obj._get_line()
                 result.append(l)
                 if VERY_VERBOSE:
-                    print l
+                    print(l)
         if VERY_VERBOSE:
-            print "connections"
+            print("connections")
+        target = "pd-%s" % (self.name)
         for conn in self.connections:
-            l = ["pd-%s" % (self.name)]
+            l = [target]
             l.extend(conn.get_fudi())
             result.append(l)
             if VERY_VERBOSE:
-                print l
+                print(l)
         if not self.visible:
             l = ["pd-%s" % (self.name), "vis", 0]
             result.append(l)
             if VERY_VERBOSE:
-                print l
+                print(l)
         if VERY_VERBOSE:
-            print "done creating FUDI list"
+            print("done creating FUDI list")
+        return result
+
+    def mark_materialized(self):
+        """
+        Remembers the objects and connections of this subpatch and of its 
+        children as being the ones in Pd. Called once they are sent.
+        @see get_edit_script
+        """
+        self.update_layout()
+        self._remember([_describe(obj) for obj in self.objects])
+        for obj in self.objects:
+            if isinstance(obj, SubPatch):
+                obj.mark_materialized()
+
+    def _remember(self, descriptions, connections=None):
+        """
+        Sets what Pd has, given the description of each object.
+        """
+        if connections is None:
+            connections = [_connection_key(conn) for conn in self.connections]
+        entries = [(obj, description, list(obj.pos)) for obj, description in zip(self.objects, descriptions)]
+        self._set_materialized(entries, connections)
+
+    def _set_materialized(self, entries, connections):
+        """
+        :param entries: list of (object, description, position) in the order of Pd.
+        :param connections: list of connection keys.
+        """
+        self._materialized = {
+            "objects": entries,
+            "connections": connections,
+            "connection_set": set(connections),
+            }
+
+    def _get_pd_indexes(self, entries):
+        """
+        Returns the index in Pd of each object that is there.
+        """
+        return dict([(entry[0], index) for index, entry in enumerate(entries)])
+
+    def get_edit_script(self):
+        """
+        Returns the FUDI lists that change what is in Pd into what is in 
+        this subpatch, and marks it as materialized.
+
+        Connections that are gone are disconnected. Objects that are gone
+        or whose name or arguments changed are deleted. Pd can only delete
+        selected objects, so the subpatch is shown in edit mode while they
+        are clicked and cut. New and changed objects are then created and
+        connected. Pd appends them, so the objects kept come first in
+        self.objects and their ids are updated to match Pd.
+
+        If nothing was materialized, it creates the whole content.
+        """
+        self.update_layout()
+        target = "pd-%s" % (self.name)
+        old_objects = []
+        old_connections = []
+        old_connection_set = set()
+        if self._materialized is not None:
+            old_objects = self._materialized["objects"]
+            old_connections = self._materialized["connections"]
+            old_connection_set = self._materialized["connection_set"]
+        descriptions = dict([(obj, _describe(obj)) for obj in self.objects])
+        kept = []
+        deleted_positions = []
+        old_index = {}
+        for index, (obj, description, pos) in enumerate(old_objects):
+            old_index[obj] = index
+            if descriptions.get(obj) == description:
+                kept.append(obj)
+            else:
+                deleted_positions.append(pos)
+        kept_set = set(kept)
+        result = []
+        connections = [_connection_key(conn) for conn in self.connections]
+        current_connections = set(connections)
+        for key in old_connections:
+            if key not in current_connections and key[0] in kept_set and key[2] in kept_set:
+                result.append([target, "disconnect", old_index[key[0]], key[1], old_index[key[2]], key[3]])
+        if deleted_positions:
+            result.extend(self._get_delete_script(deleted_positions))
+        for obj in kept:
+            if isinstance(obj, SubPatch):
+                result.extend(obj.get_edit_script())
+        added = [obj for obj in self.objects if obj not in kept_set]
+        self.objects = kept + added
+        for index, obj in enumerate(self.objects):
+            obj.id = index
+        for obj in added:
+            if isinstance(obj, SubPatch):
+                result.extend(obj.get_fudi())
+                obj.mark_materialized()
+            else:
+                result.append([target] + obj.get_fudi())
+        for conn, key in zip(self.connections, connections):
+            if key not in old_connection_set or key[0] not in kept_set or key[2] not in kept_set:
+                result.append([target] + conn.get_fudi())
+        self._remember([descriptions[obj] for obj in self.objects], connections)
+        return result
+
+    def _get_delete_script(self, positions):
+        """
+        Returns the FUDI lists that select the objects at some positions 
+        and cut them.
+        """
+        target = "pd-%s" % (self.name)
+        result = []
+        if not self.visible:
+            result.append([target, "vis", 1])
+        result.append([target, "editmode", 1])
+        for index, pos in enumerate(positions):
+            x = pos[0] + 1
+            y = pos[1] + 1
+            shift = min(index, 1) # adds to the selection
+            result.append([target, "mouse", x, y, 1, shift])
+            result.append([target, "mouseup", x, y, 1])
+        result.append([target, "cut"])
+        result.append([target, "editmode", 0])
+        if not self.visible:
+            result.append([target, "vis", 0])
         return result
 
     def subpatch(self, name, visible=False):
@@ -285,14 +558,16 @@ class SubPatch(object):
         Common to self.obj(), self.subpatch() and self.receive(). 
         """
         obj.id = len(self.objects)
-        pos = _gen_position(self) # this is where position is decided.
         obj.set_parent(self)
-        obj.set_position(*pos)
         self.objects.append(obj)
+        self._members.add(obj)
+        self._layout_dirty = True
+        self.invalidate()
         return obj
         
     def set_position(self, x, y):
         self.pos = [x, y]
+        self.auto_position = False
 
     def receive(self, receive_symbol):
         """
@@ -306,15 +581,165 @@ class SubPatch(object):
         """
         Connects two objects together.
         Returns None
+        Raises a PureError if one of them is not in this subpatch, or if 
+        they are already connected this way.
+        """
+        conn = self._check_connection(from_object, from_outlet, to_object, to_inlet)
+        self.connections.append(conn)
+        self._index_connection(conn)
+        self._layout_dirty = True
+        self.invalidate()
+        # conn.subpatch_name = self.name
+
+    def connect_many(self, edges):
+        """
+        Connects many objects together at once.
+        :param edges: iterable of (from_object, from_outlet, to_object, to_inlet)
+        where the objects are Box or SubPatch instances, or their index
+        in this subpatch. A NumPy array of shape (n, 4) of ints works too.
+        Raises a PureError if any of them cannot be made. None is made then.
+        """
+        objects = self.objects
+        members = self._members
+        existing = self._connection_keys
+        keys = []
+        key_set = set()
+        for from_object, from_outlet, to_object, to_inlet in edges:
+            if not isinstance(from_object, (Box, SubPatch)):
+                from_object = objects[int(from_object)]
+            if not isinstance(to_object, (Box, SubPatch)):
+                to_object = objects[int(to_object)]
+            if from_object not in members:
+                raise PureError("%s object not in subpatch %s" % (from_object, self))
+            elif to_object not in members:
+                raise PureError("%s object not in subpatch %s" % (to_object, self))
+            key = (from_object, int(from_outlet), to_object, int(to_inlet))
+            if key in existing or key in key_set:
+                raise PureError("%s is already connected to %s" % (from_object, to_object))
+            key_set.add(key)
+            keys.append(key)
+        outgoing = self._outgoing
+        incoming = self._incoming
+        for key in keys:
+            conn = Connection(*key)
+            conn.parent = self
+            self.connections.append(conn)
+            outgoing.setdefault(key[0], []).append(conn)
+            incoming.setdefault(key[2], []).append(conn)
+        existing.update(key_set)
+        self._layout_dirty = True
+        self.invalidate()
+
+    def disconnect(self, from_object, from_outlet, to_object, to_inlet):
+        """
+        Removes a connection.
+        Raises a PureError if there is no such connection.
+        :return: list of FUDI lists that remove it in Pd, if it is there.
+        """
+        key = (from_object, from_outlet, to_object, to_inlet)
+        if key not in self._connection_keys:
+            raise PureError("%s is not connected to %s" % (from_object, to_object))
+        self.connections = [conn for conn in self.connections if _connection_key(conn) != key]
+        result = []
+        if self._materialized is not None and key in self._materialized["connection_set"]:
+            entries = self._materialized["objects"]
+            indexes = self._get_pd_indexes(entries)
+            result.append(["pd-%s" % (self.name), "disconnect", indexes[from_object], from_outlet, indexes[to_object], to_inlet])
+            connections = [other for other in self._materialized["connections"] if other != key]
+            self._set_materialized(entries, connections)
+        return result
+
+    def delete(self, obj):
+        """
+        Deletes an object and its connections.
+        @see delete_many
+        """
+        return self.delete_many([obj])
+
+    def delete_many(self, objects):
+        """
+        Deletes objects and their connections. The objects after them are
+        renumbered, like Pd does.
+        Raises a PureError if one of them is not in this subpatch.
+        :return: list of FUDI lists that select and cut the ones in Pd.
+        """
+        doomed = set(objects)
+        for obj in doomed:
+            if obj not in self._members:
+                raise PureError("%s object not in subpatch %s" % (obj, self))
+        positions = []
+        if self._materialized is not None:
+            entries = []
+            for entry in self._materialized["objects"]:
+                if entry[0] in doomed:
+                    positions.append(entry[2])
+                else:
+                    entries.append(entry)
+            connections = [key for key in self._materialized["connections"] if key[0] not in doomed and key[2] not in doomed]
+            self._set_materialized(entries, connections)
+        self.connections = [conn for conn in self.connections if conn.from_object not in doomed and conn.to_object not in doomed]
+        self.objects = [obj for obj in self.objects if obj not in doomed]
+        for index, obj in enumerate(self.objects):
+            if obj.id != index:
+                obj.id = index
+        for obj in doomed:
+            obj.parent = None
+        if positions:
+            return self._get_delete_script(positions)
+        return []
+
+    def replace(self, old, new):
+        """
+        Replaces an object by a new one, such as Obj("osc~", 220), at the 
+        same position and with the same connections. Like in Pd, the new 
+        one comes after the others.
+        :return: list of FUDI lists that replace it in Pd, if it is there.
+        """
+        edges = []
+        for conn in self.get_connections_from(old) + self.get_connections_to(old):
+            edge = [conn.from_object, conn.from_outlet, conn.to_object, conn.to_inlet]
+            if edge[0] is old:
+                edge[0] = new
+            if edge[2] is old:
+                edge[2] = new
+            if tuple(edge) not in edges:
+                edges.append(tuple(edge))
+        self.update_layout()
+        pos = list(old.pos)
+        result = self.delete(old)
+        self._add_object(new)
+        new.set_position(*pos)
+        self.connect_many(edges)
+        if result:
+            target = "pd-%s" % (self.name)
+            entries = self._materialized["objects"] + [(new, _describe(new), pos)]
+            if isinstance(new, SubPatch):
+                result.extend(new.get_fudi())
+                new.mark_materialized()
+            else:
+                result.append([target] + new.get_fudi())
+            indexes = self._get_pd_indexes(entries)
+            connections = list(self._materialized["connections"])
+            for edge in edges:
+                if edge[0] in indexes and edge[2] in indexes:
+                    result.append([target, "connect", indexes[edge[0]], edge[1], indexes[edge[2]], edge[3]])
+                    connections.append(edge)
+            self._set_materialized(entries, connections)
+        return result
+
+    def _check_connection(self, from_object, from_outlet, to_object, to_inlet):
+        """
+        Returns a Connection, or raises a PureError if it cannot be made.
         """
-        if from_object not in self.objects:
+        if from_object not in self._members:
             raise PureError("%s object not in subpatch %s" % (from_object, self))
-        elif to_object not in self.objects:
+        elif to_object not in self._members:
             raise PureError("%s object not in subpatch %s" % (to_object, self))
-        else:
-            conn = Connection(from_object, from_outlet, to_object, to_inlet)
-            self.connections.append(conn)
-            # conn.subpatch_name = self.name
+        conn = Connection(from_object, from_outlet, to_object, to_inlet)
+        if _connection_key(conn) in self._connection_keys:
+            raise PureError("%s is already connected to %s" % (from_object, to_object))
+        conn.set_parent(self)
+        return conn
             
     def clear(self):
         """
@@ -323,8 +748,116 @@ class SubPatch(object):
         # TODO: send it directly
         self.connections = []
         self.objects = []
+        self._materialized = None
         return ["pd-%s" % (self.name), "clear"]
 
+def _describe(obj):
+    """
+    Returns what identifies an object in Pd, except its position.
+    """
+    if isinstance(obj, SubPatch):
+        return ("pd", obj.name)
+    return tuple([obj.FUDI_NAME, obj.name] + list(obj.args))
+
+def _get_text(obj):
+    """
+    Returns the text of a box, to estimate its width.
+    """
+    if isinstance(obj, SubPatch):
+        return "pd %s" % (obj.name)
+    return " ".join([str(atom) for atom in [obj.name] + list(obj.args)])
+
+def _connection_key(conn):
+    return (conn.from_object, conn.from_outlet, conn.to_object, conn.to_inlet)
+
+CANVAS_SIZE = "0 50 450 300" # position and size of the windows in .pd files
+
+def _to_pd_atom(atom):
+    """
+    Escapes an atom for a .pd file.
+    """
+    txt = str(atom)
+    for char in "$;,":
+        txt = txt.replace(char, "\\" + char)
+    return txt
+
+def _to_pd_line(atoms):
+    return "#X %s;" % (" ".join([_to_pd_atom(atom) for atom in atoms]))
+
+def get_pd_lines(patch):
+    """
+    Returns the lines of a .pd file that create the content of a subpatch:
+    its objects, its nested subpatches and its connections.
+    :param patch: SubPatch, or any patch whose get_fudi() returns lists
+    for a single subpatch, such as a purity.compact.CompactPatch.
+    """
+    if not isinstance(patch, SubPatch):
+        return [_to_pd_line(fudi[1:]) for fudi in patch.get_fudi() if fudi[1] != "vis"]
+    patch.update_layout()
+    lines = []
+    for obj in patch.objects:
+        if isinstance(obj, SubPatch):
+            lines.append("#N canvas %s %s %d;" % (CANVAS_SIZE, _to_pd_atom(obj.name), int(bool(obj.visible))))
+            lines.extend(get_pd_lines(obj))
+            lines.append(_to_pd_line(["restore", obj.pos[0], obj.pos[1], "pd", obj.name]))
+        else:
+            lines.append(_to_pd_line(obj.get_fudi()))
+    for conn in patch.connections:
+        lines.append(_to_pd_line(conn.get_fudi()))
+    return lines
+
+def get_pd_file(patch, font_size=10):
+    """
+    Returns the text of a .pd file whose main window contains the 
+    subpatch as [pd NAME], so that it receives the pd-NAME messages just
+    like if it was created dynamically.
+    """
+    lines = ["#N canvas %s %d;" % (CANVAS_SIZE, font_size)]
+    lines.append("#N canvas %s %s %d;" % (CANVAS_SIZE, _to_pd_atom(patch.name), int(bool(patch.visible))))
+    lines.extend(get_pd_lines(patch))
+    lines.append(_to_pd_line(["restore", layout.MARGIN, layout.MARGIN, "pd", patch.name]))
+    return "\n".join(lines) + "\n"
+
+def get_pd_file_name(patch, directory=None):
+    """
+    Returns where to save a subpatch: purity-NAME.pd in a directory, by 
+    default a new temporary one, removed when Python exits.
+    """
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="purity-%d-" % (os.getpid()))
+        atexit.register(shutil.rmtree, directory, True)
+    return os.path.join(directory, "purity-%s.pd" % (patch.name))
+
+def save_pd_file(patch, file_name=None):
+    """
+    Writes a subpatch to a .pd file.
+    @see get_pd_file
+    :param file_name: str Defaults to get_pd_file_name(patch).
+    :return: str Its file name.
+    """
+    if file_name is None:
+        file_name = get_pd_file_name(patch)
+    f = open(file_name, "w")
+    try:
+        f.write(get_pd_file(patch))
+    finally:
+        f.close()
+    return file_name
+
+def open_pd_file(patch, directory=None):
+    """
+    Saves a subpatch to a .pd file and returns the message that makes Pd
+    open it, and marks the subpatch as materialized. 
+    Raises a PureError for __main__, which is in the Purity patch already:
+    see purity.server.PureData for it.
+    :return: tuple of the FUDI list and the file name.
+    """
+    if patch.name == "__main__":
+        raise PureError("The Purity patch already has a [pd __main__].")
+    file_name = os.path.abspath(save_pd_file(patch, get_pd_file_name(patch, directory)))
+    patch.mark_materialized()
+    return ["pd", "open", os.path.basename(file_name), os.path.dirname(file_name)], file_name
+
 def get_main_patch():
     """
     Returns a sub patch corresponding to the [pd __main__] subpatch
@@ -30,6 +30,13 @@ from twisted.internet import defer
 from purity import fudi
 from purity import server
 from purity import process
+from purity import latency
+from purity import delivery
+from purity import recorder
+from purity import coalescer
+from purity import scheduler
+from purity import arrays
+from purity import canvas
 
 VERBOSE = False
 VERYVERBOSE = False
@@ -41,16 +48,30 @@ class PurityClient(object):
     Used for dynamic patching with Pd.
     """
     # TODO: connect directly to pd-gui port, which is 5400 + n
-    def __init__(self, receive_port=14444, send_port = 15555, use_tcp=True, quit_after_message=False, pd_pid=None):
+    def __init__(self, receive_port=14444, send_port = 15555, use_tcp=True, quit_after_message=False, pd_pid=None, coalesce=False, no_delay=None, mtu=1472):
+        """
+        :param use_tcp: bool Sends using TCP. If False, sends datagrams to [netreceive 17777 1].
+        :param coalesce: bool Writes the messages sent during a reactor iteration at once.
+        :param no_delay: bool or None Sets TCP_NODELAY on the sender socket.
+        :param mtu: int Maximum size of the datagrams when not using TCP.
+        """
         self.send_port = send_port
         self.receive_port = receive_port
         self.client_protocol = None
         self.fudi_server = None
-        self.use_tcp = use_tcp # TODO
+        self.use_tcp = use_tcp
         self.quit_after_message = quit_after_message
         self._server_startup_deferred = None
         self.pd_pid = pd_pid # maybe None
         self._pure_data_launcher = None # purity.server.PureData object.
+        self.coalesce = coalesce
+        self.no_delay = no_delay
+        self.mtu = mtu
+        self.latency_probe = None # purity.latency.LatencyProbe
+        self.confirmed_sender = None # purity.delivery.ConfirmedSender
+        self.recorder = None # purity.recorder.SessionRecorder
+        self.coalescer = None # purity.coalescer.Coalescer
+        self.future_sender = None # purity.scheduler.FutureSender
 
     def register_message(self, selector, callback):
         """
@@ -65,6 +86,15 @@ class PurityClient(object):
         if self.fudi_server is not None: # TODO: more checking
             self.fudi_server.register_message(selector, callback)
 
+    def unregister_message(self, selector, callback):
+        """
+        Unregisters a listener for a message selector.
+        Does nothing if the receiver is not started.
+        @see purity.fudi.FUDIServerFactory.unregister_message
+        """
+        if self.fudi_server is not None:
+            self.fudi_server.unregister_message(selector, callback)
+
     def start_purity_receiver(self):
         """ 
         You need to call this before launching the pd patch! 
@@ -72,6 +102,7 @@ class PurityClient(object):
         """
         self._server_startup_deferred = defer.Deferred()
         self.fudi_server = fudi.FUDIServerFactory()
+        self.fudi_server.set_tap(self.recorder)
         self.fudi_server.register_message("__pong__", self.on_pong)
         self.fudi_server.register_message("__ping__", self.on_ping)
         self.fudi_server.register_message("__confirm__", self.on_confirm)
@@ -92,11 +123,107 @@ class PurityClient(object):
         self.client_protocol = None
         if VERBOSE:
             print("Starting Purity/FUDI sender to port %d" % (self.send_port))
-        deferred = fudi.create_FUDI_client('localhost', self.send_port, self.use_tcp)
+        if self.use_tcp:
+            kwargs = {"coalesce": self.coalesce, "no_delay": self.no_delay}
+        else:
+            kwargs = {"mtu": self.mtu}
+        deferred = fudi.create_FUDI_client('localhost', self.send_port, self.use_tcp, **kwargs)
         deferred.addCallback(self.on_client_connected)
         deferred.addErrback(self.on_client_error)
         return deferred
 
+    def start_latency_probe(self, rate=10.0, window=1000):
+        """
+        Starts measuring the round-trip time to Pure Data using __ping__.
+        The receiver and the sender must be started.
+        :param rate: float Number of pings per second.
+        :param window: int Number of round-trip times kept.
+        :return: purity.latency.LatencyProbe
+        """
+        self.stop_latency_probe()
+        self.latency_probe = latency.LatencyProbe(self, rate=rate, window=window)
+        self.latency_probe.start()
+        return self.latency_probe
+
+    def stop_latency_probe(self):
+        """
+        Stops sending pings.
+        """
+        if self.latency_probe is not None:
+            self.latency_probe.stop()
+            self.latency_probe = None
+
+    def get_latency_stats(self):
+        """
+        Returns the round-trip time and jitter statistics, or None.
+        @see purity.latency.LatencyProbe.get_stats
+        """
+        if self.latency_probe is None:
+            return None
+        return self.latency_probe.get_stats()
+
+    def start_confirmed_delivery(self, window=16, adaptive=True, timeout=2.0, max_retries=3):
+        """
+        Enables the confirmation of messages by Pure Data.
+        The receiver and the sender must be started.
+        :param window: int Initial number of messages in flight.
+        :param timeout: float Duration in seconds to wait for a confirmation before sending again.
+        :param max_retries: int Number of times a message is sent again before failing.
+        :return: Deferred called once Pure Data confirmed it is enabled.
+        """
+        self.confirmed_sender = delivery.ConfirmedSender(self, window=window, adaptive=adaptive, timeout=timeout, max_retries=max_retries)
+        return self.confirmed_sender.start()
+
+    def stop_confirmed_delivery(self):
+        """
+        Disables the confirmation of messages.
+        """
+        if self.confirmed_sender is not None:
+            self.confirmed_sender.stop()
+            self.confirmed_sender = None
+
+    def send_confirmed(self, selector, *args):
+        """
+        Sends a message to pure data and waits for its confirmation.
+        You must call start_confirmed_delivery() first.
+        :return: Deferred called with the round-trip time.
+        """
+        return self.confirmed_sender.send(selector, *args)
+
+    def start_recording(self, file_name):
+        """
+        Records the FUDI traffic in both directions to a file.
+        @see purity.recorder
+        """
+        self.stop_recording()
+        self.recorder = recorder.SessionRecorder(file_name)
+        if self.fudi_server is not None:
+            self.fudi_server.set_tap(self.recorder)
+        if self.client_protocol is not None:
+            self.client_protocol.set_tap(self.recorder)
+        return self.recorder
+
+    def stop_recording(self):
+        """
+        Stops recording the FUDI traffic and closes the file.
+        """
+        if self.recorder is not None:
+            if self.fudi_server is not None:
+                self.fudi_server.set_tap(None)
+            if self.client_protocol is not None:
+                self.client_protocol.set_tap(None)
+            self.recorder.close()
+            self.recorder = None
+
+    def replay(self, file_name, speed=1.0):
+        """
+        Sends to Pure Data what was sent to it in a recording.
+        The sender must be started.
+        :param speed: float or None Speed factor. None means as fast as possible.
+        :return: Deferred called with the number of records sent.
+        """
+        return recorder.Replayer(file_name, self.client_protocol, speed=speed).start()
+
     def on_pong(self, protocol, *args):
         """ 
         Receives FUDI __pong__
@@ -117,6 +244,7 @@ class PurityClient(object):
         """ 
         Receives FUDI __confirm__ for the confirmation of every FUDI message sent
         to Pure Data. You need to send Pure Data a "__enable_confirm__ 1" message.
+        @see start_confirmed_delivery
         """
         if VERBOSE:
             print "received __confirm__", args
@@ -143,6 +271,8 @@ class PurityClient(object):
         Client can send messages to Pure Data 
         """
         self.client_protocol = protocol
+        if self.recorder is not None:
+            self.client_protocol.set_tap(self.recorder)
         # self.client_protocol.send_message("ping", 1, 2.0, "bang")
         # print "sent ping"
         return protocol # pass it to the next
@@ -191,10 +321,55 @@ class PurityClient(object):
         d = self.quit()
         return d
 
+    def set_continuous(self, selector, continuous=True, interval=0.02):
+        """
+        Declares a symbol continuous: only the latest message sent to it
+        during an interval is sent to Pure Data.
+        :param interval: float Duration in seconds between two flushes.
+        @see purity.coalescer.Coalescer
+        """
+        if self.coalescer is None:
+            self.coalescer = coalescer.Coalescer(self.send_messages, interval)
+        self.coalescer.interval = interval
+        self.coalescer.set_continuous(selector, continuous)
+
+    def get_coalescing_stats(self):
+        """
+        Returns the number of messages received, sent and saved by the
+        coalescing of continuous symbols, or None.
+        """
+        if self.coalescer is None:
+            return None
+        return dict(self.coalescer.stats)
+
+    def start_scheduler(self, voices=scheduler.VOICES, slots=scheduler.SLOTS):
+        """
+        Starts the logical time used by send_at().
+        The sender must be started.
+        @see purity.scheduler.FutureSender
+        """
+        self.future_sender = scheduler.FutureSender(self, voices=voices, slots=slots)
+        self.future_sender.start()
+        return self.future_sender
+
+    def send_at(self, logical_time, selector, *args):
+        """
+        Sends a message now, that Pure Data delivers to a [receive] at a 
+        logical time, in seconds since start_scheduler() was called.
+        """
+        if self.future_sender is None:
+            raise RuntimeError("The scheduler is not started. Call start_scheduler() first.")
+        self.future_sender.send_at(logical_time, selector, *args)
+
     def send_message(self, selector, *args):
         """ 
         Send a message to pure data 
+        Messages to continuous symbols are coalesced.
+        @see set_continuous
         """
+        if self.coalescer is not None and self.coalescer.is_continuous(selector):
+            self.coalescer.send_message(selector, *args)
+            return
         if self.client_protocol is not None:
             if VERYVERBOSE:
                 print("Purity sends %s %s" % (selector, str(args)))
@@ -206,13 +381,49 @@ class PurityClient(object):
             print "stopping the application"
             reactor.callLater(0, reactor.stop)
 
-    def create_patch(self, patch):
+    def send_messages(self, messages):
+        """
+        Sends many messages to pure data at once.
+        :param messages: iterable of lists of atoms. The first atom of each list is its selector.
+        """
+        if self.client_protocol is not None:
+            if VERYVERBOSE:
+                print("Purity sends %s" % (str(messages)))
+            self.client_protocol.send_messages(messages)
+        else:
+            print("Could not send %s" % (str(messages)))
+        if self.quit_after_message:
+            print "stopping the application"
+            reactor.callLater(0, reactor.stop)
+
+    def send_encoded(self, txt, count=1):
+        """
+        Sends text that is already encoded in FUDI, such as a block of
+        events encoded at once.
+        :param count: int How many messages there are in the text.
+        """
+        if self.client_protocol is not None:
+            self.client_protocol.send_encoded(txt, count)
+        else:
+            print("Could not send %s" % (txt.strip()))
+
+    def send_array(self, name, values, onset=0, precision=arrays.PRECISION, resize=False):
+        """
+        Writes values, such as a NumPy array, to a Pd array.
+        :return: dict with the throughput in samples per second.
+        @see purity.arrays.send_array
+        """
+        return arrays.send_array(self, name, values, onset, precision, resize)
+
+    def create_patch(self, patch, delay=0.01):
         """
         Sends the creation messages for a subpatch.
+
+        :param delay: Duration in seconds between each message. If 0, all
+        messages are sent at once.
+        :return: Deferred
         """
         def _cl_drip_messages(self, messages, deferred):
-            DELAY_BETWEEN_EACH = 0.01
-            # wait 10 ms between each message.
             try:
                 mess = messages.pop(0)
             except IndexError, e:
@@ -221,13 +432,41 @@ class PurityClient(object):
                 if VERBOSE:
                     print("%s" % (mess))
                 self.send_message(*mess)
-                reactor.callLater(DELAY_BETWEEN_EACH, _cl_drip_messages, 
+                reactor.callLater(delay, _cl_drip_messages, 
                     self, messages, deferred) 
         mess_list = patch.get_fudi() # list of (fudi) lists
+        patch.mark_materialized()
+        if not delay:
+            self.send_messages(mess_list)
+            return defer.succeed(True)
         deferred = defer.Deferred()
         _cl_drip_messages(self, mess_list, deferred)
         return deferred
 
+    def update_patch(self, patch):
+        """
+        Sends only what changed in a subpatch since it was created or 
+        last updated, instead of clearing and creating it again.
+        :return: int Number of messages sent.
+        @see purity.canvas.SubPatch.get_edit_script
+        """
+        mess_list = patch.get_edit_script()
+        if mess_list:
+            self.send_messages(mess_list)
+        return len(mess_list)
+
+    def open_patch(self, patch, directory=None):
+        """
+        Writes a subpatch to a .pd file that Pd opens in a new window, as
+        [pd NAME]. For big patches, it is much faster than create_patch(). 
+        It can then be changed with update_patch().
+        :return: str The file name.
+        @see purity.canvas.open_pd_file
+        """
+        message, file_name = canvas.open_pd_file(patch, directory)
+        self.send_message(*message)
+        return file_name
+
 
 def _create_managed_client(**server_kwargs):
     """
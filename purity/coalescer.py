@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Coalescing of continuous control streams.
+
+A continuous symbol is one for which only the latest value matters, such
+as the position of a slider. Only the latest message sent to each of
+them during an interval is transmitted, at the end of that interval.
+The messages to the other symbols, such as notes and triggers, are
+transmitted right away.
+"""
+try:
+    from collections import OrderedDict
+except ImportError: # Python 2.6
+    OrderedDict = dict
+from twisted.internet import reactor
+
+class Coalescer(object):
+    """
+    Keeps the latest message for each continuous symbol and sends them
+    all at once every interval.
+    """
+    def __init__(self, send_messages, interval=0.02):
+        """
+        :param send_messages: callable taking a list of messages, such as
+        purity.client.PurityClient.send_messages.
+        :param interval: float Duration in seconds between two flushes.
+        """
+        self.send_messages = send_messages
+        self.interval = interval
+        self.clock = reactor
+        self.continuous = set()
+        self.stats = {"received": 0, "sent": 0, "saved": 0, "flushes": 0}
+        self._latest = OrderedDict() # messages to send, by selector
+        self._flush_call = None
+
+    def set_continuous(self, selector, continuous=True):
+        """
+        Declares a symbol continuous, or discrete if continuous is False.
+        """
+        if continuous:
+            self.continuous.add(selector)
+        else:
+            self.continuous.discard(selector)
+            if selector in self._latest:
+                self.send_messages([self._latest.pop(selector)])
+
+    def is_continuous(self, selector):
+        return selector in self.continuous
+
+    def send_message(self, selector, *atoms):
+        """
+        Sends a message to a continuous symbol at the end of the interval,
+        unless another one replaces it before. Sends the other messages now.
+        """
+        self.stats["received"] += 1
+        if selector not in self.continuous:
+            self.stats["sent"] += 1
+            self.send_messages([[selector] + list(atoms)])
+            return
+        if selector in self._latest:
+            self.stats["saved"] += 1
+        self._latest[selector] = [selector] + list(atoms)
+        if self._flush_call is None:
+            self._flush_call = self.clock.callLater(self.interval, self.flush)
+
+    def flush(self):
+        """
+        Sends the latest message of each continuous symbol now.
+        """
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        if self._latest:
+            messages = list(self._latest.values())
+            self._latest.clear()
+            self.stats["sent"] += len(messages)
+            self.stats["flushes"] += 1
+            self.send_messages(messages)
+
+    def get_saved_ratio(self):
+        """
+        Returns the fraction of the messages that were not sent because a
+        newer one replaced them.
+        """
+        if self.stats["received"] == 0:
+            return 0.0
+        return float(self.stats["saved"]) / self.stats["received"]
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+FUDI encoding and decoding, without any network library.
+
+It is used by the Twisted implementation in the fudi module, as well as 
+by the asyncio and blocking clients.
+"""
+import re
+import fnmatch
+
+def to_fudi(selector, *atoms):
+    """
+    Converts int, float, string to FUDI atoms string.
+    :param data: list of basic types variables.
+    Public FUDI message converter
+    """
+    if atoms:
+        return "%s %s ;\r\n" % (selector, " ".join(map(str, atoms)))
+    return "%s ;\r\n" % (selector)
+
+def encode_messages(messages):
+    """
+    Converts many messages to a single FUDI string.
+    :param messages: iterable of lists of atoms. The first atom of each list is its selector.
+    """
+    return "".join([to_fudi(*message) for message in messages])
+
+def escape_atom(atom):
+    """
+    Escapes the characters of a symbol that FUDI would otherwise split or 
+    interpret, such as the spaces and semicolons of a file path.
+    """
+    txt = str(atom)
+    for char in "\\ ;,$":
+        txt = txt.replace(char, "\\" + char)
+    return txt
+
+# First characters of atoms that might be numbers.
+_NUMBER_CHARS = frozenset("0123456789+-.")
+_BLANKS = frozenset(" \t\r\n")
+
+def _decode_atom(atom):
+    """
+    Converts a FUDI atom to an int, a float or leaves it as a str.
+
+    Symbols are detected by their first character, so that we try 
+    to convert only what looks like a number.
+    """
+    if atom[0] in _NUMBER_CHARS:
+        if "." in atom or "e" in atom or "E" in atom:
+            try:
+                return float(atom)
+            except ValueError:
+                return atom
+        try:
+            return int(atom)
+        except ValueError:
+            return atom
+    return atom
+
+def _decode_message(text):
+    """
+    Splits an unescaped FUDI message in atoms.
+    The selector is always left as a str.
+    :return: list of atoms or None if the message is empty.
+    """
+    atoms = text.split()
+    if len(atoms) == 0:
+        return None
+    return [atoms[0]] + [_decode_atom(atom) for atom in atoms[1:]]
+
+def _parse_escaped(data):
+    """
+    Slow path of the FUDIParser, used when there is a backslash in the data.
+
+    Handles escaped semicolons, commas, spaces and dollar signs. An escaped 
+    atom is always a str, even if it looks like a number.
+    :return: tuple with a list of messages and the remaining unparsed data.
+    """
+    messages = [] # complete messages
+    pending = [] # messages separated by a comma, before the semicolon
+    atoms = []
+    chars = []
+    escaped = False
+    consumed = 0
+    i = 0
+    size = len(data)
+    while i < size:
+        c = data[i]
+        if c == "\\":
+            if i + 1 == size:
+                break # wait for the escaped character
+            chars.append(data[i + 1])
+            escaped = True
+            i += 2
+            continue
+        if c in _BLANKS or c == ";" or c == ",":
+            if chars:
+                atom = "".join(chars)
+                if atoms and not escaped:
+                    atom = _decode_atom(atom)
+                atoms.append(atom)
+                chars = []
+                escaped = False
+            if c == ";" or c == ",":
+                if atoms:
+                    pending.append(atoms)
+                    atoms = []
+                if c == ";":
+                    messages.extend(pending)
+                    pending = []
+                    consumed = i + 1
+        else:
+            chars.append(c)
+        i += 1
+    return messages, data[consumed:]
+
+class RawPayload(str):
+    """
+    Atoms of a message left unparsed, as text.
+    """
+    pass
+
+class FUDIParser(object):
+    """
+    Incremental FUDI parser.
+
+    Feed it the raw data as it comes from the transport. It keeps 
+    incomplete messages until their terminating semicolon arrives.
+    Messages separated by commas are split, as Pd does.
+    Numbers are converted to int and float.
+
+    The atoms of the messages whose selector is in raw_selectors are not
+    parsed: such a message is [selector, RawPayload]. That is much faster
+    for long lists of numbers, which can be converted at once.
+    """
+    def __init__(self):
+        self._chunks = [] # data received without any semicolon yet
+        self.raw_selectors = set()
+
+    def feed(self, data):
+        """
+        Parses some data.
+        :param data: str
+        :return: list of messages. Each message is a list of atoms, 
+        the first of which is the selector.
+        """
+        if ";" not in data:
+            if data:
+                self._chunks.append(data)
+            return []
+        if self._chunks:
+            self._chunks.append(data)
+            data = "".join(self._chunks)
+            self._chunks = []
+        if "\\" in data:
+            messages, rest = _parse_escaped(data)
+            if self.raw_selectors:
+                for index, message in enumerate(messages):
+                    if message[0] in self.raw_selectors:
+                        payload = " ".join([str(atom) for atom in message[1:]])
+                        messages[index] = [message[0], RawPayload(payload)]
+        else:
+            end = data.rfind(";")
+            rest = data[end + 1:]
+            messages = []
+            for text in data[:end].split(";"):
+                if "," in text:
+                    parts = text.split(",")
+                else:
+                    parts = (text, )
+                for part in parts:
+                    if self.raw_selectors:
+                        head = part.split(None, 1)
+                        if head and head[0] in self.raw_selectors:
+                            payload = ""
+                            if len(head) > 1:
+                                payload = head[1]
+                            messages.append([head[0], RawPayload(payload)])
+                            continue
+                    message = _decode_message(part)
+                    if message is not None:
+                        messages.append(message)
+        if rest:
+            self._chunks.append(rest)
+        return messages
+
+    def reset(self):
+        """
+        Drops any incomplete message.
+        """
+        self._chunks = []
+
+class Dispatcher(object):
+    """
+    Routes the FUDI messages received to their callbacks.
+
+    Many callbacks can subscribe to a selector. A selector containing glob 
+    wildcards, such as "voice*", is a route that matches many selectors. 
+    The default handler is called for messages that match nothing.
+
+    The callbacks for each selector are looked up once and kept in a flat 
+    table, which is cleared when the registrations change. Selectors that 
+    match nothing are not kept, and the table is cleared when it holds 
+    max_table_size selectors, so that many distinct selectors cannot make 
+    it grow without bound.
+    """
+    max_table_size = 4096
+
+    def __init__(self):
+        self.subscribers = {} # exact selector: list of callbacks
+        self.routes = [] # list of (pattern, compiled regex, callback)
+        self.default_handler = None
+        self.unmatched = 0 # number of messages that matched no subscriber
+        self._table = {} # selector: tuple of callbacks
+
+    def subscribe(self, selector, callback):
+        """
+        Adds a callback for a selector or a glob pattern.
+        """
+        if _is_pattern(selector):
+            regex = re.compile(fnmatch.translate(selector))
+            self.routes.append((selector, regex, callback))
+        else:
+            self.subscribers.setdefault(selector, []).append(callback)
+        self._table.clear()
+
+    def unsubscribe(self, selector, callback):
+        """
+        Removes a callback for a selector or a glob pattern.
+        Raises a KeyError if it was not subscribed.
+        """
+        if _is_pattern(selector):
+            for route in self.routes:
+                if route[0] == selector and route[2] == callback:
+                    self.routes.remove(route)
+                    break
+            else:
+                raise KeyError("No route %s to %s" % (selector, callback))
+        else:
+            try:
+                self.subscribers[selector].remove(callback)
+            except (KeyError, ValueError):
+                raise KeyError("No subscriber %s to %s" % (callback, selector))
+            if len(self.subscribers[selector]) == 0:
+                del self.subscribers[selector]
+        self._table.clear()
+
+    def set_default_handler(self, callback):
+        """
+        Sets the callback for messages with no subscriber. None to remove it.
+        """
+        self.default_handler = callback
+        self._table.clear()
+
+    def lookup(self, selector):
+        """
+        Returns a tuple of the callbacks for a selector.
+        """
+        try:
+            return self._table[selector]
+        except KeyError:
+            callbacks = list(self.subscribers.get(selector, []))
+            for pattern, regex, callback in self.routes:
+                if regex.match(selector) is not None:
+                    callbacks.append(callback)
+            callbacks = tuple(callbacks)
+            if callbacks:
+                if len(self._table) >= self.max_table_size:
+                    self._table.clear()
+                self._table[selector] = callbacks
+            return callbacks
+
+    def dispatch(self, protocol, selector, atoms):
+        """
+        Calls the callbacks for a message with the protocol and its atoms.
+        """
+        callbacks = self._table.get(selector)
+        if callbacks is None:
+            callbacks = self.lookup(selector)
+        if not callbacks:
+            self.unmatched += 1
+            if self.default_handler is None:
+                return
+            callbacks = (self.default_handler, )
+        for callback in callbacks:
+            try:
+                callback(protocol, *atoms)
+            except TypeError as e:
+                print("FUDI:dispatch(): %s %s" % (selector, e))
+
+def _is_pattern(selector):
+    """
+    Tells if a selector contains glob wildcards.
+    """
+    return "*" in selector or "?" in selector or "[" in selector
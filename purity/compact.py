@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Compact storage for very large generated patches.
+
+A CompactPatch keeps its objects and connections in columns of typed
+arrays instead of Box and Connection instances: positions, the indices
+of the connected objects and their outlets and inlets are machine
+integers, and the names and lists of arguments are interned in tables
+that the objects refer to by index. Its objects are represented by
+CompactBox handles, created when needed, that only know their patch and
+their index.
+
+A CompactPatch fills a subpatch that exists in Pd, such as [pd __main__].
+It is created whole: it has no edit script and no deletion. Duplicate
+connections are not detected. The objects whose position is not given
+are placed by purity.layout when the FUDI is computed, like those of a
+SubPatch.
+
+Does not use Twisted.
+
+Usage::
+
+  patch = compact.CompactPatch("__main__")
+  previous = patch.obj("inlet~")
+  for i in range(100000):
+      previous = previous.connect(patch.obj("*~", 0.99))
+  client.create_patch(patch)
+"""
+import array
+import sys
+from purity import canvas
+from purity import layout
+
+_KINDS = ["obj", "msg"]
+KIND_OBJ = 0
+KIND_MSG = 1
+
+class CompactBox(object):
+    """
+    Handle for an object of a CompactPatch.
+    """
+    __slots__ = ["patch", "id"]
+
+    def __init__(self, patch, index):
+        self.patch = patch
+        self.id = index
+
+    def __eq__(self, other):
+        return isinstance(other, CompactBox) and other.patch is self.patch and other.id == self.id
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self.patch), self.id))
+
+    def __repr__(self):
+        return "<CompactBox %d %s>" % (self.id, self.name)
+
+    @property
+    def name(self):
+        return self.patch._symbols[self.patch._names[self.id]]
+
+    @property
+    def args(self):
+        return list(self.patch._arg_lists[self.patch._args[self.id]])
+
+    @property
+    def pos(self):
+        self.patch.update_layout()
+        return [self.patch._x[self.id], self.patch._y[self.id]]
+
+    def set_position(self, x, y):
+        self.patch._x[self.id] = x
+        self.patch._y[self.id] = y
+        if self.patch._auto[self.id]:
+            self.patch._auto[self.id] = 0
+            self.patch._layout_dirty = True
+
+    def connect(self, other, outlet=0, inlet=0):
+        """
+        Chainable convenience method to connect this box to another box.
+        """
+        self.patch.connect(self, outlet, other, inlet)
+        return other
+
+    def get_fudi(self):
+        """
+        Returns a list of (python-typed) atoms to create this box.
+        """
+        return self.patch._get_box_fudi(self.id)
+
+class CompactPatch(object):
+    """
+    Objects and connections of a subpatch, in typed arrays.
+    """
+    def __init__(self, name, visible=False):
+        self.name = name
+        self.visible = visible
+        self._symbols = [] # interned names
+        self._symbol_indexes = {}
+        self._arg_lists = [] # interned tuples of arguments
+        self._arg_indexes = {}
+        self._kinds = array.array("B")
+        self._names = array.array("i")
+        self._args = array.array("i")
+        self._x = array.array("i")
+        self._y = array.array("i")
+        self._auto = array.array("B") # 1 for the objects placed by the layout
+        self._from = array.array("i")
+        self._outlets = array.array("H")
+        self._to = array.array("i")
+        self._inlets = array.array("H")
+        self._layout_dirty = False
+
+    def __len__(self):
+        """
+        Returns the number of objects.
+        """
+        return len(self._names)
+
+    def get_object(self, index):
+        """
+        Returns the handle of an object.
+        """
+        if not 0 <= index < len(self._names):
+            raise canvas.PureError("No object %d in subpatch %s" % (index, self.name))
+        return CompactBox(self, index)
+
+    def get_connection_count(self):
+        return len(self._from)
+
+    def _intern(self, value, table, indexes):
+        index = indexes.get(value)
+        if index is None:
+            index = len(table)
+            table.append(value)
+            indexes[value] = index
+        return index
+
+    def _add(self, kind, name, args, keywords):
+        index = len(self._names)
+        self._kinds.append(kind)
+        self._names.append(self._intern(name, self._symbols, self._symbol_indexes))
+        self._args.append(self._intern(tuple(args), self._arg_lists, self._arg_indexes))
+        x, y = keywords.get("pos", [0, 0])
+        self._x.append(int(keywords.get("x", x)))
+        self._y.append(int(keywords.get("y", y)))
+        if "pos" in keywords or "x" in keywords or "y" in keywords:
+            self._auto.append(0)
+        else:
+            self._auto.append(1)
+            self._layout_dirty = True
+        return CompactBox(self, index)
+
+    def obj(self, name, *args, **keywords):
+        """
+        Adds an object. Keywords: pos, x, y
+        :return: CompactBox
+        """
+        return self._add(KIND_OBJ, name, args, keywords)
+
+    def msg(self, *args, **keywords):
+        """
+        Adds a message box.
+        :return: CompactBox
+        """
+        return self._add(KIND_MSG, args[0], args[1:], keywords)
+
+    def _get_index(self, obj):
+        if isinstance(obj, CompactBox):
+            if obj.patch is not self:
+                raise canvas.PureError("%s object not in subpatch %s" % (obj, self.name))
+            return obj.id
+        index = int(obj)
+        if not 0 <= index < len(self._names):
+            raise canvas.PureError("No object %d in subpatch %s" % (index, self.name))
+        return index
+
+    def connect(self, from_object, from_outlet, to_object, to_inlet):
+        """
+        Connects two objects, given as handles or indices.
+        Raises a PureError if one of them is not in this patch.
+        """
+        from_index = self._get_index(from_object)
+        to_index = self._get_index(to_object)
+        self._from.append(from_index)
+        self._outlets.append(from_outlet)
+        self._to.append(to_index)
+        self._inlets.append(to_inlet)
+        self._layout_dirty = True
+
+    def connect_many(self, edges):
+        """
+        Connects many objects at once.
+        :param edges: iterable of (from_object, from_outlet, to_object, to_inlet),
+        or a NumPy array of shape (n, 4) of ints.
+        Raises a PureError if any of them cannot be made. None is made then.
+        """
+        columns = (array.array("i"), array.array("H"), array.array("i"), array.array("H"))
+        for from_object, from_outlet, to_object, to_inlet in edges:
+            columns[0].append(self._get_index(from_object))
+            columns[1].append(int(from_outlet))
+            columns[2].append(self._get_index(to_object))
+            columns[3].append(int(to_inlet))
+        self._from.extend(columns[0])
+        self._outlets.extend(columns[1])
+        self._to.extend(columns[2])
+        self._inlets.extend(columns[3])
+        self._layout_dirty = True
+
+    def update_layout(self):
+        """
+        Places the objects whose position was not set, if objects or 
+        connections changed since it was last done.
+        @see purity.canvas.SubPatch.update_layout
+        """
+        if not self._layout_dirty:
+            return
+        self._layout_dirty = False
+        auto = self._auto
+        movable = [index for index in range(len(auto)) if auto[index]]
+        if not movable:
+            return
+        indexes = dict([(index, rank) for rank, index in enumerate(movable)])
+        edges = []
+        for from_index, to_index in zip(self._from, self._to):
+            if auto[from_index] and auto[to_index]:
+                edges.append((indexes[from_index], indexes[to_index]))
+        symbols = self._symbols
+        arg_lists = self._arg_lists
+        widths = []
+        for index in movable:
+            text = " ".join([str(atom) for atom in [symbols[self._names[index]]] + list(arg_lists[self._args[index]])])
+            widths.append(layout.estimate_width(text))
+        for index, pos in zip(movable, layout.layered_layout(widths, edges)):
+            self._x[index] = pos[0]
+            self._y[index] = pos[1]
+
+    def _get_box_fudi(self, index):
+        self.update_layout()
+        return [_KINDS[self._kinds[index]], self._x[index], self._y[index], self._symbols[self._names[index]]] + list(self._arg_lists[self._args[index]])
+
+    def get_fudi(self):
+        """
+        Returns the FUDI lists that create the objects and connections.
+        @see purity.canvas.SubPatch.get_fudi
+        """
+        self.update_layout()
+        target = "pd-%s" % (self.name)
+        symbols = self._symbols
+        arg_lists = self._arg_lists
+        result = []
+        for kind, x, y, name, args in zip(self._kinds, self._x, self._y, self._names, self._args):
+            line = [target, _KINDS[kind], x, y, symbols[name]]
+            line.extend(arg_lists[args])
+            result.append(line)
+        for from_index, outlet, to_index, inlet in zip(self._from, self._outlets, self._to, self._inlets):
+            result.append([target, "connect", from_index, outlet, to_index, inlet])
+        if not self.visible:
+            result.append([target, "vis", 0])
+        return result
+
+    def mark_materialized(self):
+        """
+        Does nothing: compact patches are created whole.
+        """
+        pass
+
+    def get_memory_use(self):
+        """
+        Returns an estimate of the memory used by the arrays and tables, in bytes.
+        """
+        total = 0
+        for column in (self._kinds, self._names, self._args, self._x, self._y, self._auto, self._from, self._outlets, self._to, self._inlets):
+            total += column.buffer_info()[1] * column.itemsize
+        for table in (self._symbols, self._arg_lists):
+            total += sys.getsizeof(table)
+            for value in table:
+                total += sys.getsizeof(value)
+        for indexes in (self._symbol_indexes, self._arg_indexes):
+            total += sys.getsizeof(indexes)
+        return total
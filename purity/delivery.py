@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Confirmed delivery of messages to Pure Data.
+
+When it receives "__enable_confirm__ 1", the Purity patch sends back
+every message it receives, prepended with __confirm__. Those are used
+as acknowledgements: a limited number of messages are in flight, and
+the others wait until some are confirmed. The size of that window
+adapts to the round-trip time. When the oldest message is not confirmed
+in time, the messages in flight are sent again, so a message can be
+received more than once by Pd.
+"""
+from collections import deque
+from twisted.internet import reactor
+from twisted.internet import defer
+from twisted.python import failure
+from purity.codec import to_fudi
+from purity.codec import FUDIParser
+
+VERBOSE = False
+
+class DeliveryError(Exception):
+    """
+    Raised when messages waiting for their confirmation are cancelled, or
+    when one is never confirmed.
+    """
+    pass
+
+def _normalize(message):
+    """
+    Converts a message to the atoms Pd would see, by encoding and parsing it.
+    """
+    return FUDIParser().feed(to_fudi(*message))[0]
+
+def _same_atoms(expected, received):
+    """
+    Tells if a confirmation matches a message. Pd prints floats with
+    6 significant digits, so numbers are compared with a tolerance.
+    """
+    if len(expected) != len(received):
+        return False
+    for a, b in zip(expected, received):
+        if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+            if abs(a - b) > 1e-5 * max(abs(a), abs(b), 1.0):
+                return False
+        elif a != b:
+            return False
+    return True
+
+class ConfirmedSender(object):
+    """
+    Sends messages to Pure Data and waits for their __confirm__.
+
+    Messages are confirmed in the order they were sent. Confirmations of
+    messages sent by other means are recognized by their content and
+    ignored.
+
+    The window is the number of messages in flight. When adaptive, it
+    grows by one message per round trip while the round-trip time stays
+    close to the smallest one observed, and shrinks otherwise.
+
+    If the oldest message in flight is not confirmed before the timeout,
+    all the messages in flight are sent again, since Pd confirms them in
+    order. After max_retries such attempts, its Deferred fails with a
+    DeliveryError. The round-trip time of a message sent again is not used
+    to adapt the window.
+    """
+    def __init__(self, purity_client, window=16, min_window=1, max_window=1024, adaptive=True, rtt_tolerance=2.0, timeout=2.0, max_retries=3):
+        """
+        :param purity_client: purity.client.PurityClient instance.
+        :param window: int Initial number of messages in flight.
+        :param rtt_tolerance: float Ratio of the smallest round-trip time
+        over which the window shrinks.
+        :param timeout: float Duration in seconds to wait for a confirmation 
+        before sending again. None disables it.
+        :param max_retries: int Number of times a message is sent again.
+        """
+        self.purity_client = purity_client
+        self.window = float(window)
+        self.min_window = min_window
+        self.max_window = max_window
+        self.adaptive = adaptive
+        self.rtt_tolerance = rtt_tolerance
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.clock = reactor
+        self.base_rtt = None # smallest round-trip time observed
+        self.last_rtt = None
+        self.stats = {"sent": 0, "confirmed": 0, "ignored": 0, "resent": 0, "expired": 0}
+        self._in_flight = deque() # entries are [atoms, deferred, time sent, message, retries]
+        self._waiting = deque() # entries are (message, deferred)
+        self._timeout_call = None
+
+    def start(self):
+        """
+        Enables the confirmations in Pure Data.
+        :return: Deferred called once Pd confirmed it.
+        """
+        self.purity_client.register_message("__confirm__", self.on_confirm)
+        return self.send("__enable_confirm__", 1)
+
+    def stop(self):
+        """
+        Disables the confirmations and errbacks the messages still waiting.
+        """
+        self.purity_client.send_message("__enable_confirm__", 0)
+        self.purity_client.unregister_message("__confirm__", self.on_confirm)
+        self.cancel_all()
+
+    def cancel_all(self):
+        """
+        Errbacks the Deferreds of all unconfirmed messages.
+        """
+        entries = [entry[1] for entry in self._in_flight] + [entry[1] for entry in self._waiting]
+        self._in_flight.clear()
+        self._waiting.clear()
+        self._cancel_timeout()
+        for d in entries:
+            d.errback(failure.Failure(DeliveryError("Cancelled before its confirmation.")))
+
+    def send(self, selector, *atoms):
+        """
+        Sends a message, or keeps it until the window allows it.
+        :return: Deferred called with the round-trip time once Pd confirmed it.
+        """
+        d = defer.Deferred()
+        self._waiting.append(([selector] + list(atoms), d))
+        self._send_waiting()
+        return d
+
+    def send_batch(self, messages):
+        """
+        Sends many messages.
+        :param messages: iterable of lists of atoms. The first atom of each list is its selector.
+        :return: Deferred called once they all have been confirmed.
+        """
+        deferreds = []
+        for message in messages:
+            d = defer.Deferred()
+            self._waiting.append((list(message), d))
+            deferreds.append(d)
+        self._send_waiting()
+        return defer.gatherResults(deferreds)
+
+    def get_in_flight(self):
+        """
+        Returns the number of messages sent but not confirmed yet.
+        """
+        return len(self._in_flight)
+
+    def get_waiting(self):
+        """
+        Returns the number of messages waiting for room in the window.
+        """
+        return len(self._waiting)
+
+    def on_confirm(self, protocol, *atoms):
+        """
+        Receives FUDI __confirm__
+        """
+        if len(self._in_flight) == 0 or not _same_atoms(self._in_flight[0][0], atoms):
+            self.stats["ignored"] += 1
+            if VERBOSE:
+                print("Ignoring __confirm__ %s" % (str(atoms)))
+            return
+        expected, d, sent_time, message, retries = self._in_flight.popleft()
+        rtt = self.clock.seconds() - sent_time
+        self.stats["confirmed"] += 1
+        if retries == 0:
+            self._adapt(rtt)
+        self._cancel_timeout()
+        d.callback(rtt)
+        self._send_waiting()
+        self._schedule_timeout()
+
+    def _schedule_timeout(self):
+        """
+        Waits for the confirmation of the oldest message in flight.
+        """
+        if self.timeout is None or self._timeout_call is not None or len(self._in_flight) == 0:
+            return
+        delay = self._in_flight[0][2] + self.timeout - self.clock.seconds()
+        self._timeout_call = self.clock.callLater(max(0.0, delay), self._on_timeout)
+
+    def _cancel_timeout(self):
+        """
+        Stops waiting for a confirmation.
+        """
+        if self._timeout_call is not None and self._timeout_call.active():
+            self._timeout_call.cancel()
+        self._timeout_call = None
+
+    def _on_timeout(self):
+        """
+        Sends the messages in flight again, or fails the oldest one if it
+        has been sent too many times.
+        """
+        self._timeout_call = None
+        if len(self._in_flight) == 0:
+            return
+        if self._in_flight[0][4] >= self.max_retries:
+            d = self._in_flight.popleft()[1]
+            self.stats["expired"] += 1
+            d.errback(failure.Failure(DeliveryError("Not confirmed after %d retries." % (self.max_retries))))
+        now = self.clock.seconds()
+        messages = []
+        for entry in self._in_flight:
+            entry[2] = now
+            entry[4] += 1
+            messages.append(entry[3])
+        if messages:
+            if VERBOSE:
+                print("Sending %d unconfirmed messages again." % (len(messages)))
+            self.stats["resent"] += len(messages)
+            self.purity_client.send_messages(messages)
+        self._send_waiting()
+        self._schedule_timeout()
+
+    def _adapt(self, rtt):
+        """
+        Adapts the window to the round-trip time of a confirmed message.
+        """
+        self.last_rtt = rtt
+        if self.base_rtt is None or rtt < self.base_rtt:
+            self.base_rtt = rtt
+        if not self.adaptive:
+            return
+        # The round-trip time of a local connection can be close to 0.
+        limit = max(self.base_rtt, 0.0005) * self.rtt_tolerance
+        if rtt <= limit:
+            self.window = min(self.max_window, self.window + 1.0 / self.window)
+        else:
+            self.window = max(self.min_window, self.window - 1.0 / self.window)
+
+    def _send_waiting(self):
+        """
+        Sends as many waiting messages as the window allows, in a single write.
+        """
+        room = int(self.window) - len(self._in_flight)
+        if room <= 0 or len(self._waiting) == 0:
+            return
+        now = self.clock.seconds()
+        messages = []
+        while room > 0 and self._waiting:
+            message, d = self._waiting.popleft()
+            self._in_flight.append([_normalize(message), d, now, message, 0])
+            messages.append(message)
+            room -= 1
+        self.stats["sent"] += len(messages)
+        self.purity_client.send_messages(messages)
+        self._schedule_timeout()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Numbers sent by Pure Data, accumulated in NumPy buffers.
+
+The messages of a FeedbackReceiver are not parsed atom by atom: their
+text is converted to numbers at once and written to a ring buffer. Its
+callback is given the values in batches of a given size, or at a given
+interval.
+
+ArrayReader reads Pd arrays, using a helper added to a patch with
+add_array_reader().
+
+Needs NumPy.
+
+Usage::
+
+  def on_envelope(values):
+      print(values.mean())
+  receiver = feedback.FeedbackReceiver(client, "envelope", on_envelope, batch_size=256)
+  receiver.start()
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from twisted.internet import reactor
+from twisted.internet import defer
+from twisted.internet import task
+
+def _to_array(payload):
+    """
+    Converts the text of the atoms of a message to floats.
+    """
+    if not payload:
+        return numpy.zeros(0)
+    return numpy.fromstring(payload, sep=" ")
+
+class RingBuffer(object):
+    """
+    Fixed-size buffer of numbers. When it is full, the oldest values are
+    overwritten and counted as overruns.
+    """
+    def __init__(self, capacity, dtype=None):
+        """
+        :param capacity: int Number of values kept.
+        :param dtype: NumPy dtype. Defaults to 32-bit floats, like Pd.
+        """
+        if dtype is None:
+            dtype = numpy.float32
+        self.capacity = capacity
+        self.data = numpy.zeros(capacity, dtype=dtype)
+        self.overruns = 0 # values overwritten before being read
+        self._write = 0 # total number of values written
+        self._read = 0 # total number of values read
+
+    def __len__(self):
+        """
+        Returns the number of values not read yet.
+        """
+        return self._write - self._read
+
+    def write(self, values):
+        """
+        Appends values.
+        """
+        values = numpy.asarray(values)
+        count = len(values)
+        if count > self.capacity:
+            values = values[-self.capacity:]
+            self._write += count - self.capacity
+            count = self.capacity
+        start = self._write % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = values[:first]
+        self.data[:count - first] = values[first:]
+        self._write += count
+        if self._write - self._read > self.capacity:
+            self.overruns += self._write - self._read - self.capacity
+            self._read = self._write - self.capacity
+
+    def read(self, count=None):
+        """
+        Returns a copy of the oldest values not read yet, and marks them as read.
+        :param count: int Maximum number of values. Defaults to all.
+        """
+        available = len(self)
+        if count is None or count > available:
+            count = available
+        start = self._read % self.capacity
+        indices = (numpy.arange(count) + start) % self.capacity
+        self._read += count
+        return self.data[indices]
+
+    def get_latest(self, count):
+        """
+        Returns a copy of the last values written, read or not.
+        """
+        count = min(count, self.capacity, self._write)
+        indices = (numpy.arange(self._write - count, self._write)) % self.capacity
+        return self.data[indices]
+
+class FeedbackReceiver(object):
+    """
+    Accumulates the numbers of the messages with a selector in a RingBuffer
+    and gives them to a callback in batches.
+
+    With batch_size, the callback is given arrays of that many values.
+    With interval, it is given all the values received at that interval.
+    """
+    def __init__(self, purity_client, selector, callback, batch_size=None, interval=None, capacity=65536):
+        """
+        :param purity_client: purity.client.PurityClient whose receiver is started.
+        :param callback: callable given a NumPy array.
+        :param batch_size: int Number of values per batch.
+        :param interval: float Duration in seconds between two batches.
+        :param capacity: int Size of the ring buffer.
+        """
+        if batch_size is not None and batch_size > capacity:
+            raise ValueError("The batch size must not exceed the capacity.")
+        self.purity_client = purity_client
+        self.selector = selector
+        self.callback = callback
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffer = RingBuffer(capacity)
+        self.clock = reactor
+        self.stats = {"messages": 0, "values": 0, "batches": 0}
+        self._looping_call = None
+
+    def start(self):
+        """
+        Starts receiving.
+        """
+        self.purity_client.fudi_server.register_raw_message(self.selector, self.on_message)
+        if self.interval is not None:
+            self._looping_call = task.LoopingCall(self.flush)
+            self._looping_call.clock = self.clock
+            self._looping_call.start(self.interval, now=False)
+
+    def stop(self):
+        """
+        Stops receiving. The values not given to the callback are dropped.
+        """
+        self.purity_client.fudi_server.unregister_message(self.selector, self.on_message)
+        if self._looping_call is not None and self._looping_call.running:
+            self._looping_call.stop()
+        self._looping_call = None
+
+    def on_message(self, protocol, payload):
+        """
+        Receives the atoms of a message as text.
+        """
+        values = _to_array(payload)
+        self.stats["messages"] += 1
+        self.stats["values"] += len(values)
+        self.buffer.write(values)
+        if self.batch_size is not None:
+            while len(self.buffer) >= self.batch_size:
+                self._deliver(self.buffer.read(self.batch_size))
+
+    def flush(self):
+        """
+        Gives all the values not read yet to the callback.
+        """
+        if len(self.buffer) > 0:
+            self._deliver(self.buffer.read())
+
+    def _deliver(self, values):
+        self.stats["batches"] += 1
+        self.callback(values)
+
+def add_array_reader(patch, name):
+    """
+    Adds the objects that send the content of a Pd array to Python, to a
+    subpatch. They use [array get], which needs Pd 0.45 or later.
+
+    [r __get_NAME__] receives "onset count". The values are sent back
+    as a __array_NAME__ message.
+    :param patch: purity.canvas.SubPatch
+    """
+    receive = patch.receive("__get_%s__" % (name))
+    unpack = patch.obj("unpack", "f", "f")
+    trigger = patch.obj("t", "b", "f")
+    getter = patch.obj("array", "get", name)
+    prepend = patch.obj("list", "prepend", "__array_%s__" % (name))
+    send = patch.obj("s", "__purity__")
+    patch.connect(receive, 0, unpack, 0)
+    patch.connect(unpack, 1, getter, 2)
+    patch.connect(unpack, 0, trigger, 0)
+    patch.connect(trigger, 1, getter, 1)
+    patch.connect(trigger, 0, getter, 0)
+    patch.connect(getter, 0, prepend, 0)
+    patch.connect(prepend, 0, send, 0)
+
+class ArrayReader(object):
+    """
+    Reads a Pd array into a NumPy array, using the helper of add_array_reader().
+    """
+    def __init__(self, purity_client, name):
+        self.purity_client = purity_client
+        self.name = name
+        self._requests = [] # Deferreds waiting for an answer
+
+    def start(self):
+        self.purity_client.fudi_server.register_raw_message("__array_%s__" % (self.name), self.on_array)
+
+    def stop(self):
+        self.purity_client.fudi_server.unregister_message("__array_%s__" % (self.name), self.on_array)
+
+    def read(self, onset=0, count=-1):
+        """
+        Asks Pd for values of the array.
+        :param count: int Number of values. -1 means up to the end.
+        :return: Deferred called with a NumPy array.
+        """
+        d = defer.Deferred()
+        self._requests.append(d)
+        self.purity_client.send_message("__get_%s__" % (self.name), onset, count)
+        return d
+
+    def on_array(self, protocol, payload):
+        """
+        Receives FUDI __array_NAME__
+        """
+        if self._requests:
+            self._requests.pop(0).callback(_to_array(payload).astype(numpy.float32))
@@ -26,80 +26,266 @@ FUDI protocol implementation in Python using Twisted.
 Simple ASCII based protocol from Miller Puckette for Pure Data.
 """
 
-import types
+from collections import deque
 
+from zope import interface
 from twisted.internet import reactor
+from twisted.internet import defer
+from twisted.internet.interfaces import IPushProducer
 from twisted.internet.protocol import Protocol
 from twisted.internet.protocol import ClientCreator
 from twisted.internet.protocol import Factory
-from twisted.internet.protocol import ClientFactory
-from twisted.protocols import basic
-from twisted.python import log
+from twisted.internet.protocol import DatagramProtocol
+from purity.codec import to_fudi
+from purity.codec import encode_messages
+from purity.codec import FUDIParser
+from purity.codec import Dispatcher
+from purity.codec import RawPayload
 
 VERYVERBOSE = False
-VERBOSE = True # prints only fudi messages in ascii
+VERBOSE = False # prints only fudi messages in ascii
 
-def to_fudi(selector, *atoms):
+class QueueFullError(Exception):
     """
-    Converts int, float, string to FUDI atoms string.
-    :param data: list of basic types variables.
-    Public FUDI message converter
+    Raised when sending a message with the block policy while max_queue 
+    messages are already waiting for the transport.
     """
-    # if VERYVERBOSE:
-    #     print "FUDI: to_fudi", selector, atoms
-    txt = str(selector)
-    for atom in atoms:
-        txt = txt + " %s" % (atom)
-    txt = txt + " ;\r\n"
-    return txt
-
-class FUDIProtocol(basic.LineReceiver):
+    pass
+
+class FUDIProtocol(Protocol):
     """
     FUDI protocol implementation in Python.
     
     Simple ASCII based protocol from Miller Puckette for Pure Data.
+
+    Outgoing messages can be coalesced: the messages sent during a reactor 
+    iteration are then written at once when it is over, or as soon as 
+    max_bytes is reached.
+
+    It is a push producer for its transport. When the transport buffer is 
+    full, outgoing messages wait in a queue until it is drained. What 
+    happens to them when that queue is full depends on the policy set for 
+    their selector. With the default block policy, sending raises 
+    QueueFullError once max_queue messages wait: the caller should then 
+    wait for the Deferred returned by wait_for_drain().
     """
-    #def connectionMade(self):
-    #    print "connection made", self.transport# , self.factory
+    interface.implements(IPushProducer)
+
+    # Queue policies
+    POLICY_BLOCK = "block" # never dropped, refused with QueueFullError when the queue is full
+    POLICY_UNBOUNDED = "unbounded" # never dropped nor refused, the queue grows without limit
+    POLICY_DROP_OLDEST = "drop-oldest" # the oldest one is dropped when the queue is full
+    POLICY_KEEP_LATEST = "keep-latest" # replaces the queued message with the same selector
+
+    def __init__(self, coalesce=False, max_bytes=65536, max_delay=0.0, no_delay=None, max_queue=1024, default_policy=POLICY_BLOCK):
+        """
+        :param coalesce: bool Gathers outgoing messages and writes them at once.
+        :param max_bytes: int When coalescing, writes as soon as that many bytes are waiting.
+        :param max_delay: float When coalescing, maximum duration in seconds a message waits. 
+        0 means the end of the current reactor iteration.
+        :param no_delay: bool or None Sets TCP_NODELAY on the socket if not None.
+        :param max_queue: int Number of messages that can wait while the transport is full.
+        :param default_policy: str Queue policy for the selectors without one.
+        """
+        self.parser = FUDIParser()
+        self.dispatcher = None # given by the factory
+        self.clock = reactor
+        self.coalesce = coalesce
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.no_delay = no_delay
+        self.max_queue = max_queue
+        self.default_policy = default_policy
+        self.queue_policies = {}
+        self.paused = False
+        self.stats = {"messages": 0, "writes": 0, "bytes": 0, 
+            "queued": 0, "dropped": 0, "max_queue_depth": 0}
+        self._pending = []
+        self._pending_size = 0
+        self._flush_call = None
+        self._queue = deque() # entries are [selector, txt, alive]
+        self._queue_size = 0 # number of alive entries
+        self._droppable = deque() # entries that might be dropped, oldest first
+        self._latest = {} # keep-latest entries by selector
+        self._drain_waiters = []
+        self.tap = None # purity.recorder.SessionRecorder
+
+    def connectionMade(self):
+        if self.no_delay is not None:
+            self.set_no_delay(self.no_delay)
+        if hasattr(self.transport, "registerProducer"):
+            self.transport.registerProducer(self, True)
 
-    delimiter = ';'
+    def connectionLost(self, reason):
+        if isinstance(self.factory, FUDIServerFactory) and self in self.factory.protocols:
+            self.factory.protocols.remove(self)
+        if self._flush_call is not None and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+        self._pending = []
+        self._pending_size = 0
+        self._clear_queue()
 
-    def lineReceived(self, data):
+    def set_tap(self, tap):
+        """
+        Sets the wire tap, which is given all the data read and written.
+        Its received(data) and sent(data) methods are called.
+        :param tap: purity.recorder.SessionRecorder or None.
+        """
+        self.tap = tap
+
+    def set_no_delay(self, enabled=True):
+        """
+        Enables or disables TCP_NODELAY.
+        Does nothing if the transport is not a TCP socket.
+        """
+        self.no_delay = enabled
+        if self.transport is not None and hasattr(self.transport, "setTcpNoDelay"):
+            self.transport.setTcpNoDelay(enabled)
+
+    def set_flush_policy(self, coalesce=True, max_bytes=65536, max_delay=0.0):
+        """
+        Changes how outgoing messages are coalesced.
+        Writes the pending messages if coalescing is disabled.
+        """
+        self.coalesce = coalesce
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        if not coalesce:
+            self.flush()
+
+    def set_queue_policy(self, selector, policy):
+        """
+        Sets what to do with the messages with a given selector when they 
+        must wait for the transport.
+        :param policy: One of the POLICY_* constants.
+        """
+        if policy not in (self.POLICY_BLOCK, self.POLICY_UNBOUNDED, self.POLICY_DROP_OLDEST, self.POLICY_KEEP_LATEST):
+            raise ValueError("No such queue policy: %s" % (policy))
+        self.queue_policies[selector] = policy
+
+    def get_queue_depth(self):
+        """
+        Returns the number of messages waiting for the transport.
+        """
+        return self._queue_size
+
+    def wait_for_drain(self):
+        """
+        Returns a Deferred which is called once the queued messages have 
+        been given to the transport.
+        """
+        if not self.paused and self._queue_size == 0:
+            return defer.succeed(True)
+        d = defer.Deferred()
+        self._drain_waiters.append(d)
+        return d
+
+    def pauseProducing(self):
+        """
+        Called by the transport when its buffer is full.
+        """
+        self.paused = True
+
+    def resumeProducing(self):
+        """
+        Called by the transport when its buffer has been drained.
+        Writes the queued messages.
+        """
+        self.paused = False
+        if self._queue_size != 0:
+            txt = "".join([entry[1] for entry in self._queue if entry[2]])
+            count = self._queue_size
+            self._clear_queue()
+            self._write(txt, count)
+        if not self.paused:
+            waiters = self._drain_waiters
+            self._drain_waiters = []
+            for d in waiters:
+                d.callback(True)
+
+    def stopProducing(self):
+        """
+        Called by the transport when the connection is lost.
+        """
+        self._clear_queue()
+
+    def _clear_queue(self):
+        self._queue.clear()
+        self._droppable.clear()
+        self._latest.clear()
+        self._queue_size = 0
+
+    def _enqueue(self, selector, txt, policy=None):
+        """
+        Keeps a message until the transport is ready, according to the 
+        policy for its selector, unless one is given.
+        :raise QueueFullError: If the policy is block and the queue is full.
+        """
+        if policy is None:
+            policy = self.queue_policies.get(selector, self.default_policy)
+        if policy == self.POLICY_BLOCK and self._queue_size >= self.max_queue:
+            raise QueueFullError("%d messages are already waiting for the transport." % (self._queue_size))
+        self.stats["queued"] += 1
+        if policy == self.POLICY_KEEP_LATEST:
+            entry = self._latest.get(selector)
+            if entry is not None and entry[2]:
+                entry[1] = txt
+                self.stats["dropped"] += 1
+                return
+            entry = [selector, txt, True]
+            self._latest[selector] = entry
+        else:
+            entry = [selector, txt, True]
+            if policy == self.POLICY_DROP_OLDEST:
+                if self._queue_size >= self.max_queue and not self._drop_oldest():
+                    self.stats["dropped"] += 1
+                    return
+                self._droppable.append(entry)
+        self._queue.append(entry)
+        self._queue_size += 1
+        if self._queue_size > self.stats["max_queue_depth"]:
+            self.stats["max_queue_depth"] = self._queue_size
+
+    def _drop_oldest(self):
+        """
+        Drops the oldest queued message whose policy allows it.
+        :return: bool Whether one was dropped.
+        """
+        while self._droppable:
+            entry = self._droppable.popleft()
+            if entry[2]:
+                entry[2] = False
+                self._queue_size -= 1
+                self.stats["dropped"] += 1
+                return True
+        return False
+
+    def get_messages_per_write(self):
+        """
+        Returns the average number of messages sent per write to the transport.
+        """
+        if self.stats["writes"] == 0:
+            return 0.0
+        return float(self.stats["messages"]) / self.stats["writes"]
+
+    def dataReceived(self, data):
         if VERYVERBOSE:
             print "FUDI: data:", data
-        try:
-            message = data.split(";")[0].strip()
-        except KeyError:
-            log.msg("Got a line without trailing semi-colon.")
-        else:
-            if VERYVERBOSE:
-                print "FUDI: message:", message
-            atoms = message.split()
-            if len(atoms) > 0:
-                output = []
-                selector = atoms[0]
-                for atom in atoms[1:]:
-                    atom = atom.strip()
-                    if VERYVERBOSE:
-                        print "FUDI: > atom:", atom
-                    if atom.isdigit():
-                        output.append(int(atom))
-                    else:
-                        try:
-                            val = float(atom)
-                            output.append(atom)
-                        except ValueError:
-                            output.append(str(atom))
-                if self.factory.callbacks.has_key(selector):
-                    if VERYVERBOSE:
-                        print "FUDI: Calling :", selector, output
-                    try:
-                        self.factory.callbacks[selector](self, *output)
-                    except TypeError, e:
-                        print "FUDI:lineReceived():", e.message
-                else:
-                    #log.msg("Invalid selector %s." % (selector))
-                    print "FUDI: Invalid selector %s." % (selector)
+        if self.tap is not None:
+            self.tap.received(data)
+        for message in self.parser.feed(data):
+            self.message_received(message[0], message[1:])
+
+    def message_received(self, selector, atoms):
+        """
+        Called for every FUDI message received.
+        Calls the callbacks registered for its selector.
+        """
+        if VERYVERBOSE:
+            print "FUDI: message:", selector, atoms
+        if self.dispatcher is not None:
+            self.dispatcher.dispatch(self, selector, atoms)
 
     def send_message(self, selector, *atoms):
         """
@@ -111,7 +297,198 @@ class FUDIProtocol(basic.LineReceiver):
         txt = to_fudi(selector, *atoms)
         if VERBOSE:
             print("FUDI: %s" % (txt.strip()))
-        self.transport.write(txt)
+        if self.paused:
+            self._enqueue(selector, txt)
+        else:
+            self._write(txt, 1)
+
+    def send_messages(self, messages):
+        """
+        Converts many messages to FUDI and sends them in a single write.
+        :param messages: iterable of lists of atoms. The first atom of each list is its selector.
+        :raise QueueFullError: When the queue fills up. The messages before 
+        the refused one stay queued.
+        """
+        if self.paused:
+            for message in messages:
+                self._enqueue(message[0], to_fudi(*message))
+            return
+        lines = [to_fudi(*message) for message in messages]
+        if lines:
+            txt = "".join(lines)
+            if VERBOSE:
+                print("FUDI: %s" % (txt.strip()))
+            self._write(txt, len(lines))
+
+    def send_encoded(self, txt, count=1):
+        """
+        Sends text that is already encoded in FUDI.
+        :param count: int How many messages there are in the text.
+        """
+        if self.paused:
+            self._enqueue(None, txt, self.POLICY_BLOCK)
+        else:
+            self._write(txt, count)
+
+    def _write(self, txt, count):
+        """
+        Writes FUDI text to the transport, or keeps it for later if coalescing.
+        :param count: How many messages there are in the text.
+        """
+        self.stats["messages"] += count
+        if self.coalesce:
+            self._pending.append(txt)
+            self._pending_size += len(txt)
+            if self._pending_size >= self.max_bytes:
+                self.flush()
+            elif self._flush_call is None:
+                self._flush_call = self.clock.callLater(self.max_delay, self.flush)
+        else:
+            self.stats["writes"] += 1
+            self.stats["bytes"] += len(txt)
+            if self.tap is not None:
+                self.tap.sent(txt)
+            self.transport.write(txt)
+
+    def flush(self):
+        """
+        Writes the coalesced messages now.
+        """
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        if self._pending:
+            txt = "".join(self._pending)
+            self._pending = []
+            self._pending_size = 0
+            self.stats["writes"] += 1
+            self.stats["bytes"] += len(txt)
+            if self.tap is not None:
+                self.tap.sent(txt)
+            self.transport.write(txt)
+
+class FUDIDatagramProtocol(DatagramProtocol):
+    """
+    FUDI over UDP, for [netreceive -u] in Pure Data.
+
+    Outgoing messages sent during a reactor iteration are packed in as few 
+    datagrams as possible. A datagram contains only complete messages and 
+    is at most mtu bytes long, unless a single message is longer than that.
+    Each datagram received must contain only complete messages.
+    """
+    def __init__(self, mtu=1472, max_delay=0.0):
+        """
+        :param mtu: int Maximum size of the datagrams sent, in bytes.
+        :param max_delay: float Maximum duration in seconds a message waits to be packed.
+        """
+        self.mtu = mtu
+        self.max_delay = max_delay
+        self.dispatcher = None # set by listen_FUDI_udp
+        self.clock = reactor
+        self.stats = {"messages": 0, "writes": 0, "bytes": 0}
+        self._parser = FUDIParser()
+        self._pending = [] # lines for the next datagram
+        self._pending_size = 0
+        self._datagrams = [] # complete datagrams to write
+        self._flush_call = None
+        self.tap = None # purity.recorder.SessionRecorder
+
+    def set_tap(self, tap):
+        """
+        Sets the wire tap, which is given all the datagrams read and written.
+        @see FUDIProtocol.set_tap
+        """
+        self.tap = tap
+
+    def stopProtocol(self):
+        if self._flush_call is not None and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+
+    def datagramReceived(self, data, addr):
+        if self.tap is not None:
+            self.tap.received(data)
+        for message in self._parser.feed(data):
+            self.message_received(message[0], message[1:])
+        self._parser.reset()
+
+    def message_received(self, selector, atoms):
+        """
+        Called for every FUDI message received.
+        Calls the callbacks registered for its selector.
+        """
+        if VERYVERBOSE:
+            print "FUDI: message:", selector, atoms
+        if self.dispatcher is not None:
+            self.dispatcher.dispatch(self, selector, atoms)
+
+    def send_message(self, selector, *atoms):
+        """
+        Converts int, float, string to FUDI atoms and sends them.
+        """
+        txt = to_fudi(selector, *atoms)
+        if VERBOSE:
+            print("FUDI: %s" % (txt.strip()))
+        self._pack(txt)
+
+    def send_messages(self, messages):
+        """
+        Converts many messages to FUDI and sends them in as few datagrams as possible.
+        :param messages: iterable of lists of atoms. The first atom of each list is its selector.
+        """
+        for message in messages:
+            self._pack(to_fudi(*message))
+
+    def send_encoded(self, txt, count=1):
+        """
+        Sends text that is already encoded in FUDI, one message per line.
+        """
+        for line in txt.splitlines(True):
+            self._pack(line)
+
+    def _pack(self, txt):
+        """
+        Adds a FUDI line to the datagram being filled.
+        """
+        self.stats["messages"] += 1
+        if self._pending_size + len(txt) > self.mtu and self._pending:
+            self._datagrams.append("".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+        self._pending.append(txt)
+        self._pending_size += len(txt)
+        if self._flush_call is None:
+            self._flush_call = self.clock.callLater(self.max_delay, self.flush)
+
+    def flush(self):
+        """
+        Writes all the datagrams now.
+        """
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        if self._pending:
+            self._datagrams.append("".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+        datagrams = self._datagrams
+        self._datagrams = []
+        for datagram in datagrams:
+            self.stats["writes"] += 1
+            self.stats["bytes"] += len(datagram)
+            if self.tap is not None:
+                self.tap.sent(datagram)
+            self.transport.write(datagram)
+
+    def get_messages_per_write(self):
+        """
+        Returns the average number of messages sent per datagram.
+        """
+        if self.stats["writes"] == 0:
+            return 0.0
+        return float(self.stats["messages"]) / self.stats["writes"]
 
 class FUDIServerFactory(Factory):
     """
@@ -121,31 +498,105 @@ class FUDIServerFactory(Factory):
     """
     protocol = FUDIProtocol
     def __init__(self):
-        self.callbacks = {}
+        self.dispatcher = Dispatcher()
+        self.tap = None # purity.recorder.SessionRecorder
+        self.protocols = [] # connected protocols
+        self.raw_selectors = set() # shared with the parsers of the protocols
+        self._raw_callbacks = {} # raw listeners by selector
+
+    def buildProtocol(self, addr):
+        p = Factory.buildProtocol(self, addr)
+        p.dispatcher = self.dispatcher
+        p.tap = self.tap
+        p.parser.raw_selectors = self.raw_selectors
+        self.protocols.append(p)
+        return p
+
+    def set_tap(self, tap):
+        """
+        Sets the wire tap of the connected protocols and of the next ones.
+        @see FUDIProtocol.set_tap
+        """
+        self.tap = tap
+        for p in self.protocols:
+            p.set_tap(tap)
 
     def register_message(self, selector, callback):
         """
         Registers a listener for a message selector.
         The selector is how we call the first atom of a message.
         An atom is a word. Atoms are separated by the space character.
+
+        Many listeners can be registered for the same selector. The selector 
+        can also be a glob pattern such as "voice*".
         """
-        if type(callback) not in (types.FunctionType, types.MethodType):
+        if not callable(callback):
             raise TypeError("Callback '%s' is not callable" % repr(callback))
-        self.callbacks[selector] = callback
+        self.dispatcher.subscribe(selector, callback)
+
+    def register_raw_message(self, selector, callback):
+        """
+        Registers a listener for a message selector, that is given the
+        atoms as a purity.codec.RawPayload instead of parsing them.
+        Glob patterns are not allowed.
+        """
+        self.register_message(selector, callback)
+        self._raw_callbacks.setdefault(selector, []).append(callback)
+        self.raw_selectors.add(selector)
+
+    def unregister_message(self, selector, callback):
+        """
+        Removes a listener for a message selector.
+        The atoms of the selector are parsed again once its last raw 
+        listener is removed.
+        """
+        self.dispatcher.unsubscribe(selector, callback)
+        callbacks = self._raw_callbacks.get(selector)
+        if callbacks is not None and callback in callbacks:
+            callbacks.remove(callback)
+            if len(callbacks) == 0:
+                del self._raw_callbacks[selector]
+                self.raw_selectors.discard(selector)
 
-def create_FUDI_client(host, port, tcp=True):
+    def set_default_handler(self, callback):
+        """
+        Sets the listener for the messages with no other listener.
+        """
+        self.dispatcher.set_default_handler(callback)
+
+def create_FUDI_client(host, port, tcp=True, **kwargs):
     """
     Creates a FUDI sender.
 
     When connected, will call its callbacks with the sender instance.
+    The keyword arguments are given to the FUDIProtocol constructor, or to 
+    the FUDIDatagramProtocol constructor if tcp is False.
     :return: deferred instance
     """
+    def _cb_resolved(address):
+        protocol = FUDIDatagramProtocol(**kwargs)
+        reactor.listenUDP(0, protocol)
+        protocol.transport.connect(address, port)
+        return protocol
+
     if tcp:
-        deferred = ClientCreator(reactor, FUDIProtocol).connectTCP(host, port)
+        deferred = ClientCreator(reactor, FUDIProtocol, **kwargs).connectTCP(host, port)
     else:
-        deferred = ClientCreator(reactor, FUDIProtocol).connectUDP(host, port)
+        deferred = reactor.resolve(host)
+        deferred.addCallback(_cb_resolved)
     return deferred
 
+def listen_FUDI_udp(port, factory, interface=""):
+    """
+    Receives FUDI datagrams and routes them using the dispatcher of a 
+    FUDIServerFactory.
+    :return: twisted.internet.interfaces.IListeningPort
+    """
+    protocol = FUDIDatagramProtocol()
+    protocol.dispatcher = factory.dispatcher
+    protocol._parser.raw_selectors = factory.raw_selectors
+    return reactor.listenUDP(port, protocol, interface=interface)
+
 if __name__ == "__main__":
     VERYVERBOSE = True
 
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Round-trip latency measurement between Python and Pure Data.
+
+The Purity patch answers every __ping__ with a __pong__ carrying the
+sequence number of the ping. A ping whose pong never came, such as a lost
+UDP datagram, is counted as lost as soon as a later pong is received.
+Pd prints floats with 6 significant digits, so the sequence numbers wrap
+around at SEQUENCE_WRAP.
+"""
+from collections import deque
+from twisted.internet import reactor
+from twisted.internet import task
+
+VERBOSE = False
+SEQUENCE_WRAP = 1000000 # sequence numbers that Pd sends back exactly
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of some values.
+    :param values: sorted list of numbers.
+    :param fraction: float between 0 and 1.
+    """
+    if len(values) == 0:
+        return None
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+def summarize(values):
+    """
+    Returns a dict with the count, p50, p99 and max of some values.
+    """
+    ordered = sorted(values)
+    result = {"count": len(ordered), "p50": None, "p99": None, "max": None}
+    if ordered:
+        result["p50"] = percentile(ordered, 0.5)
+        result["p99"] = percentile(ordered, 0.99)
+        result["max"] = ordered[-1]
+    return result
+
+class LatencyProbe(object):
+    """
+    Sends pings to Pure Data at a constant rate and keeps the last round-trip
+    times and their jitter, in seconds.
+
+    The jitter is the difference between two consecutive round-trip times.
+    """
+    def __init__(self, purity_client, rate=10.0, window=1000):
+        """
+        :param purity_client: purity.client.PurityClient instance.
+        :param rate: float Number of pings per second.
+        :param window: int Number of round-trip times kept.
+        """
+        self.purity_client = purity_client
+        self.rate = rate
+        self.clock = reactor
+        self.rtts = deque(maxlen=window)
+        self.jitters = deque(maxlen=window)
+        self.sent = 0
+        self.received = 0
+        self.lost = 0
+        self._ping_times = deque() # pings waiting for their pong, as (count, time sent)
+        self._last_rtt = None
+        self._looping_call = None
+
+    def start(self):
+        """
+        Starts sending pings.
+        """
+        self.purity_client.register_message("__pong__", self.on_pong)
+        self._looping_call = task.LoopingCall(self.ping)
+        self._looping_call.clock = self.clock
+        self._looping_call.start(1.0 / self.rate)
+
+    def stop(self):
+        """
+        Stops sending pings.
+        """
+        if self._looping_call is not None and self._looping_call.running:
+            self._looping_call.stop()
+        self._looping_call = None
+        self.purity_client.unregister_message("__pong__", self.on_pong)
+
+    def ping(self):
+        """
+        Sends a ping now.
+        """
+        self._ping_times.append((self.sent, self.clock.seconds()))
+        self.purity_client.send_message("__ping__", self.sent % SEQUENCE_WRAP)
+        self.sent += 1
+
+    def on_pong(self, protocol, *args):
+        """
+        Receives FUDI __pong__
+        """
+        count = None
+        if len(args) > 0 and self._ping_times:
+            # the count of the oldest ping waiting is the smallest one possible
+            oldest = self._ping_times[0][0]
+            count = oldest + (int(args[0]) - oldest) % SEQUENCE_WRAP
+            while count < self.sent and self._ping_times and self._ping_times[0][0] < count:
+                self._ping_times.popleft()
+                self.lost += 1
+        if len(self._ping_times) == 0 or (count is not None and self._ping_times[0][0] != count):
+            if VERBOSE:
+                print("Received a __pong__ for no __ping__.")
+            return
+        sent_time = self._ping_times.popleft()[1]
+        rtt = self.clock.seconds() - sent_time
+        self.received += 1
+        self.rtts.append(rtt)
+        if self._last_rtt is not None:
+            self.jitters.append(abs(rtt - self._last_rtt))
+        self._last_rtt = rtt
+
+    def get_stats(self):
+        """
+        Returns a dict with the number of pings sent, received and lost, and
+        the count, p50, p99 and max of the round-trip times and of the jitter.
+        """
+        return {
+            "sent": self.sent,
+            "received": self.received,
+            "lost": self.lost,
+            "rtt": summarize(self.rtts),
+            "jitter": summarize(self.jitters),
+            }
+
+    def dump(self, file_name):
+        """
+        Writes the statistics and the round-trip times kept to a text file.
+        Times are in milliseconds.
+        """
+        stats = self.get_stats()
+        f = open(file_name, "w")
+        try:
+            f.write("# sent %d received %d\n" % (stats["sent"], stats["received"]))
+            for name in ["rtt", "jitter"]:
+                values = stats[name]
+                f.write("# %s count %d" % (name, values["count"]))
+                for key in ["p50", "p99", "max"]:
+                    if values[key] is not None:
+                        f.write(" %s %f" % (key, values[key] * 1000.0))
+                f.write("\n")
+            for rtt in self.rtts:
+                f.write("%f\n" % (rtt * 1000.0))
+        finally:
+            f.close()
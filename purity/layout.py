@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Layered layout of the objects of a patch.
+
+The objects are placed in rows following their connections, so that
+signals and messages flow downwards: each object is one row below the
+lowest object connected to its inlets (longest-path layering). In a
+row, objects are sorted by the average horizontal position of the
+objects connected to their inlets, so that connections cross less. Rows
+wider than MAX_WIDTH wrap. When the rows are higher than MAX_HEIGHT, or 
+than needed for the patch to be about as wide as high, they continue in 
+a new band on the right. Connections that close a loop are ignored.
+
+It takes a time linear in the number of objects and connections, apart
+from sorting the rows.
+
+Does not use Twisted.
+"""
+import math
+from collections import deque
+
+MARGIN = 10 # pixels from the top left corner
+ROW_HEIGHT = 40
+GAP = 20 # pixels between two objects in a row
+MAX_WIDTH = 1200 # of a row
+MAX_HEIGHT = 1200 # of a band, for patches that are not big
+CHAR_WIDTH = 7 # pixels per character of the text of a box, at font size 10
+BOX_PADDING = 8
+
+def estimate_width(text):
+    """
+    Returns about how wide Pd draws a box with some text.
+    """
+    return BOX_PADDING + CHAR_WIDTH * max(len(text), 3)
+
+def get_layers(count, edges):
+    """
+    Returns the row of each object: one more than the row of the objects 
+    connected to its inlets.
+    :param count: int Number of objects.
+    :param edges: iterable of (from_index, to_index).
+    :return: tuple of the list of rows, and the list of the predecessors of each object.
+    """
+    successors = [[] for i in range(count)]
+    predecessors = [[] for i in range(count)]
+    indegrees = [0] * count
+    for from_index, to_index in edges:
+        if from_index != to_index:
+            successors[from_index].append(to_index)
+            predecessors[to_index].append(from_index)
+            indegrees[to_index] += 1
+    layers = [0] * count
+    done = [False] * count
+    ready = deque([index for index in range(count) if indegrees[index] == 0])
+    processed = 0
+    forced = 0 # first object that might be left in a loop
+    while processed < count:
+        if not ready:
+            # only loops are left: start with the first object of one
+            while done[forced]:
+                forced += 1
+            ready.append(forced)
+        index = ready.popleft()
+        if done[index]:
+            continue
+        done[index] = True
+        processed += 1
+        layer = layers[index] + 1
+        for successor in successors[index]:
+            if done[successor]:
+                continue # closes a loop
+            if layers[successor] < layer:
+                layers[successor] = layer
+            indegrees[successor] -= 1
+            if indegrees[successor] == 0:
+                ready.append(successor)
+    return layers, predecessors
+
+def layered_layout(widths, edges, top=MARGIN):
+    """
+    Computes the positions of objects.
+    :param widths: list of the widths of the objects, in pixels.
+    :param edges: iterable of (from_index, to_index).
+    :param top: int Vertical position of the first row.
+    :return: list of [x, y] for each object.
+    """
+    count = len(widths)
+    layers, predecessors = get_layers(count, edges)
+    rows = []
+    for index in range(count):
+        layer = layers[index]
+        while len(rows) <= layer:
+            rows.append([])
+        rows[layer].append(index)
+    area = sum([width + GAP for width in widths]) * ROW_HEIGHT
+    bottom = top + max(MAX_HEIGHT, int(math.sqrt(area)))
+    positions = [None] * count
+    centers = [0.0] * count
+    band = [MARGIN, MARGIN] # left and right of the current band
+    y = top
+    def _next_line(y):
+        y += ROW_HEIGHT
+        if y + ROW_HEIGHT > bottom:
+            y = top
+            band[0] = band[1] + GAP
+        return y
+    for row in rows:
+        keys = []
+        for index in row:
+            placed = [centers[other] for other in predecessors[index] if positions[other] is not None]
+            if placed:
+                keys.append((sum(placed) / len(placed), index))
+            else:
+                keys.append((float(MAX_WIDTH), index))
+        keys.sort()
+        x = band[0]
+        for key, index in keys:
+            if x > band[0] and x + widths[index] > band[0] + MAX_WIDTH:
+                y = _next_line(y)
+                x = band[0]
+            positions[index] = [x, y]
+            centers[index] = x + widths[index] / 2.0
+            x += widths[index] + GAP
+            band[1] = max(band[1], x - GAP)
+        y = _next_line(y)
+    return positions
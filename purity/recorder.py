@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Recording and replay of the FUDI traffic between Python and Pure Data.
+
+A recording is a binary file that starts with MAGIC. It is followed by
+one record per read or write on the wire: a header packed with
+RECORD_HEADER (timestamp in seconds, direction, length of the data)
+followed by the data as it was on the wire.
+
+The file is memory-mapped and grows by doubling its size. It is
+truncated to the size of its records when closed.
+
+Usage::
+
+  client.start_recording("session.rec")
+  ...
+  client.stop_recording()
+
+  replayer = recorder.Replayer("session.rec", protocol, speed=4.0)
+  replayer.start().addCallback(on_done)
+"""
+import os
+import mmap
+import time
+import struct
+from twisted.internet import reactor
+from twisted.internet import defer
+
+MAGIC = b"PURITYR1"
+RECORD_HEADER = struct.Struct("<dBI")
+DIRECTION_RECEIVED = 0 # from Pure Data to Python
+DIRECTION_SENT = 1 # from Python to Pure Data
+
+# time.monotonic() is only available with Python 3.
+_now = getattr(time, "monotonic", time.time)
+
+class RecordingError(Exception):
+    """
+    Raised when a file is not a valid recording.
+    """
+    pass
+
+class SessionRecorder(object):
+    """
+    Wire tap that appends what a FUDI protocol reads and writes to a recording.
+    @see purity.fudi.FUDIProtocol.set_tap
+    """
+    def __init__(self, file_name, size=1048576):
+        """
+        :param size: int Initial size of the file in bytes.
+        """
+        self.file_name = file_name
+        self.count = 0
+        self._file = open(file_name, "w+b")
+        self._size = max(size, len(MAGIC) + RECORD_HEADER.size)
+        self._file.truncate(self._size)
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+        self._map[0:len(MAGIC)] = MAGIC
+        self._offset = len(MAGIC)
+
+    def received(self, data):
+        """
+        Records data read from the wire.
+        """
+        self.record(DIRECTION_RECEIVED, data)
+
+    def sent(self, data):
+        """
+        Records data written to the wire.
+        """
+        self.record(DIRECTION_SENT, data)
+
+    def record(self, direction, data):
+        """
+        Appends a record with the current time.
+        """
+        if self._map is None:
+            return
+        end = self._offset + RECORD_HEADER.size + len(data)
+        if end > self._size:
+            self._grow(end)
+        RECORD_HEADER.pack_into(self._map, self._offset, _now(), direction, len(data))
+        self._map[self._offset + RECORD_HEADER.size:end] = data
+        self._offset = end
+        self.count += 1
+
+    def _grow(self, minimum):
+        """
+        Doubles the size of the file until minimum bytes fit in it.
+        """
+        while self._size < minimum:
+            self._size *= 2
+        self._map.close()
+        self._file.truncate(self._size)
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+
+    def close(self):
+        """
+        Writes the recording to disk and closes it.
+        """
+        if self._map is None:
+            return
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(self._offset)
+        self._file.close()
+
+def read_recording(file_name):
+    """
+    Iterates over the records of a recording.
+    :return: generator of (timestamp, direction, data) tuples.
+    """
+    f = open(file_name, "rb")
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise RecordingError("%s is not a Purity recording." % (file_name))
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            timestamp, direction, length = RECORD_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                break
+            yield timestamp, direction, data
+    finally:
+        f.close()
+
+class Replayer(object):
+    """
+    Writes the data recorded in a file to a FUDI protocol, with the same
+    timing as when it was recorded.
+
+    The speed multiplies the rate of the recording. If it is None, the
+    data is written as fast as possible, a few records per reactor
+    iteration.
+    """
+    def __init__(self, file_name, protocol, speed=1.0, direction=DIRECTION_SENT, records_per_iteration=256):
+        """
+        :param protocol: purity.fudi.FUDIProtocol connected to Pure Data.
+        :param speed: float or None Speed factor.
+        :param direction: int Which records to replay.
+        """
+        self.file_name = file_name
+        self.protocol = protocol
+        self.speed = speed
+        self.direction = direction
+        self.records_per_iteration = records_per_iteration
+        self.clock = reactor
+        self.count = 0
+        self._records = None
+        self._next = None # next record to write
+        self._first_timestamp = None
+        self._start_time = None
+        self._delayed = None
+        self._deferred = None
+
+    def start(self):
+        """
+        Starts the replay.
+        :return: Deferred called with the number of records written once done.
+        """
+        self._records = (record for record in read_recording(self.file_name) if record[1] == self.direction)
+        self._next = next(self._records, None)
+        if self._next is not None:
+            self._first_timestamp = self._next[0]
+        self._start_time = self.clock.seconds()
+        self._deferred = defer.Deferred()
+        self._write_due()
+        return self._deferred
+
+    def stop(self):
+        """
+        Stops the replay. The Deferred of start() is called.
+        """
+        if self._delayed is not None and self._delayed.active():
+            self._delayed.cancel()
+        self._delayed = None
+        self._next = None
+        self._done()
+
+    def _due_time(self, timestamp):
+        return self._start_time + (timestamp - self._first_timestamp) / self.speed
+
+    def _write_due(self):
+        """
+        Writes the records that are due and schedules the next call.
+        """
+        self._delayed = None
+        written = 0
+        while self._next is not None:
+            if self.speed is None:
+                if written >= self.records_per_iteration:
+                    self._delayed = self.clock.callLater(0, self._write_due)
+                    return
+            else:
+                delay = self._due_time(self._next[0]) - self.clock.seconds()
+                if delay > 0:
+                    self._delayed = self.clock.callLater(delay, self._write_due)
+                    return
+            self.protocol.transport.write(self._next[2])
+            self.count += 1
+            written += 1
+            self._next = next(self._records, None)
+        self._done()
+
+    def _done(self):
+        if self._deferred is not None:
+            d = self._deferred
+            self._deferred = None
+            d.callback(self.count)
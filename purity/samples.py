@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Exchange of samples with Pure Data through memory-mapped sound files.
+
+Samples are written to a 32-bit float WAV file, in memory if /dev/shm
+exists, and the [soundfiler] of the Purity patch reads it into Pd
+arrays. It works the other way around too: [soundfiler] writes the
+arrays to a file that Python maps. Each __soundfiler__ request starts
+with an id, that the Purity patch sends back with the number of samples
+as "__soundfiler_done__ id frames". A request that is not answered in
+time fails with a SampleError, for [soundfiler] answers nothing when it
+cannot read or write a file.
+
+Needs NumPy.
+
+Usage::
+
+  exchange = samples.SampleExchange(client)
+  exchange.start()
+  exchange.send("table", numpy.sin(numpy.arange(44100) * 0.01))
+  exchange.receive("recording").addCallback(on_recording)
+"""
+import os
+import struct
+import tempfile
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.python import failure
+from purity import codec
+
+SHM_DIR = "/dev/shm"
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+REQUEST_ID_WRAP = 1000000 # ids that Pd sends back exactly
+
+class SampleError(Exception):
+    """
+    Raised when a sound file cannot be mapped, or when Pd does not
+    answer a request.
+    """
+    pass
+
+def get_directory():
+    """
+    Returns the directory for the sound files: /dev/shm if it exists,
+    otherwise the temporary directory.
+    """
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        return SHM_DIR
+    return tempfile.gettempdir()
+
+def _wav_header(frames, channels, rate):
+    data_size = frames * channels * 4
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, WAVE_FORMAT_IEEE_FLOAT, channels, rate, rate * channels * 4,
+        channels * 4, 32, b"data", data_size)
+
+def _as_frames(data):
+    """
+    Returns samples as a float32 array of shape (frames, channels).
+    """
+    data = numpy.asarray(data, dtype=numpy.float32)
+    if data.ndim == 2:
+        return data
+    return data.reshape((data.size, 1))
+
+def write_wav(path, data, rate=44100):
+    """
+    Writes samples to a 32-bit float WAV file through a memory map.
+    :param data: NumPy array of shape (frames, ) or (frames, channels).
+    """
+    data = _as_frames(data)
+    frames, channels = data.shape
+    header = _wav_header(frames, channels, rate)
+    f = open(path, "wb")
+    try:
+        f.write(header)
+        f.truncate(len(header) + data.nbytes)
+    finally:
+        f.close()
+    if frames > 0:
+        mapped = numpy.memmap(path, dtype=numpy.float32, mode="r+", offset=len(header), shape=data.shape)
+        mapped[:] = data
+        mapped.flush()
+        del mapped
+
+def map_wav(path, mode="r"):
+    """
+    Maps the samples of a 16-bit integer or 32-bit float WAV file.
+    With WAVE_FORMAT_EXTENSIBLE, the format is given by its subformat.
+    :return: NumPy memmap of shape (frames, channels).
+    """
+    f = open(path, "rb")
+    try:
+        riff, size, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise SampleError("%s is not a WAV file." % (path))
+        dtype = None
+        channels = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise SampleError("No data in %s." % (path))
+            name, chunk_size = struct.unpack("<4sI", chunk)
+            if name == b"fmt ":
+                fmt = f.read(chunk_size)
+                tag, channels, rate, byte_rate, align, bits = struct.unpack("<HHIIHH", fmt[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 40:
+                    # the subformat GUID starts with the format tag
+                    tag = struct.unpack("<H", fmt[24:26])[0]
+                if tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+                    dtype = numpy.float32
+                elif tag == WAVE_FORMAT_PCM and bits == 16:
+                    dtype = numpy.int16
+                else:
+                    raise SampleError("Unsupported format %d with %d bits in %s." % (tag, bits, path))
+            elif name == b"data":
+                if dtype is None:
+                    raise SampleError("No format before the data in %s." % (path))
+                offset = f.tell()
+                frames = chunk_size // (numpy.dtype(dtype).itemsize * channels)
+                break
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+    finally:
+        f.close()
+    if frames == 0:
+        return numpy.zeros((0, channels), dtype=dtype)
+    return numpy.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(frames, channels))
+
+class SampleExchange(object):
+    """
+    Sends samples to Pd arrays and receives them through sound files.
+
+    The file of each array is kept until released, and is reused as long
+    as its size does not change.
+    """
+    def __init__(self, purity_client, directory=None, rate=44100, timeout=10.0):
+        """
+        :param purity_client: purity.client.PurityClient whose receiver and sender are started.
+        :param directory: str Where to write the files. Defaults to get_directory().
+        :param timeout: float Duration in seconds to wait for the answer of Pd.
+        """
+        self.purity_client = purity_client
+        self.directory = directory
+        if self.directory is None:
+            self.directory = get_directory()
+        self.rate = rate
+        self.timeout = timeout
+        self.clock = reactor
+        self.files = {} # paths by array names
+        self._requests = {} # (Deferred, timeout call) waiting for __soundfiler_done__, by id
+        self._next_id = 0
+
+    def start(self):
+        self.purity_client.register_message("__soundfiler_done__", self.on_done)
+
+    def get_path(self, names):
+        """
+        Returns the path of the file for some arrays.
+        The names are quoted, so that they cannot contain a slash.
+        """
+        if not isinstance(names, (list, tuple)):
+            names = [names]
+        names = [quote(str(name), safe="") for name in names]
+        return os.path.join(self.directory, "purity-%d-%s.wav" % (os.getpid(), "-".join(names)))
+
+    def send(self, names, data, resize=True):
+        """
+        Writes samples to Pd arrays.
+        :param names: str or list of str Name of the array, or one per channel.
+        :param data: NumPy array of shape (frames, ) or (frames, channels).
+        :param resize: bool Resizes the arrays to the number of frames.
+        :return: Deferred called with the number of frames read by Pd.
+        """
+        path = self.get_path(names)
+        data = _as_frames(data)
+        mapped = None
+        if os.path.exists(path):
+            try:
+                mapped = map_wav(path, "r+")
+            except SampleError:
+                mapped = None
+        if mapped is not None and mapped.shape == data.shape and mapped.dtype == numpy.float32 and data.size > 0:
+            mapped[:] = data
+            mapped.flush()
+            del mapped
+        else:
+            del mapped
+            write_wav(path, data, self.rate)
+        self._remember(names, path)
+        flags = []
+        if resize:
+            flags.append("-resize")
+        return self._request("read", flags, path, names)
+
+    def receive(self, names):
+        """
+        Asks Pd to write arrays to a file and maps it.
+        :return: Deferred called with a NumPy memmap of shape (frames, channels).
+        """
+        path = self.get_path(names)
+        self._remember(names, path)
+        d = self._request("write", ["-bytes", 4], path, names)
+        d.addCallback(lambda frames: map_wav(path))
+        return d
+
+    def release(self, names):
+        """
+        Deletes the file of some arrays.
+        """
+        path = self.files.pop(self._key(names), None)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def close(self):
+        """
+        Deletes all the files and fails the requests waiting for Pd.
+        """
+        for key in list(self.files.keys()):
+            self.release(key)
+        requests = self._requests
+        self._requests = {}
+        for request_id, (d, call) in sorted(requests.items()):
+            call.cancel()
+            d.errback(failure.Failure(SampleError("Closed before Pd answered the __soundfiler__ request %d." % (request_id))))
+
+    def on_done(self, protocol, *args):
+        """
+        Receives FUDI __soundfiler_done__
+        """
+        if len(args) < 2:
+            return
+        entry = self._requests.pop(int(args[0]), None)
+        if entry is None: # already timed out
+            return
+        d, call = entry
+        if call.active():
+            call.cancel()
+        d.callback(args[1])
+
+    def _on_timeout(self, request_id):
+        d, call = self._requests.pop(request_id)
+        d.errback(failure.Failure(SampleError("Pd did not answer the __soundfiler__ request %d." % (request_id))))
+
+    def _key(self, names):
+        if isinstance(names, (list, tuple)):
+            return tuple(names)
+        return names
+
+    def _remember(self, names, path):
+        self.files[self._key(names)] = path
+
+    def _request(self, command, flags, path, names):
+        if not isinstance(names, (list, tuple)):
+            names = [names]
+        request_id = self._next_id
+        self._next_id = (self._next_id + 1) % REQUEST_ID_WRAP
+        d = defer.Deferred()
+        call = self.clock.callLater(self.timeout, self._on_timeout, request_id)
+        self._requests[request_id] = (d, call)
+        self.purity_client.send_message("__soundfiler__", request_id, command, *(list(flags) + [codec.escape_atom(path)] + list(names)))
+        return d
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Messages sent ahead of time and delivered by Pure Data at a given time.
+
+The Purity patch contains VOICES [purity_at] abstractions. Each one
+receives "__at_N__ slot target selector atoms...", keeps the message in
+one of its SLOTS slots and sends it to the receiver named selector when
+its timer reaches target, in milliseconds. The timers of all the voices
+are reset by __at_sync__.
+
+Logical times are in seconds since the scheduler was started. Since the
+__at_sync__ message and the events take the same path to Pd, the network
+latency delays them all by the same duration and the intervals between
+events are kept, with the accuracy of the Pd scheduler.
+
+A slot holds a single event at a time, so VOICES * SLOTS events can be
+pending in Pd. When all the slots are busy, events wait in Python until
+one is free. Events must be sent over TCP, in order.
+"""
+import heapq
+from collections import deque
+from twisted.internet import reactor
+
+VOICES = 32 # number of [purity_at] in dynamic_patch.pd
+SLOTS = 64 # number of events each [purity_at] holds
+_EPSILON = 1e-6 # rounding of the clock, in seconds
+
+class FutureSender(object):
+    """
+    Sends messages to Pure Data ahead of the time they must be delivered.
+    """
+    def __init__(self, purity_client, voices=VOICES, slots=SLOTS, margin=0.05):
+        """
+        :param purity_client: purity.client.PurityClient instance.
+        :param voices: int Number of [purity_at] abstractions in the patch.
+        :param slots: int Number of events each of them holds.
+        :param margin: float Duration in seconds a slot stays busy after the
+        time of its event, to allow for the jitter of the network.
+        """
+        self.purity_client = purity_client
+        self.margin = margin
+        self.clock = reactor
+        self.start_time = None
+        self.epoch = 0.0 # logical time of the last __at_sync__
+        self.stats = {"sent": 0, "waited": 0, "late": 0}
+        # heap of (free time, slot, voice), so that the voices are used in turn
+        self._slots = [(0.0, slot, voice) for slot in range(slots) for voice in range(voices)]
+        self._waiting = deque() # events waiting for a free slot
+        self._retry_call = None
+
+    def start(self):
+        """
+        Starts the logical time and the timers of the Pd voices.
+        """
+        self.start_time = self.clock.seconds()
+        self.epoch = 0.0
+        self.purity_client.send_message("__at_sync__")
+
+    def resync(self):
+        """
+        Resets the timers of the Pd voices to the current logical time.
+        Pd floats are 32 bits, so the targets lose precision as they grow.
+        Call this every hour or so.
+        """
+        self.epoch = self.get_time()
+        self.purity_client.send_message("__at_sync__")
+
+    def stop(self):
+        """
+        Drops the events waiting for a slot.
+        """
+        if self._retry_call is not None and self._retry_call.active():
+            self._retry_call.cancel()
+        self._retry_call = None
+        self._waiting.clear()
+
+    def get_time(self):
+        """
+        Returns the current logical time, in seconds.
+        """
+        return self.clock.seconds() - self.start_time
+
+    def send_at(self, logical_time, selector, *atoms):
+        """
+        Sends a message to be delivered to a [receive] at a logical time.
+        Events in the past are delivered as soon as they are received.
+        """
+        event = (logical_time, selector, atoms)
+        if self._waiting or not self._send(event, self.get_time()):
+            self.stats["waited"] += 1
+            self._waiting.append(event)
+            self._schedule_retry()
+
+    def _send(self, event, now):
+        """
+        Sends an event using a free slot.
+        :return: bool False if they are all busy.
+        """
+        free_time, slot, voice = self._slots[0]
+        if free_time > now + _EPSILON:
+            return False
+        logical_time, selector, atoms = event
+        if logical_time < now:
+            self.stats["late"] += 1
+        heapq.heapreplace(self._slots, (max(logical_time, now) + self.margin, slot, voice))
+        target = (logical_time - self.epoch) * 1000.0
+        self.purity_client.send_message("__at_%d__" % (voice), slot, target, selector, *atoms)
+        self.stats["sent"] += 1
+        return True
+
+    def _schedule_retry(self):
+        if self._retry_call is None:
+            delay = max(0.0, self._slots[0][0] - self.get_time())
+            self._retry_call = self.clock.callLater(delay, self._retry)
+
+    def _retry(self):
+        """
+        Sends the waiting events for which a slot is free.
+        """
+        self._retry_call = None
+        now = self.get_time()
+        while self._waiting and self._send(self._waiting[0], now):
+            self._waiting.popleft()
+        if self._waiting:
+            self._schedule_retry()
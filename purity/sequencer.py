@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Pattern sequencer using NumPy arrays.
+
+A Pattern holds events as arrays: their times, the index of the
+[receive] symbol they are sent to and their values. Transformations
+such as transpositions and probability masks apply to all the events at
+once.
+
+The Sequencer sends the events block by block, ahead of time. Each block
+is encoded in a single string formatting operation and loaded in one of
+the two [qlist] of the Purity patch, which is started at the time of the
+block by the scheduler of purity.scheduler.
+
+Needs NumPy.
+
+Usage::
+
+  kick = sequencer.Pattern.euclidean(3, 8, 2.0, "kick", [1])
+  hats = sequencer.Pattern.euclidean(7, 16, 2.0, "hat", [0.5])
+  client.start_scheduler()
+  seq = sequencer.Sequencer(client, kick.merge(hats))
+  seq.transforms.append(lambda block: block.mask(0.9))
+  seq.start()
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from twisted.internet import reactor
+
+BLOCK_PLAYERS = 2 # number of [qlist] in dynamic_patch.pd
+
+class Pattern(object):
+    """
+    Events looped over a length in seconds.
+
+    Patterns are not modified in place: transformations return new ones.
+    """
+    def __init__(self, times, indices, values, length, selectors, width=None):
+        """
+        :param times: array of the times of the events, in seconds.
+        :param indices: array of the indices in selectors of the symbols of the events.
+        :param values: 2D array with a row of atoms per event.
+        :param length: float Duration of the pattern in seconds.
+        :param selectors: list of [receive] symbols.
+        :param width: int Number of atoms per event. Defaults to the number 
+        of columns of values, which cannot be guessed when there are no events.
+        """
+        times = numpy.asarray(times, dtype=numpy.float64)
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if width is None:
+            if values.ndim == 2:
+                width = values.shape[1]
+            elif len(times) != 0:
+                width = values.size // len(times)
+            else:
+                width = 0
+        order = numpy.argsort(times, kind="mergesort")
+        self.width = width
+        self.times = times[order]
+        self.indices = numpy.asarray(indices, dtype=numpy.intp)[order]
+        self.values = values.reshape(len(times), width)[order]
+        self.length = float(length)
+        self.selectors = list(selectors)
+
+    def __len__(self):
+        return len(self.times)
+
+    @classmethod
+    def euclidean(cls, pulses, steps, length, selector, values):
+        """
+        Creates a pattern with pulses spread as evenly as possible over steps.
+        :param values: list of atoms for every event.
+        """
+        onsets = numpy.flatnonzero((numpy.arange(steps) * pulses) % steps < pulses)
+        times = onsets * (float(length) / steps)
+        indices = numpy.zeros(len(onsets), dtype=numpy.intp)
+        values = numpy.tile(numpy.asarray(values, dtype=numpy.float64), (len(onsets), 1))
+        return cls(times, indices, values, length, [selector])
+
+    def _copy(self, mask=None, times=None, values=None):
+        if mask is None:
+            mask = slice(None)
+        if times is None:
+            times = self.times
+        if values is None:
+            values = self.values
+        return Pattern(times[mask], self.indices[mask], values[mask], self.length, self.selectors, self.width)
+
+    def transpose(self, amount, column=0):
+        """
+        Adds an amount to a column of the values.
+        """
+        values = self.values.copy()
+        values[:, column] += amount
+        return self._copy(values=values)
+
+    def mask(self, probability, random_state=None):
+        """
+        Keeps each event with a probability.
+        :param probability: float, or array with a probability per event.
+        :param random_state: numpy.random.RandomState or None.
+        """
+        if random_state is None:
+            random_state = numpy.random
+        return self._copy(mask=random_state.random_sample(len(self.times)) < probability)
+
+    def shift(self, offset):
+        """
+        Delays the events, wrapping them around the length.
+        """
+        return self._copy(times=(self.times + offset) % self.length)
+
+    def merge(self, other):
+        """
+        Returns a pattern with the events of both, and the longest length.
+        """
+        selectors = list(self.selectors)
+        mapping = []
+        for selector in other.selectors:
+            if selector not in selectors:
+                selectors.append(selector)
+            mapping.append(selectors.index(selector))
+        width = max(self.width, other.width)
+        values = numpy.zeros((len(self) + len(other), width))
+        values[:len(self), :self.width] = self.values
+        values[len(self):, :other.width] = other.values
+        indices = numpy.concatenate([self.indices, numpy.asarray(mapping, dtype=numpy.intp)[other.indices]])
+        return Pattern(numpy.concatenate([self.times, other.times]), indices, values, max(self.length, other.length), selectors, width)
+
+    def window(self, start, end):
+        """
+        Returns the events of the looped pattern between two times, with
+        times relative to start, as a pattern of length end - start.
+        """
+        first_loop = int(numpy.floor(start / self.length))
+        last_loop = int(numpy.floor(end / self.length))
+        times, indices, values = [], [], []
+        for loop in range(first_loop, last_loop + 1):
+            offset = loop * self.length
+            begin = numpy.searchsorted(self.times, start - offset, "left")
+            stop = numpy.searchsorted(self.times, end - offset, "left")
+            times.append(self.times[begin:stop] + (offset - start))
+            indices.append(self.indices[begin:stop])
+            values.append(self.values[begin:stop])
+        return Pattern(numpy.concatenate(times), numpy.concatenate(indices), numpy.concatenate(values), end - start, self.selectors, self.width)
+
+def encode_block(pattern, player):
+    """
+    Encodes the events of a block as messages for a [qlist], in a single
+    string formatting operation.
+    :param player: int Index of the [qlist].
+    :return: tuple of the FUDI text and the number of messages in it.
+    """
+    receiver = "__seq_%d__" % (player)
+    count = len(pattern)
+    width = pattern.width
+    deltas = numpy.diff(numpy.concatenate([[0.0], pattern.times])) * 1000.0
+    atoms = numpy.empty((count, width + 2), dtype=object)
+    atoms[:, 0] = deltas
+    atoms[:, 1] = numpy.asarray(pattern.selectors, dtype=object)[pattern.indices]
+    atoms[:, 2:] = pattern.values
+    line = receiver + " add %g %s" + " %g" * width + " ;\r\n"
+    txt = "%s clear ;\r\n" % (receiver) + (line * count) % tuple(atoms.ravel())
+    return txt, count + 1
+
+class Sequencer(object):
+    """
+    Plays a pattern in a loop, sending its events a block ahead of time.
+    The scheduler of the PurityClient must be started.
+    """
+    def __init__(self, purity_client, pattern, block_duration=0.5, lookahead=0.2):
+        """
+        :param purity_client: purity.client.PurityClient instance.
+        :param block_duration: float Duration of a block in seconds.
+        :param lookahead: float How long before its start a block is sent, in seconds.
+        """
+        if lookahead >= block_duration * (BLOCK_PLAYERS - 1):
+            raise ValueError("The lookahead must be shorter than %d blocks." % (BLOCK_PLAYERS - 1))
+        self.purity_client = purity_client
+        self.pattern = pattern
+        self.block_duration = block_duration
+        self.lookahead = lookahead
+        self.transforms = [] # callables taking and returning a block Pattern
+        self.clock = reactor
+        self.stats = {"blocks": 0, "events": 0}
+        self._start_time = None # logical time of the start of the pattern
+        self._position = 0.0 # time in the pattern of the next block
+        self._player = 0
+        self._call = None
+
+    def start(self, delay=None):
+        """
+        Starts playing.
+        :param delay: float Time before the first event, in seconds. Defaults to the lookahead.
+        """
+        if delay is None:
+            delay = self.lookahead
+        self._start_time = self.purity_client.future_sender.get_time() + delay
+        self._position = 0.0
+        self._send_block()
+
+    def stop(self):
+        """
+        Stops sending blocks. The block already sent is played.
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+    def set_pattern(self, pattern):
+        """
+        Changes the pattern, starting with the next block.
+        """
+        self.pattern = pattern
+
+    def _send_block(self):
+        """
+        Sends the next block and schedules the one after it.
+        """
+        self._call = None
+        start = self._position
+        end = start + self.block_duration
+        block = self.pattern.window(start, end)
+        for transform in self.transforms:
+            block = transform(block)
+        if len(block) > 0:
+            txt, count = encode_block(block, self._player)
+            self.purity_client.send_encoded(txt, count)
+            self.purity_client.send_at(self._start_time + start, "__seq_%d__" % (self._player), "bang")
+            self._player = (self._player + 1) % BLOCK_PLAYERS
+        self.stats["blocks"] += 1
+        self.stats["events"] += len(block)
+        self._position = end
+        delay = self._start_time + end - self.lookahead - self.purity_client.future_sender.get_time()
+        self._call = self.clock.callLater(max(0.0, delay), self._send_block)
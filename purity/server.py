@@ -23,16 +23,62 @@
 """
 Launcher for a Pure Data process.
 """
+import atexit
 import os
+import re
 import sys
+import tempfile
 import warnings
 import subprocess
 import purity
-from purity import process
-from twisted.internet import defer
+from purity import canvas
+# Twisted and the process module are imported where they are used, so that
+# the asyncio and blocking clients can build the command without Twisted.
 
 VERBOSE = True
-DYNAMIC_PATCH = os.path.join(os.path.dirname(purity.__file__), "data", "dynamic_patch.pd")
+DATA_DIR = os.path.join(os.path.abspath(os.path.dirname(purity.__file__)), "data")
+DYNAMIC_PATCH = os.path.join(DATA_DIR, "dynamic_patch.pd")
+
+def get_dynamic_patch(main_patch):
+    """
+    Returns the text of the Purity patch, with the content of a subpatch
+    in its [pd __main__]. 
+    :param main_patch: purity.canvas.SubPatch, usually canvas.get_main_patch().
+    """
+    f = open(DYNAMIC_PATCH)
+    try:
+        txt = f.read()
+    finally:
+        f.close()
+    match = re.search(r"^#N canvas [-\d]+ [-\d]+ [-\d]+ [-\d]+ __main__ \d+;\s*$", txt, re.MULTILINE)
+    if match is None:
+        raise RuntimeError("No [pd __main__] in %s." % (DYNAMIC_PATCH))
+    lines = canvas.get_pd_lines(main_patch)
+    return txt[:match.end()] + "\n" + "\n".join(lines) + txt[match.end():]
+
+def write_dynamic_patch(main_patch, file_name=None):
+    """
+    Writes the Purity patch with the content of a subpatch in its [pd __main__].
+    Pd must be given the -path of DATA_DIR to find the abstractions of 
+    the Purity patch, such as [purity_at].
+    :param file_name: str Defaults to a new temporary file, removed when
+    Python exits.
+    :return: str Its file name.
+    """
+    if file_name is None:
+        fd, file_name = tempfile.mkstemp(suffix=".pd", prefix="purity-")
+        os.close(fd)
+        atexit.register(_remove_file, file_name)
+    f = open(file_name, "w")
+    try:
+        f.write(get_dynamic_patch(main_patch))
+    finally:
+        f.close()
+    return file_name
+
+def _remove_file(file_name):
+    if os.path.exists(file_name):
+        os.remove(file_name)
 
 #class ChildKilledError(Exception):
 #    """Raised when child is killed"""
@@ -88,8 +134,15 @@ DYNAMIC_PATCH = os.path.join(os.path.dirname(purity.__file__), "data", "dynamic_
 class PureData(object):
     """
     Launches Pure Data software. 
+
+    With main_patch, Pd loads the Purity patch with its content in 
+    [pd __main__], instead of receiving it from create_patch(). It can 
+    then be changed with update_patch(). That patch is written by 
+    write_patch(), which must be called before get_command(). The files 
+    of open_patches are opened too, such as the ones of 
+    purity.canvas.save_pd_file().
     """
-    def __init__(self, rate=48000, listdev=True, inchannels=2, outchannels=2, verbose=True, driver="jack", nogui=False, blocking=True, patch=None, process_tool="subprocess", audioindev=None, audiooutdev=None):
+    def __init__(self, rate=48000, listdev=True, inchannels=2, outchannels=2, verbose=True, driver="jack", nogui=False, blocking=True, patch=None, process_tool="subprocess", audioindev=None, audiooutdev=None, main_patch=None, open_patches=None):
         global DYNAMIC_PATCH
         self.rate = rate
         self.listdev = listdev
@@ -103,37 +156,72 @@ class PureData(object):
         self.audioindev = audioindev
         self.audiooutdev = audiooutdev
         
+        self.main_patch = main_patch
+        self._generated_patch = None # written by write_patch(), removed by stop()
         if self.patch is None: # default patch:
             self.patch = DYNAMIC_PATCH
+        self.open_patches = list(open_patches or [])
         self.process_tool = process_tool
         self._process_manager = None
         # ready to go
 
-    def start(self):
+    def write_patch(self):
         """
-        Creates args and start pd.
-        
-        Returns True
-        Blocking.
+        Writes the Purity patch with the content of main_patch, once, and 
+        marks main_patch as materialized. Does nothing without main_patch.
+        :return: str The file name of the patch pd will load.
         """
-        command = "pd"
+        if self.main_patch is not None and self._generated_patch is None:
+            self.patch = write_dynamic_patch(self.main_patch)
+            self._generated_patch = self.patch
+            self.main_patch.mark_materialized()
+        return self.patch
+
+    def get_command(self):
+        """
+        Returns the command to start pd, as a list of arguments.
+        Raises a RuntimeError if the patch for main_patch is not written yet.
+        """
+        if self.main_patch is not None and self._generated_patch is None:
+            raise RuntimeError("The patch for main_patch is not written. Call write_patch() first.")
+        command = ["pd"]
         if self.driver == "jack":
-            command += " -jack"
+            command.append("-jack")
         elif self.driver == "alsa":
-            command += " -alsa"
+            command.append("-alsa")
             if self.audioindev is not None:
-                command += " -audioindev %d" % (self.audioindev)
+                command.extend(["-audioindev", str(self.audioindev)])
             if self.audiooutdev is not None:
-                command += " -audiooutdev %d" % (self.audiooutdev)
-            command += " -listdev"
+                command.extend(["-audiooutdev", str(self.audiooutdev)])
+            command.append("-listdev")
         else:
             warnings.warn("Driver %s is not supported - yet." % (self.driver))
         if self.verbose:
-            command += " -verbose"
-        command += " -r %d" % (self.rate)
-        command += " -inchannels %d" % (self.inchannels)
-        command += " -outchannels %d" % (self.outchannels)
-        command += " %s" % (self.patch)
+            command.append("-verbose")
+        if self.nogui:
+            command.append("-nogui")
+        command.extend(["-r", str(self.rate)])
+        command.extend(["-inchannels", str(self.inchannels)])
+        command.extend(["-outchannels", str(self.outchannels)])
+        if os.path.dirname(os.path.abspath(self.patch)) != DATA_DIR:
+            # for the abstractions of the Purity patch
+            command.extend(["-path", DATA_DIR])
+        for file_name in self.open_patches:
+            command.extend(["-open", file_name])
+        command.append(self.patch)
+        return command
+
+    def start(self):
+        """
+        Creates args and start pd.
+        
+        Returns True
+        Blocking.
+        """
+        from twisted.internet import defer
+        from purity import process
+        self.write_patch()
+        command = " ".join(self.get_command())
         #print("Using process tool %s" % (self.process_tool))
         if self.process_tool == "subprocess":
             run_command(command, variables_dict={}, die_on_ctrl_c=True)
@@ -143,7 +231,7 @@ class PureData(object):
             #TODO: env vars
             self._process_manager = process.ProcessManager(
                 name="puredata", 
-                command=command.split(),
+                command=self.get_command(),
                 verbose=True
                 )
             d = self._process_manager.start() # deferred
@@ -153,6 +241,16 @@ class PureData(object):
             raise NotImplementedError("no such process tool")
         
     def stop(self):
+        """
+        Stops pd if started by the process manager, and removes the patch
+        written for main_patch.
+        :return: Deferred
+        """
+        if self._generated_patch is not None:
+            _remove_file(self._generated_patch)
+            self._generated_patch = None
+        if self._process_manager is not None:
+            return self._process_manager.stop()
         raise NotImplementedError("This is still to be done.")
 
 #def fork_and_start_pd(**kwargs):
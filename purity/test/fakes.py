@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fake objects shared by the unit tests.
+"""
+from purity import codec
+
+class FakeClient(object):
+    """
+    Stands for a Purity client: records the messages sent to Pure Data
+    and the callbacks registered for the messages it would send back.
+    """
+    def __init__(self):
+        self.sent = []
+        self.callbacks = {}
+    def register_message(self, selector, callback):
+        self.callbacks[selector] = callback
+    def unregister_message(self, selector, callback):
+        del self.callbacks[selector]
+    def send_message(self, selector, *args):
+        self.sent.append([selector] + list(args))
+    def send_messages(self, messages):
+        for message in messages:
+            self.send_message(*message)
+    def send_encoded(self, txt, count=1):
+        messages = codec.FUDIParser().feed(txt)
+        assert len(messages) == count
+        self.sent.extend(messages)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the asyncio implementation of the FUDI protocol and client.
+"""
+from twisted.trial import unittest
+
+from purity import aio
+from purity import canvas
+
+def _run(loop, future, timeout=5.0):
+    return loop.run_until_complete(aio.asyncio.wait_for(future, timeout))
+
+class Test_01_Asyncio(unittest.TestCase):
+    """
+    Tests the asyncio FUDI protocol, client and process manager.
+    """
+    if aio.asyncio is None:
+        skip = "asyncio is not available."
+
+    def setUp(self):
+        self.loop = aio.asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_01_loopback(self):
+        received = []
+        factory = aio.FUDIServerFactory()
+        factory.register_message("ping", lambda protocol, *atoms: received.append(atoms))
+        server = _run(self.loop, factory.listen(0, "127.0.0.1", loop=self.loop))
+        port = server.sockets[0].getsockname()[1]
+        sender = _run(self.loop, aio.create_FUDI_client("127.0.0.1", port, loop=self.loop))
+        sender.send_messages([["ping", 1, 2.5, "bang"], ["ping", 2]])
+        _run(self.loop, aio.asyncio.sleep(0.1))
+        self.assertEqual(received, [(1, 2.5, "bang"), (2, )])
+        sender.transport.close()
+        server.close()
+        _run(self.loop, server.wait_closed())
+
+    def test_02_handshake_and_create_patch(self):
+        # A fake Pure Data: listens like [netreceive] and connects like [netsend].
+        received = []
+        pd_factory = aio.FUDIServerFactory()
+        pd_factory.set_default_handler(lambda protocol, *atoms: received.append(atoms))
+        pd_server = _run(self.loop, pd_factory.listen(0, "127.0.0.1", loop=self.loop))
+        send_port = pd_server.sockets[0].getsockname()[1]
+        client = aio.PurityClient(receive_port=0, send_port=send_port, loop=self.loop)
+        started = client.start_purity_receiver()
+        _run(self.loop, aio.asyncio.sleep(0.05))
+        receive_port = client._server.sockets[0].getsockname()[1]
+        pd_sender = _run(self.loop, aio.create_FUDI_client("127.0.0.1", receive_port, loop=self.loop))
+        pd_sender.send_message("__first_connected__", 1)
+        _run(self.loop, started)
+        _run(self.loop, client.start_purity_sender())
+        main = canvas.get_main_patch()
+        patch = main.subpatch("aio")
+        patch.connect(patch.obj("osc~", 440), 0, patch.obj("dac~"), 0)
+        _run(self.loop, client.create_patch(main, delay=0))
+        _run(self.loop, aio.asyncio.sleep(0.1))
+        self.assertEqual(len(received), len(main.get_fudi()))
+        pd_sender.transport.close()
+        _run(self.loop, client.quit())
+        pd_server.close()
+        _run(self.loop, pd_server.wait_closed())
+
+    def test_03_process(self):
+        process = aio.PureDataProcess(loop=self.loop, check_delay=0.1)
+        process.command = ["sleep", "10"]
+        self.assertEqual(_run(self.loop, process.start()), True)
+        self.assertEqual(process.state, process.STATE_RUNNING)
+        _run(self.loop, process.stop())
+        self.assertEqual(process.state, process.STATE_STOPPED)
+
+    def test_04_stop_while_starting(self):
+        process = aio.PureDataProcess(loop=self.loop, check_delay=0.1)
+        process.command = ["sleep", "10"]
+        started = process.start()
+        self.assertEqual(process.state, process.STATE_STARTING)
+        _run(self.loop, process.stop())
+        self.assertEqual(process.state, process.STATE_STOPPED)
+        self.assertRaises(aio.asyncio.CancelledError, _run, self.loop, started)
+        self.assertEqual(process.state, process.STATE_STOPPED)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the transfer of NumPy arrays to Pd arrays.
+"""
+from twisted.trial import unittest
+
+from purity import arrays
+from purity import codec
+from purity.test.fakes import FakeClient
+
+numpy = arrays.numpy
+
+class Test_01_Arrays(unittest.TestCase):
+    """
+    Tests the chunked encoding of arrays.
+    """
+    if numpy is None:
+        skip = "NumPy is not available."
+
+    def test_01_chunks(self):
+        values = numpy.random.uniform(-1.0, 1.0, 5000) * 1e-3
+        txt, count = arrays.encode_array("table", values, onset=10)
+        lines = txt.splitlines()
+        self.assertEqual(len(lines), count)
+        self.assertTrue(count > 1)
+        for line in lines:
+            self.assertTrue(len(line) + 2 <= arrays.MAX_LINE)
+        messages = codec.FUDIParser().feed(txt)
+        self.assertEqual(messages[1][1], 10 + len(messages[0]) - 2)
+        decoded = numpy.concatenate([numpy.array(m[2:], dtype=numpy.float32) for m in messages])
+        self.assertTrue(numpy.array_equal(decoded, values.astype(numpy.float32)))
+
+    def test_02_precision(self):
+        values = numpy.linspace(0.0, 1.0, 1000)
+        full, count = arrays.encode_array("t", values)
+        short, count = arrays.encode_array("t", values, precision=4)
+        self.assertTrue(len(short) < len(full) * 0.7)
+        self.assertEqual(codec.FUDIParser().feed(short)[0][2:5], [0, 0.001001, 0.002002])
+
+    def test_03_send_array(self):
+        client = FakeClient()
+        stats = arrays.send_array(client, "table", [0.5, 1, 2], onset=4, resize=True)
+        self.assertEqual(client.sent, [["table", "resize", 7], ["table", 4, 0.5, 1, 2]])
+        self.assertEqual(stats["samples"], 3)
+        self.assertEqual(stats["messages"], 1)
+
+    def test_04_percent_in_name(self):
+        txt, count = arrays.encode_array("100%s", [0.5, 1])
+        self.assertEqual(codec.FUDIParser().feed(txt), [["100%s", 0, 0.5, 1]])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the blocking Purity client.
+"""
+import socket
+import threading
+
+from twisted.trial import unittest
+
+from purity import blocking
+from purity import canvas
+from purity import codec
+
+class _FakePd(object):
+    """
+    Listens like [netreceive] and connects like [netsend], in a thread.
+    """
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.data = []
+        self.thread = threading.Thread(target=self._receive)
+        self.thread.start()
+
+    def connect_and_send(self, port, txt):
+        self.sender = socket.create_connection(("127.0.0.1", port))
+        self.sender.sendall(txt)
+
+    def _receive(self):
+        connection, address = self.listener.accept()
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                break
+            self.data.append(data)
+        connection.close()
+        self.listener.close()
+
+class Test_01_Blocking(unittest.TestCase):
+    """
+    Tests the blocking client with a fake Pure Data.
+    """
+    def test_01_handshake_and_create_patch(self):
+        pd = _FakePd()
+        client = blocking.PurityClient(receive_port=0, send_port=pd.port, host="127.0.0.1", timeout=5.0)
+        client.start_purity_receiver()
+        received = []
+        client.register_message("meter", lambda c, *atoms: received.append(atoms))
+        pd.connect_and_send(client._listener.getsockname()[1], "meter 1;\n__first_connected__ 1;\n")
+        client.wait_for_first_connected()
+        self.assertEqual(received, [(1, )])
+        client.start_purity_sender()
+        main = canvas.get_main_patch()
+        patch = main.subpatch("blocking")
+        patch.connect(patch.obj("osc~", 440), 0, patch.obj("dac~"), 0)
+        client.create_patch(main)
+        client.send_message("pd", "dsp", 1)
+        pd.sender.sendall("__pong__;")
+        self.assertEqual(client.wait_for("__pong__"), [])
+        client.quit()
+        pd.thread.join(5.0)
+        pd.sender.close()
+        messages = codec.FUDIParser().feed("".join(pd.data))
+        self.assertEqual(messages, main.get_fudi() + [["pd", "dsp", 1]])
+
+    def test_02_timeout(self):
+        client = blocking.PurityClient(receive_port=0, host="127.0.0.1", timeout=0.1)
+        client.start_purity_receiver()
+        self.assertRaises(blocking.PurityTimeoutError, client.wait_for_first_connected)
+        client.quit()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the model of the patches.
+"""
+import os
+from twisted.trial import unittest
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from purity import canvas
+from purity import compact
+from purity import layout
+
+class Test_01_Edit_Script(unittest.TestCase):
+    """
+    Tests the messages that update what is in Pd.
+    """
+    def setUp(self):
+        self.main = canvas.get_main_patch()
+        self.osc = self.main.obj("osc~", 440)
+        self.dac = self.main.obj("dac~")
+        self.main.connect(self.osc, 0, self.dac, 0)
+        self.main.get_fudi()
+        self.main.mark_materialized()
+
+    def test_01_nothing_changed(self):
+        self.assertEqual(self.main.get_edit_script(), [])
+
+    def test_02_not_materialized(self):
+        patch = canvas.SubPatch("new")
+        patch.obj("print")
+        self.assertEqual(patch.get_edit_script(), [["pd-new"] + patch.objects[0].get_fudi()])
+        self.assertEqual(patch.get_edit_script(), [])
+
+    def test_03_add(self):
+        gain = self.main.obj("*~", 0.5)
+        self.main.connect(self.osc, 0, gain, 0)
+        self.main.connect(gain, 0, self.dac, 1)
+        self.assertEqual(self.main.get_edit_script(), [
+            ["pd-__main__"] + gain.get_fudi(),
+            ["pd-__main__", "connect", 0, 0, 2, 0],
+            ["pd-__main__", "connect", 2, 0, 1, 1],
+            ])
+
+    def test_04_disconnect(self):
+        self.main.connections = []
+        self.assertEqual(self.main.get_edit_script(), [["pd-__main__", "disconnect", 0, 0, 1, 0]])
+
+    def test_05_change_args(self):
+        x, y = self.osc.pos
+        self.osc.args = [220]
+        script = self.main.get_edit_script()
+        self.assertEqual(script[:6], [
+            ["pd-__main__", "vis", 1],
+            ["pd-__main__", "editmode", 1],
+            ["pd-__main__", "mouse", x + 1, y + 1, 1, 0],
+            ["pd-__main__", "mouseup", x + 1, y + 1, 1],
+            ["pd-__main__", "cut"],
+            ["pd-__main__", "editmode", 0],
+            ])
+        self.assertEqual(script[6:], [
+            ["pd-__main__", "vis", 0],
+            ["pd-__main__"] + self.osc.get_fudi(),
+            ["pd-__main__", "connect", 1, 0, 0, 0],
+            ])
+        # the objects are renumbered like in Pd
+        self.assertEqual(self.main.objects, [self.dac, self.osc])
+        self.assertEqual(self.osc.id, 1)
+
+    def test_06_delete_many(self):
+        other = self.main.obj("noise~")
+        self.main.get_edit_script()
+        self.main.objects = [self.dac]
+        self.main.connections = []
+        script = self.main.get_edit_script()
+        clicks = [message for message in script if message[1] == "mouse"]
+        self.assertEqual([message[5] for message in clicks], [0, 1])
+        self.assertEqual(clicks[1][2:4], [other.pos[0] + 1, other.pos[1] + 1])
+        self.assertFalse([message for message in script if message[1] == "disconnect"])
+
+    def test_07_subpatch(self):
+        sub = self.main.subpatch("voice")
+        self.assertEqual(self.main.get_edit_script(), sub.get_fudi())
+        sub.obj("print")
+        self.assertEqual(self.main.get_edit_script(), [["pd-voice"] + sub.objects[0].get_fudi()])
+
+    def test_08_clear(self):
+        self.main.clear()
+        self.assertEqual(len(self.main.get_edit_script()), 0)
+        self.osc = self.main.obj("osc~", 440)
+        self.assertEqual(self.main.get_edit_script(), [["pd-__main__"] + self.osc.get_fudi()])
+
+class Test_02_Cached_FUDI(unittest.TestCase):
+    """
+    Tests that the FUDI lists are only computed again when something changed.
+    """
+    def setUp(self):
+        self.main = canvas.get_main_patch()
+        self.voices = [self.main.subpatch("voice%d" % (i)) for i in range(2)]
+        self.oscs = [voice.obj("osc~", 440) for voice in self.voices]
+        for voice, osc in zip(self.voices, self.oscs):
+            voice.connect(osc, 0, voice.obj("outlet~"), 0)
+        self.fudi = self.main.get_fudi()
+
+    def test_01_unchanged(self):
+        self.assertEqual(self.main.get_fudi(), self.fudi)
+        self.assertTrue(self.main.get_fudi()[1] is self.fudi[1])
+        # a copy
+        self.main.get_fudi().pop()
+        self.assertEqual(self.main.get_fudi(), self.fudi)
+
+    def test_02_changed(self):
+        cached = self.voices[1]._fudi
+        self.oscs[0].args = [220]
+        self.assertEqual(self.main._fudi, None)
+        fudi = self.main.get_fudi()
+        self.assertTrue(["pd-voice0", "obj", self.oscs[0].pos[0], self.oscs[0].pos[1], "osc~", 220] in fudi)
+        self.assertTrue(self.voices[1]._fudi is cached)
+
+    def test_03_added(self):
+        self.voices[0].obj("print")
+        self.voices[0].connect(self.oscs[0], 0, self.voices[0].objects[-1], 0)
+        fudi = self.main.get_fudi()
+        self.assertEqual(len(fudi), len(self.fudi) + 2)
+        self.assertTrue(["pd-voice0", "connect", 0, 0, 2, 0] in fudi)
+
+    def test_04_renamed(self):
+        self.voices[0].name = "bass"
+        fudi = self.main.get_fudi()
+        self.assertTrue(["pd-__main__", "obj", self.voices[0].pos[0], self.voices[0].pos[1], "pd", "bass"] in fudi)
+        self.assertFalse([message for message in fudi if message[0] == "pd-voice0"])
+
+    def test_05_changed_in_place(self):
+        self.oscs[1].args.append(0.5)
+        self.assertEqual(self.main.get_fudi(), self.fudi)
+        self.oscs[1].changed()
+        self.assertNotEqual(self.main.get_fudi(), self.fudi)
+
+class Test_03_Connect(unittest.TestCase):
+    """
+    Tests the validation of connections and connect_many().
+    """
+    def setUp(self):
+        self.patch = canvas.get_main_patch()
+        self.objs = [self.patch.obj("f") for i in range(4)]
+
+    def test_01_validation(self):
+        other = canvas.SubPatch("other").obj("f")
+        self.assertRaises(canvas.PureError, self.patch.connect, other, 0, self.objs[0], 0)
+        self.assertRaises(canvas.PureError, self.patch.connect, self.objs[0], 0, other, 0)
+        self.patch.connect(self.objs[0], 0, self.objs[1], 0)
+        self.assertRaises(canvas.PureError, self.patch.connect, self.objs[0], 0, self.objs[1], 0)
+        self.assertEqual(len(self.patch.connections), 1)
+
+    def test_02_adjacency(self):
+        self.patch.connect(self.objs[0], 0, self.objs[1], 0)
+        self.patch.connect(self.objs[0], 1, self.objs[2], 1)
+        self.assertEqual([conn.to_object for conn in self.patch.get_connections_from(self.objs[0])], self.objs[1:3])
+        self.assertEqual([conn.from_object for conn in self.patch.get_connections_to(self.objs[2])], [self.objs[0]])
+        self.assertEqual(self.patch.get_connections_to(self.objs[0]), [])
+        self.patch.connections = self.patch.connections[1:]
+        self.assertEqual(len(self.patch.get_connections_from(self.objs[0])), 1)
+        self.patch.objects = self.objs[:3]
+        self.assertFalse(self.patch.has_object(self.objs[3]))
+
+    def test_03_connect_many(self):
+        self.patch.connect_many([(0, 0, 1, 0), (self.objs[1], 0, self.objs[2], 0), (2, 0, 3, 1)])
+        self.assertEqual(self.patch.get_fudi()[4:7], [
+            ["pd-__main__", "connect", 0, 0, 1, 0],
+            ["pd-__main__", "connect", 1, 0, 2, 0],
+            ["pd-__main__", "connect", 2, 0, 3, 1],
+            ])
+
+    def test_04_connect_many_fails(self):
+        self.assertRaises(canvas.PureError, self.patch.connect_many, [(0, 0, 1, 0), (0, 0, 1, 0)])
+        self.assertEqual(self.patch.connections, [])
+        self.patch.connect_many([(0, 0, 1, 0)])
+
+    def test_05_connect_many_array(self):
+        edges = numpy.array([[0, 0, 1, 0], [1, 0, 2, 0], [1, 0, 3, 0]])
+        self.patch.connect_many(edges)
+        self.assertEqual(len(self.patch.get_connections_from(self.objs[1])), 2)
+        self.assertEqual(self.patch.get_fudi()[-1], ["pd-__main__", "vis", 0])
+        self.assertEqual(self.patch.get_fudi()[-2], ["pd-__main__", "connect", 1, 0, 3, 0])
+    if numpy is None:
+        test_05_connect_many_array.skip = "NumPy is not available."
+
+class Test_04_Live_Edit(unittest.TestCase):
+    """
+    Tests deleting and replacing objects in Pd right away.
+    """
+    def setUp(self):
+        self.main = canvas.get_main_patch()
+        self.objs = [self.main.obj("f", i) for i in range(4)]
+        self.main.connect_many([(0, 0, 1, 0), (1, 0, 2, 0), (2, 0, 3, 0)])
+        self.main.mark_materialized()
+
+    def test_01_delete(self):
+        x, y = self.objs[1].pos
+        script = self.main.delete(self.objs[1])
+        self.assertTrue(["pd-__main__", "mouse", x + 1, y + 1, 1, 0] in script)
+        self.assertEqual(script[-3], ["pd-__main__", "cut"])
+        self.assertEqual(self.main.objects, [self.objs[0], self.objs[2], self.objs[3]])
+        self.assertEqual([obj.id for obj in self.main.objects], [0, 1, 2])
+        self.assertEqual(self.main.get_fudi()[3:5], [
+            ["pd-__main__", "connect", 1, 0, 2, 0],
+            ["pd-__main__", "vis", 0],
+            ])
+        self.assertEqual(self.objs[1].parent, None)
+        self.assertFalse(self.main.has_object(self.objs[1]))
+        self.assertEqual(self.main.get_edit_script(), [])
+        self.assertRaises(canvas.PureError, self.main.delete, self.objs[1])
+
+    def test_02_disconnect(self):
+        self.main.delete(self.objs[0])
+        self.assertEqual(self.main.disconnect(self.objs[2], 0, self.objs[3], 0), [["pd-__main__", "disconnect", 1, 0, 2, 0]])
+        self.assertEqual(len(self.main.connections), 1)
+        self.assertEqual(self.main.get_edit_script(), [])
+        self.assertRaises(canvas.PureError, self.main.disconnect, self.objs[2], 0, self.objs[3], 0)
+
+    def test_03_replace(self):
+        new = canvas.Obj("+", 1)
+        script = self.main.replace(self.objs[1], new)
+        self.assertEqual(script[-3:], [
+            ["pd-__main__", "obj", self.objs[1].pos[0], self.objs[1].pos[1], "+", 1],
+            ["pd-__main__", "connect", 3, 0, 1, 0],
+            ["pd-__main__", "connect", 0, 0, 3, 0],
+            ])
+        self.assertEqual(new.pos, self.objs[1].pos)
+        self.assertEqual(new.id, 3)
+        self.assertEqual(len(self.main.get_connections_to(new)), 1)
+        self.assertEqual(self.main.get_edit_script(), [])
+
+    def test_04_not_materialized(self):
+        patch = canvas.get_main_patch()
+        objs = [patch.obj("f") for i in range(3)]
+        patch.connect(objs[0], 0, objs[2], 0)
+        self.assertEqual(patch.delete(objs[1]), [])
+        self.assertEqual(patch.replace(objs[0], canvas.Obj("t", "b")), [])
+        self.assertEqual(patch.get_fudi()[2], ["pd-__main__", "connect", 1, 0, 0, 0])
+
+class Test_05_Layout(unittest.TestCase):
+    """
+    Tests the placement of the objects.
+    """
+    def test_01_layers(self):
+        main = canvas.get_main_patch()
+        source = main.obj("adc~")
+        left = main.obj("lop~", 100)
+        right = main.obj("hip~", 100)
+        sink = main.obj("dac~")
+        main.connect_many([(source, 0, left, 0), (source, 1, right, 0), (left, 0, sink, 0), (right, 0, sink, 1), (sink, 0, source, 0)])
+        main.get_fudi()
+        self.assertEqual(source.pos[1], layout.MARGIN)
+        self.assertEqual(left.pos[1], right.pos[1])
+        self.assertTrue(left.pos[1] > source.pos[1])
+        self.assertTrue(right.pos[0] > left.pos[0])
+        self.assertTrue(sink.pos[1] > left.pos[1])
+
+    def test_02_given_position(self):
+        main = canvas.get_main_patch()
+        placed = main.obj("f", pos=[300, 400])
+        moved = main.obj("f")
+        moved.set_position(5, 6)
+        other = main.obj("f")
+        main.get_fudi()
+        self.assertEqual(placed.pos, [300, 400])
+        self.assertEqual(moved.pos, [5, 6])
+        self.assertEqual(other.pos, [layout.MARGIN, layout.MARGIN])
+
+    def test_03_materialized_not_moved(self):
+        main = canvas.get_main_patch()
+        first = main.obj("f")
+        main.get_edit_script()
+        pos = list(first.pos)
+        second = main.obj("t", "b")
+        main.connect(second, 0, first, 0)
+        main.get_edit_script()
+        self.assertEqual(first.pos, pos)
+        self.assertEqual(second.pos[1], pos[1] + layout.ROW_HEIGHT)
+
+    def test_04_wrap(self):
+        widths = [100] * 30
+        positions = layout.layered_layout(widths, [])
+        self.assertTrue(max([x for x, y in positions]) + 100 <= layout.MAX_WIDTH)
+        self.assertTrue(positions[-1][1] > layout.MARGIN)
+        self.assertEqual(len(set([tuple(pos) for pos in positions])), 30)
+
+    def test_05_subpatches(self):
+        main = canvas.get_main_patch()
+        subs = [main.subpatch("sub%d" % (i)) for i in range(2)]
+        inner = subs[1].obj("f")
+        self.assertEqual(subs[1].get_fudi()[0][2:4], subs[1].pos)
+        self.assertNotEqual(subs[0].pos, subs[1].pos)
+        self.assertEqual(inner.pos, [layout.MARGIN, layout.MARGIN])
+
+    def test_06_bands(self):
+        count = 200
+        positions = layout.layered_layout([50] * count, [(i, i + 1) for i in range(count - 1)])
+        self.assertTrue(max([y for x, y in positions]) < layout.MARGIN + layout.MAX_HEIGHT)
+        self.assertTrue(positions[-1][0] > positions[0][0])
+        self.assertEqual(len(set([tuple(pos) for pos in positions])), count)
+
+class Test_06_Pd_File(unittest.TestCase):
+    """
+    Tests the export of patches to .pd files.
+    """
+    def setUp(self):
+        self.synth = canvas.SubPatch("synth")
+        self.osc = self.synth.obj("osc~", 440)
+        self.voice = self.synth.subpatch("voice")
+        self.voice.obj("f", "$1")
+        self.synth.msg("set", 1, ";", "pd", "dsp", 1)
+        self.synth.connect(self.osc, 0, self.voice, 0)
+
+    def test_01_lines(self):
+        self.assertEqual(canvas.get_pd_lines(self.synth), [
+            "#X obj %d %d osc~ 440;" % tuple(self.osc.pos),
+            "#N canvas %s voice 0;" % (canvas.CANVAS_SIZE),
+            "#X obj %d %d f \\$1;" % tuple(self.voice.objects[0].pos),
+            "#X restore %d %d pd voice;" % tuple(self.voice.pos),
+            "#X msg %d %d set 1 \; pd dsp 1;" % tuple(self.synth.objects[2].pos),
+            "#X connect 0 0 1 0;",
+            ])
+
+    def test_02_file(self):
+        file_name = canvas.save_pd_file(self.synth, self.mktemp())
+        lines = open(file_name).read().splitlines()
+        self.assertEqual(lines[0], "#N canvas %s 10;" % (canvas.CANVAS_SIZE))
+        self.assertEqual(lines[1], "#N canvas %s synth 0;" % (canvas.CANVAS_SIZE))
+        self.assertEqual(lines[2:-1], canvas.get_pd_lines(self.synth))
+        self.assertTrue(lines[-1].endswith(" pd synth;"))
+
+    def test_03_compact(self):
+        patch = compact.CompactPatch("big")
+        patch.obj("f").connect(patch.obj("print"))
+        self.assertEqual(canvas.get_pd_lines(patch), ["#X obj 10 10 f;", "#X obj 10 50 print;", "#X connect 0 0 1 0;"])
+
+    def test_04_open(self):
+        directory = self.mktemp()
+        os.mkdir(directory)
+        message, file_name = canvas.open_pd_file(self.synth, directory)
+        self.assertEqual(message, ["pd", "open", "purity-synth.pd", os.path.abspath(directory)])
+        self.assertTrue(os.path.exists(file_name))
+        self.assertEqual(self.synth.get_edit_script(), [])
+        self.assertRaises(canvas.PureError, canvas.open_pd_file, canvas.get_main_patch(), directory)
+
+    def test_05_default_file_name(self):
+        file_name = canvas.get_pd_file_name(self.synth)
+        directory = os.path.dirname(file_name)
+        self.addCleanup(os.rmdir, directory)
+        self.assertEqual(os.path.basename(file_name), "purity-synth.pd")
+        self.assertTrue(os.path.isdir(directory))
+        self.assertTrue(os.path.basename(directory).startswith("purity-%d-" % (os.getpid())))
+        self.assertNotEqual(directory, os.path.dirname(canvas.get_pd_file_name(self.synth)))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the coalescing of continuous symbols.
+"""
+from twisted.trial import unittest
+from twisted.internet import task
+
+from purity import canvas
+from purity import client
+from purity import coalescer
+
+class Test_01_Coalescer(unittest.TestCase):
+    """
+    Tests the keep-latest semantics of continuous symbols.
+    """
+    def setUp(self):
+        self.sent = []
+        self.coalescer = coalescer.Coalescer(self.sent.extend, interval=0.05)
+        self.coalescer.clock = task.Clock()
+        self.coalescer.set_continuous("volume")
+        self.coalescer.set_continuous("pan")
+
+    def test_01_keep_latest(self):
+        for i in range(10):
+            self.coalescer.send_message("volume", i / 10.0)
+            self.coalescer.send_message("pan", -1, i)
+        self.coalescer.send_message("note", 60)
+        self.coalescer.send_message("note", 62)
+        self.assertEqual(self.sent, [["note", 60], ["note", 62]])
+        self.coalescer.clock.advance(0.05)
+        self.assertEqual(self.sent[2:], [["volume", 0.9], ["pan", -1, 9]])
+        self.assertEqual(self.coalescer.stats, {"received": 22, "sent": 4, "saved": 18, "flushes": 1})
+        self.assertAlmostEqual(self.coalescer.get_saved_ratio(), 18 / 22.0)
+
+    def test_02_set_discrete(self):
+        self.coalescer.send_message("volume", 1)
+        self.coalescer.set_continuous("volume", False)
+        self.assertEqual(self.sent, [["volume", 1]])
+        self.coalescer.send_message("volume", 2)
+        self.assertEqual(self.sent, [["volume", 1], ["volume", 2]])
+        self.coalescer.clock.advance(0.05)
+        self.assertEqual(self.coalescer.stats["flushes"], 0)
+
+    def test_03_receive_send(self):
+        purity_client = client.PurityClient()
+        sent = []
+        purity_client.send_messages = sent.extend
+        purity_client.set_continuous("slider")
+        purity_client.coalescer.clock = task.Clock()
+        receive = canvas.get_main_patch().receive("slider")
+        receive.set_client(purity_client)
+        self.assertEqual(receive.send(1), ["slider", 1])
+        receive.send(2)
+        purity_client.coalescer.clock.advance(0.02)
+        self.assertEqual(sent, [["slider", 2]])
+        self.assertEqual(purity_client.get_coalescing_stats()["saved"], 1)
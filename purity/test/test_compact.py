@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the compact storage of patches.
+"""
+from twisted.trial import unittest
+
+from purity import canvas
+from purity import compact
+from purity import layout
+
+class Test_01_Compact_Patch(unittest.TestCase):
+    """
+    Tests that a CompactPatch creates the same thing as a SubPatch.
+    """
+    def setUp(self):
+        self.patch = compact.CompactPatch("__main__")
+        self.osc = self.patch.obj("osc~", 440)
+        self.gain = self.patch.obj("*~", 0.5, x=200, y=30)
+        self.dac = self.patch.obj("dac~")
+        self.hello = self.patch.msg("hello", 1)
+
+    def test_01_handles(self):
+        self.assertEqual(self.gain.name, "*~")
+        self.assertEqual(self.gain.args, [0.5])
+        self.assertEqual(self.gain.pos, [200, 30])
+        self.gain.set_position(10, 20)
+        self.assertEqual(self.gain.get_fudi(), ["obj", 10, 20, "*~", 0.5])
+        self.assertEqual(self.patch.get_object(1), self.gain)
+        self.assertEqual(len(self.patch), 4)
+        self.assertRaises(canvas.PureError, self.patch.get_object, 4)
+
+    def test_02_same_as_subpatch(self):
+        self.osc.connect(self.gain).connect(self.dac)
+        self.patch.connect_many([(1, 0, 2, 1), (self.hello, 0, self.osc, 0)])
+        main = canvas.get_main_patch()
+        osc = main.obj("osc~", 440)
+        gain = main.obj("*~", 0.5)
+        dac = main.obj("dac~")
+        hello = main.msg("hello", 1)
+        for obj in main.objects:
+            obj.set_position(*self.patch.get_object(obj.id).pos)
+        osc.connect(gain).connect(dac)
+        main.connect_many([(1, 0, 2, 1), (hello, 0, osc, 0)])
+        self.assertEqual(self.patch.get_fudi(), main.get_fudi())
+        self.assertEqual(self.patch.get_connection_count(), 4)
+
+    def test_03_interned(self):
+        for i in range(10):
+            self.patch.obj("*~", 0.5)
+        self.assertEqual(len(self.patch._symbols), 4)
+        self.assertEqual(len(self.patch._arg_lists), 4)
+        self.assertTrue(self.patch.get_memory_use() > 0)
+
+    def test_04_validation(self):
+        other = compact.CompactPatch("other").obj("f")
+        self.assertRaises(canvas.PureError, self.patch.connect, other, 0, self.dac, 0)
+        self.assertRaises(canvas.PureError, self.patch.connect_many, [(0, 0, 1, 0), (0, 0, 9, 0)])
+        self.assertEqual(self.patch.get_connection_count(), 0)
+
+    def test_05_layout(self):
+        self.osc.connect(self.dac)
+        self.hello.connect(self.osc)
+        main = canvas.get_main_patch()
+        osc = main.obj("osc~", 440)
+        main.obj("*~", 0.5, x=200, y=30)
+        dac = main.obj("dac~")
+        hello = main.msg("hello", 1)
+        osc.connect(dac)
+        hello.connect(osc)
+        self.assertEqual(self.patch.get_fudi(), main.get_fudi())
+        self.assertEqual(self.gain.pos, [200, 30])
+        self.assertTrue(self.hello.pos[1] < self.osc.pos[1] < self.dac.pos[1])
+        self.dac.set_position(300, 300)
+        self.assertEqual(self.dac.pos, [300, 300])
+        self.assertEqual(self.osc.pos, [layout.MARGIN, layout.MARGIN + layout.ROW_HEIGHT])
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the confirmed delivery of messages.
+"""
+from twisted.trial import unittest
+from twisted.internet import task
+
+from purity import delivery
+from purity import fudi
+from purity.test.fakes import FakeClient
+
+class _FakeClient(FakeClient):
+    """
+    Records what is sent and lets the test play Pure Data.
+    """
+    def __init__(self):
+        FakeClient.__init__(self)
+        self.fudi_server = fudi.FUDIServerFactory()
+    def register_message(self, selector, callback):
+        self.fudi_server.register_message(selector, callback)
+    def unregister_message(self, selector, callback):
+        self.fudi_server.unregister_message(selector, callback)
+    def confirm(self, count):
+        """
+        Confirms the oldest messages sent, as Pd would.
+        """
+        for i in range(count):
+            message = self.sent.pop(0)
+            self.fudi_server.dispatcher.dispatch(None, "__confirm__", fudi.FUDIParser().feed(fudi.to_fudi(*message))[0])
+
+class Test_01_ConfirmedSender(unittest.TestCase):
+    """
+    Tests the ConfirmedSender with a fake client and clock.
+    """
+    def setUp(self):
+        self.client = _FakeClient()
+        self.sender = delivery.ConfirmedSender(self.client, window=2, adaptive=False)
+        self.sender.clock = task.Clock()
+        self.started = self.sender.start()
+        self.client.confirm(1)
+
+    def test_01_window(self):
+        self.assertTrue(self.started.called)
+        results = []
+        for i in range(5):
+            self.sender.send("note", i, 0.333333333).addCallback(results.append)
+        self.assertEqual(self.sender.get_in_flight(), 2)
+        self.assertEqual(self.sender.get_waiting(), 3)
+        self.sender.clock.advance(0.01)
+        self.client.confirm(2)
+        self.assertEqual(results, [0.01, 0.01])
+        self.assertEqual(self.sender.get_in_flight(), 2)
+        self.client.confirm(2)
+        self.client.confirm(1)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(self.sender.stats["confirmed"], 6)
+
+    def test_02_ignores_other_confirmations(self):
+        d = self.sender.send("note", 60)
+        self.sender.on_confirm(None, "other", 1)
+        self.assertFalse(d.called)
+        self.assertEqual(self.sender.stats["ignored"], 1)
+        self.client.confirm(1)
+        self.assertTrue(d.called)
+
+    def test_03_batch_and_cancel(self):
+        d = self.sender.send_batch([["a", 1], ["b", 2], ["c", 3]])
+        self.client.confirm(2)
+        self.assertFalse(d.called)
+        self.client.confirm(1)
+        self.assertTrue(d.called)
+        d = self.sender.send("never", 1)
+        self.sender.cancel_all()
+        return self.assertFailure(d, delivery.DeliveryError)
+
+    def test_04_adaptive_window(self):
+        self.sender.adaptive = True
+        for i in range(20):
+            self.sender.send("note", i)
+            self.sender.clock.advance(0.0005)
+            self.client.confirm(len(self.client.sent))
+        self.assertTrue(self.sender.window > 2)
+        window = self.sender.window
+        self.sender.send("note", 1)
+        self.sender.clock.advance(1.0)
+        self.client.confirm(1)
+        self.assertTrue(self.sender.window < window)
+
+    def test_05_resend(self):
+        results = []
+        self.sender.send("a", 1).addCallback(results.append)
+        self.sender.send("b", 2).addCallback(results.append)
+        self.client.sent = [] # both are lost
+        self.sender.clock.advance(2.0)
+        self.assertEqual(self.client.sent, [["a", 1], ["b", 2]])
+        self.assertEqual(self.sender.stats["resent"], 2)
+        self.sender.clock.advance(0.01)
+        self.client.confirm(2)
+        self.assertEqual(len(results), 2)
+        self.assertAlmostEqual(results[0], 0.01)
+        self.assertEqual(self.sender.get_in_flight(), 0)
+        self.assertEqual(self.sender.clock.getDelayedCalls(), [])
+
+    def test_06_expire(self):
+        self.sender.max_retries = 2
+        d = self.sender.send("never", 1)
+        self.sender.clock.pump([2.0] * 3)
+        self.assertEqual(len(self.client.sent), 3)
+        self.assertEqual(self.sender.stats["expired"], 1)
+        self.assertEqual(self.sender.get_in_flight(), 0)
+        return self.assertFailure(d, delivery.DeliveryError)
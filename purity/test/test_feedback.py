@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the NumPy buffers of values sent by Pd.
+"""
+from twisted.trial import unittest
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+from purity import canvas
+from purity import codec
+from purity import feedback
+from purity import fudi
+from purity.test.fakes import FakeClient
+
+numpy = feedback.numpy
+
+class _FakeClient(FakeClient):
+    """
+    Has a receiver connected to a fake Pd.
+    """
+    def __init__(self):
+        FakeClient.__init__(self)
+        self.fudi_server = fudi.FUDIServerFactory()
+        self.pd = self.fudi_server.buildProtocol(None)
+        self.pd.makeConnection(proto_helpers.StringTransport())
+
+class Test_01_RawPayload(unittest.TestCase):
+    def test_01_parser(self):
+        parser = codec.FUDIParser()
+        parser.raw_selectors.add("bins")
+        messages = parser.feed("bins 1 2.5 -3;\nmeter 1;\nbins;\n")
+        self.assertEqual(messages, [["bins", "1 2.5 -3"], ["meter", 1], ["bins", ""]])
+        self.assertTrue(isinstance(messages[0][1], codec.RawPayload))
+
+    def test_02_escaped_chunk(self):
+        parser = codec.FUDIParser()
+        parser.raw_selectors.add("env")
+        messages = parser.feed("env 1 2 3;\nname foo\\ bar;\n")
+        self.assertEqual(messages, [["env", "1 2 3"], ["name", "foo bar"]])
+        self.assertTrue(isinstance(messages[0][1], codec.RawPayload))
+
+class Test_02_RingBuffer(unittest.TestCase):
+    if numpy is None:
+        skip = "NumPy is not available."
+
+    def test_01_wrap_and_overrun(self):
+        ring = feedback.RingBuffer(4)
+        ring.write([1, 2, 3])
+        self.assertEqual(list(ring.read(2)), [1, 2])
+        ring.write([4, 5, 6])
+        self.assertEqual(len(ring), 4)
+        ring.write([7])
+        self.assertEqual(ring.overruns, 1)
+        self.assertEqual(list(ring.read()), [4, 5, 6, 7])
+        ring.write(range(10))
+        self.assertEqual(list(ring.get_latest(2)), [8, 9])
+        self.assertEqual(list(ring.read()), [6, 7, 8, 9])
+
+class Test_03_FeedbackReceiver(unittest.TestCase):
+    if numpy is None:
+        skip = "NumPy is not available."
+
+    def setUp(self):
+        self.client = _FakeClient()
+        self.batches = []
+
+    def test_01_batch_size(self):
+        receiver = feedback.FeedbackReceiver(self.client, "env", self.batches.append, batch_size=4)
+        receiver.start()
+        self.client.pd.dataReceived("env 1 2 3;\nenv 4 5;\nenv 6 7 8;\n")
+        self.assertEqual([list(b) for b in self.batches], [[1, 2, 3, 4], [5, 6, 7, 8]])
+        self.assertEqual(receiver.stats, {"messages": 3, "values": 8, "batches": 2})
+        receiver.stop()
+
+    def test_04_stop_parses_again(self):
+        received = []
+        self.client.fudi_server.register_message("env", lambda protocol, *atoms: received.append(list(atoms)))
+        receivers = [feedback.FeedbackReceiver(self.client, "env", self.batches.append) for i in range(2)]
+        for receiver in receivers:
+            receiver.start()
+        receivers[0].stop()
+        self.client.pd.dataReceived("env 1 2;\n")
+        self.assertTrue(isinstance(received[0][0], codec.RawPayload))
+        receivers[1].stop()
+        self.assertEqual(self.client.fudi_server.raw_selectors, set())
+        self.client.pd.dataReceived("env 1 2;\n")
+        self.assertEqual(received[1], [1, 2])
+
+    def test_02_interval(self):
+        receiver = feedback.FeedbackReceiver(self.client, "env", self.batches.append, interval=0.1)
+        receiver.clock = task.Clock()
+        receiver.start()
+        self.client.pd.dataReceived("env 0.5;\nenv 0.25;\n")
+        self.assertEqual(self.batches, [])
+        receiver.clock.advance(0.1)
+        self.assertEqual([list(b) for b in self.batches], [[0.5, 0.25]])
+        receiver.clock.advance(0.1)
+        self.assertEqual(len(self.batches), 1)
+        receiver.stop()
+
+    def test_03_array_reader(self):
+        patch = canvas.get_main_patch()
+        feedback.add_array_reader(patch, "table")
+        fudi = patch.get_fudi()
+        self.assertTrue(["pd-__main__", "obj", patch.objects[3].pos[0], patch.objects[3].pos[1], "array", "get", "table"] in fudi)
+        reader = feedback.ArrayReader(self.client, "table")
+        reader.start()
+        results = []
+        reader.read(2, 3).addCallback(results.append)
+        self.assertEqual(self.client.sent, [["__get_table__", 2, 3]])
+        self.client.pd.dataReceived("__array_table__ 0.1 0.2 0.3;\n")
+        self.assertEqual(results[0].dtype, numpy.float32)
+        self.assertTrue(numpy.allclose(results[0], [0.1, 0.2, 0.3]))
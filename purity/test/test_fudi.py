@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the FUDI protocol implementation.
+"""
+from twisted.trial import unittest
+from twisted.test import proto_helpers
+from twisted.internet import task
+from twisted.internet import defer
+
+from purity import fudi
+
+class Test_01_Parser(unittest.TestCase):
+    """
+    Tests the incremental FUDI parser.
+    """
+    def test_01_simple(self):
+        parser = fudi.FUDIParser()
+        messages = parser.feed("ping 1 2.5 bang;\n")
+        self.assertEqual(messages, [["ping", 1, 2.5, "bang"]])
+
+    def test_02_partial_frames(self):
+        parser = fudi.FUDIParser()
+        self.assertEqual(parser.feed("meter 0 -1"), [])
+        self.assertEqual(parser.feed("2.5"), [])
+        messages = parser.feed(";\nmeter 1 3;\nmet")
+        self.assertEqual(messages, [["meter", 0, -12.5], ["meter", 1, 3]])
+        self.assertEqual(parser.feed("er 2 0;"), [["meter", 2, 0]])
+
+    def test_03_commas(self):
+        parser = fudi.FUDIParser()
+        messages = parser.feed("a 1, b 2;")
+        self.assertEqual(messages, [["a", 1], ["b", 2]])
+
+    def test_04_escapes(self):
+        parser = fudi.FUDIParser()
+        messages = parser.feed("msg hello\\ world \\; \\, \\$1 12;")
+        self.assertEqual(messages, [["msg", "hello world", ";", ",", "$1", 12]])
+
+    def test_05_escape_split_across_frames(self):
+        parser = fudi.FUDIParser()
+        self.assertEqual(parser.feed("msg a\\"), [])
+        self.assertEqual(parser.feed("; b, c 1;"), [["msg", "a;", "b"], ["c", 1]])
+
+    def test_06_numbers(self):
+        parser = fudi.FUDIParser()
+        messages = parser.feed("n 3 -3 +3 0.5 -.5 1e-05 - . 3a;")
+        self.assertEqual(messages, [["n", 3, -3, 3, 0.5, -0.5, 1e-05, "-", ".", "3a"]])
+        self.assertTrue(isinstance(messages[0][1], int))
+        self.assertTrue(isinstance(messages[0][4], float))
+
+    def test_07_empty_messages(self):
+        parser = fudi.FUDIParser()
+        self.assertEqual(parser.feed(";\n ; ,a;"), [["a"]])
+
+class Test_02_Encoder(unittest.TestCase):
+    """
+    Tests the conversion of Python lists to FUDI.
+    """
+    def test_01_to_fudi(self):
+        self.assertEqual(fudi.to_fudi("ping", 1, 2.5, "bang"), "ping 1 2.5 bang ;\r\n")
+        self.assertEqual(fudi.to_fudi("bang"), "bang ;\r\n")
+
+    def test_02_encode_messages(self):
+        txt = fudi.encode_messages([["a", 1], ["b"]])
+        self.assertEqual(txt, "a 1 ;\r\nb ;\r\n")
+
+    def test_03_send_messages_single_write(self):
+        protocol = fudi.FUDIProtocol()
+        transport = proto_helpers.StringTransport()
+        protocol.makeConnection(transport)
+        writes = []
+        transport.write = writes.append
+        protocol.send_messages([["pd-__main__", "obj", 10, 10, "osc~", 440]] * 100)
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(len(fudi.FUDIParser().feed(writes[0])), 100)
+
+def _make_protocol(**kwargs):
+    """
+    Returns a connected FUDIProtocol, the list of its writes and its clock.
+    """
+    protocol = fudi.FUDIProtocol(**kwargs)
+    protocol.clock = task.Clock()
+    transport = proto_helpers.StringTransport()
+    protocol.makeConnection(transport)
+    writes = []
+    transport.write = writes.append
+    return protocol, writes, protocol.clock
+
+class Test_03_Coalescing(unittest.TestCase):
+    """
+    Tests the coalescing of outgoing messages.
+    """
+    def test_01_end_of_iteration(self):
+        protocol, writes, clock = _make_protocol(coalesce=True)
+        for i in range(10):
+            protocol.send_message("note", i, 100)
+        self.assertEqual(writes, [])
+        clock.advance(0)
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(protocol.stats["messages"], 10)
+        self.assertEqual(protocol.get_messages_per_write(), 10.0)
+
+    def test_02_max_bytes(self):
+        protocol, writes, clock = _make_protocol(coalesce=True, max_bytes=30)
+        protocol.send_message("note", 60, 100)
+        protocol.send_message("note", 62, 100)
+        protocol.send_message("note", 64, 100)
+        self.assertEqual(len(writes), 1)
+        clock.advance(0)
+        self.assertEqual(len(writes), 2)
+
+    def test_03_max_delay(self):
+        protocol, writes, clock = _make_protocol(coalesce=True, max_delay=0.01)
+        protocol.send_message("a")
+        clock.advance(0.005)
+        protocol.send_message("b")
+        self.assertEqual(writes, [])
+        clock.advance(0.005)
+        self.assertEqual(writes, ["a ;\r\nb ;\r\n"])
+
+    def test_04_disable(self):
+        protocol, writes, clock = _make_protocol(coalesce=True)
+        protocol.send_message("a")
+        protocol.set_flush_policy(coalesce=False)
+        protocol.send_message("b")
+        self.assertEqual(writes, ["a ;\r\n", "b ;\r\n"])
+
+class Test_04_Backpressure(unittest.TestCase):
+    """
+    Tests the queue used when the transport is full.
+    """
+    def test_01_registered_as_producer(self):
+        protocol, writes, clock = _make_protocol()
+        self.assertIdentical(protocol.transport.producer, protocol)
+
+    def test_02_block(self):
+        protocol, writes, clock = _make_protocol(max_queue=2)
+        protocol.pauseProducing()
+        protocol.send_message("note", 0)
+        protocol.send_message("note", 1)
+        self.assertRaises(fudi.QueueFullError, protocol.send_message, "note", 2)
+        self.assertRaises(fudi.QueueFullError, protocol.send_encoded, "note 3 ;\n")
+        self.assertEqual(writes, [])
+        self.assertEqual(protocol.get_queue_depth(), 2)
+        d = protocol.wait_for_drain()
+        protocol.resumeProducing()
+        self.assertEqual(writes, ["note 0 ;\r\nnote 1 ;\r\n"])
+        self.assertEqual(protocol.get_queue_depth(), 0)
+        protocol.send_message("note", 2)
+        self.assertEqual(len(writes), 2)
+        return d
+
+    def test_03_drop_oldest(self):
+        protocol, writes, clock = _make_protocol(max_queue=3)
+        protocol.set_queue_policy("meter", protocol.POLICY_DROP_OLDEST)
+        protocol.pauseProducing()
+        for i in range(5):
+            protocol.send_message("meter", i)
+        self.assertEqual(protocol.get_queue_depth(), 3)
+        self.assertEqual(protocol.stats["dropped"], 2)
+        protocol.resumeProducing()
+        self.assertEqual(writes, ["meter 2 ;\r\nmeter 3 ;\r\nmeter 4 ;\r\n"])
+
+    def test_04_keep_latest(self):
+        protocol, writes, clock = _make_protocol()
+        protocol.set_queue_policy("freq", protocol.POLICY_KEEP_LATEST)
+        protocol.pauseProducing()
+        protocol.send_messages([["freq", 440], ["note", 60], ["freq", 220], ["freq", 110]])
+        self.assertEqual(protocol.get_queue_depth(), 2)
+        protocol.resumeProducing()
+        self.assertEqual(writes, ["freq 110 ;\r\nnote 60 ;\r\n"])
+        self.assertEqual(protocol.stats["max_queue_depth"], 2)
+
+    def test_05_invalid_policy(self):
+        protocol, writes, clock = _make_protocol()
+        self.assertRaises(ValueError, protocol.set_queue_policy, "a", "whatever")
+
+    def test_06_unbounded(self):
+        protocol, writes, clock = _make_protocol(max_queue=2, default_policy=fudi.FUDIProtocol.POLICY_UNBOUNDED)
+        protocol.pauseProducing()
+        for i in range(5):
+            protocol.send_message("note", i)
+        self.assertEqual(protocol.get_queue_depth(), 5)
+        protocol.resumeProducing()
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(len(fudi.FUDIParser().feed(writes[0])), 5)
+
+class Test_05_Dispatcher(unittest.TestCase):
+    """
+    Tests the routing of the messages received.
+    """
+    def test_01_many_subscribers(self):
+        received = []
+        factory = fudi.FUDIServerFactory()
+        factory.register_message("note", lambda protocol, *atoms: received.append(("a", atoms)))
+        factory.register_message("note", lambda protocol, *atoms: received.append(("b", atoms)))
+        protocol = factory.buildProtocol(None)
+        protocol.dataReceived("note 60 100;")
+        self.assertEqual(received, [("a", (60, 100)), ("b", (60, 100))])
+
+    def test_02_glob_and_default(self):
+        received = []
+        dispatcher = fudi.Dispatcher()
+        dispatcher.subscribe("voice*", lambda protocol, *atoms: received.append(atoms))
+        dispatcher.dispatch(None, "voice1", [1])
+        dispatcher.dispatch(None, "voice22", [2])
+        dispatcher.dispatch(None, "other", [3])
+        self.assertEqual(received, [(1, ), (2, )])
+        self.assertEqual(dispatcher.unmatched, 1)
+        dispatcher.set_default_handler(lambda protocol, *atoms: received.append(("default", atoms)))
+        dispatcher.dispatch(None, "other", [3])
+        self.assertEqual(received[-1], ("default", (3, )))
+        self.assertEqual(dispatcher.unmatched, 2)
+
+    def test_03_table_rebuilt_when_registrations_change(self):
+        received = []
+        def _callback(protocol, *atoms):
+            received.append(atoms)
+        dispatcher = fudi.Dispatcher()
+        dispatcher.dispatch(None, "note", [1])
+        dispatcher.subscribe("note", _callback)
+        dispatcher.dispatch(None, "note", [2])
+        dispatcher.unsubscribe("note", _callback)
+        dispatcher.dispatch(None, "note", [3])
+        self.assertEqual(received, [(2, )])
+        self.assertRaises(KeyError, dispatcher.unsubscribe, "note", _callback)
+
+    def test_04_not_callable(self):
+        factory = fudi.FUDIServerFactory()
+        self.assertRaises(TypeError, factory.register_message, "note", "not callable")
+
+    def test_05_table_size(self):
+        dispatcher = fudi.Dispatcher()
+        dispatcher.max_table_size = 10
+        dispatcher.subscribe("voice*", lambda protocol, *atoms: None)
+        for i in range(100):
+            dispatcher.dispatch(None, "other%d" % (i), [])
+            dispatcher.dispatch(None, "voice%d" % (i), [])
+        self.assertEqual(dispatcher.unmatched, 100)
+        self.assertTrue(len(dispatcher._table) <= 10)
+        self.assertEqual([selector for selector in dispatcher._table if selector.startswith("other")], [])
+
+class _DatagramTransport(object):
+    def __init__(self):
+        self.datagrams = []
+    def write(self, datagram):
+        self.datagrams.append(datagram)
+
+class Test_06_UDP(unittest.TestCase):
+    """
+    Tests FUDI over UDP.
+    """
+    def test_01_packing(self):
+        protocol = fudi.FUDIDatagramProtocol(mtu=100)
+        protocol.clock = task.Clock()
+        protocol.transport = _DatagramTransport()
+        for i in range(20):
+            protocol.send_message("note", i, 100) # about 16 bytes each
+        self.assertEqual(protocol.transport.datagrams, [])
+        protocol.clock.advance(0)
+        datagrams = protocol.transport.datagrams
+        self.assertEqual(len(datagrams), 4)
+        for datagram in datagrams:
+            self.assertTrue(len(datagram) <= 100)
+            self.assertTrue(datagram.endswith(";\r\n"))
+        messages = fudi.FUDIParser().feed("".join(datagrams))
+        self.assertEqual(messages, [["note", i, 100] for i in range(20)])
+
+    def test_02_loopback(self):
+        def _received(protocol, *atoms):
+            if not done.called:
+                done.callback(atoms)
+        def _cb_connected(sender):
+            senders.append(sender)
+            sender.send_messages([["ping", 1, 2.5, "bang"]])
+            return done
+        def _cb_done(atoms):
+            self.assertEqual(atoms, (1, 2.5, "bang"))
+            return defer.gatherResults([port.stopListening(), 
+                defer.maybeDeferred(senders[0].transport.stopListening)])
+        senders = []
+        done = defer.Deferred()
+        factory = fudi.FUDIServerFactory()
+        factory.register_message("ping", _received)
+        port = fudi.listen_FUDI_udp(0, factory, interface="127.0.0.1")
+        d = fudi.create_FUDI_client("127.0.0.1", port.getHost().port, tcp=False)
+        d.addCallback(_cb_connected)
+        d.addCallback(_cb_done)
+        return d
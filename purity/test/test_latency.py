@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the latency measurement.
+"""
+import os
+import tempfile
+
+from twisted.trial import unittest
+from twisted.internet import task
+
+from purity import client
+from purity import latency
+from purity.test.fakes import FakeClient
+
+class Test_01_LatencyProbe(unittest.TestCase):
+    """
+    Tests the LatencyProbe with a fake client and clock.
+    """
+    def test_01_rtt_and_jitter(self):
+        fake = FakeClient()
+        probe = latency.LatencyProbe(fake, rate=10.0)
+        probe.clock = task.Clock()
+        probe.start()
+        for number, rtt in enumerate([0.002, 0.004, 0.003]):
+            probe.clock.advance(rtt)
+            fake.callbacks["__pong__"](None, number)
+            probe.clock.advance(0.1 - rtt)
+        probe.stop()
+        self.assertEqual(len(fake.sent), 4)
+        self.assertEqual(fake.callbacks, {})
+        stats = probe.get_stats()
+        self.assertEqual(stats["received"], 3)
+        self.assertEqual(stats["rtt"]["count"], 3)
+        self.assertAlmostEqual(stats["rtt"]["p50"], 0.003)
+        self.assertAlmostEqual(stats["rtt"]["max"], 0.004)
+        self.assertAlmostEqual(stats["jitter"]["max"], 0.002)
+
+    def test_02_dump(self):
+        probe = latency.LatencyProbe(FakeClient())
+        probe.clock = task.Clock()
+        probe.ping()
+        probe.clock.advance(0.005)
+        probe.on_pong(None, 0)
+        file_name = tempfile.mktemp()
+        probe.dump(file_name)
+        lines = open(file_name).read().splitlines()
+        os.remove(file_name)
+        self.assertEqual(lines[0], "# sent 1 received 1")
+        self.assertAlmostEqual(float(lines[-1]), 5.0)
+
+    def test_03_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(latency.percentile(values, 0.5), 51)
+        self.assertEqual(latency.percentile(values, 0.99), 99)
+        self.assertEqual(latency.percentile([], 0.5), None)
+
+    def test_04_lost_ping(self):
+        probe = latency.LatencyProbe(FakeClient())
+        probe.clock = task.Clock()
+        for i in range(3):
+            probe.ping()
+            probe.clock.advance(0.1)
+        probe.on_pong(None, 1)
+        probe.on_pong(None, 0)
+        probe.on_pong(None, 2)
+        stats = probe.get_stats()
+        self.assertEqual(stats["lost"], 1)
+        self.assertEqual(stats["received"], 2)
+        self.assertAlmostEqual(stats["rtt"]["max"], 0.2)
+
+    def test_05_wrap_around(self):
+        probe = latency.LatencyProbe(FakeClient())
+        probe.clock = task.Clock()
+        probe.sent = latency.SEQUENCE_WRAP - 2
+        for i in range(4):
+            probe.ping()
+        self.assertEqual([message[1] for message in probe.purity_client.sent], [999998, 999999, 0, 1])
+        probe.clock.advance(0.01)
+        probe.on_pong(None, 999999)
+        probe.on_pong(None, 999998)
+        probe.on_pong(None, 1)
+        stats = probe.get_stats()
+        self.assertEqual(stats["received"], 2)
+        self.assertEqual(stats["lost"], 2)
+        self.assertEqual(len(probe._ping_times), 0)
+
+    def test_06_stop_without_receiver(self):
+        purity_client = client.PurityClient()
+        purity_client.latency_probe = latency.LatencyProbe(purity_client)
+        purity_client.stop_latency_probe()
+        self.assertEqual(purity_client.latency_probe, None)
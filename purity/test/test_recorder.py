@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the recording and replay of FUDI traffic.
+"""
+from twisted.trial import unittest
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+from purity import fudi
+from purity import recorder
+
+class Test_01_Recorder(unittest.TestCase):
+    """
+    Tests the wire tap and the recording file.
+    """
+    def test_01_record_both_directions(self):
+        file_name = self.mktemp()
+        tap = recorder.SessionRecorder(file_name, size=32)
+        factory = fudi.FUDIServerFactory()
+        protocol = factory.buildProtocol(None)
+        protocol.makeConnection(proto_helpers.StringTransport())
+        factory.set_tap(tap)
+        protocol.dataReceived("meter 1;\n")
+        protocol.send_message("note", 60, 0.5)
+        protocol.send_messages([["a", 1], ["b", 2]] * 10)
+        tap.close()
+        records = list(recorder.read_recording(file_name))
+        self.assertEqual([(r[1], r[2]) for r in records], [
+            (recorder.DIRECTION_RECEIVED, "meter 1;\n"),
+            (recorder.DIRECTION_SENT, "note 60 0.5 ;\r\n"),
+            (recorder.DIRECTION_SENT, "a 1 ;\r\nb 2 ;\r\n" * 10),
+            ])
+        self.assertTrue(records[0][0] <= records[2][0])
+
+    def test_02_not_a_recording(self):
+        file_name = self.mktemp()
+        f = open(file_name, "w")
+        f.write("hello")
+        f.close()
+        self.assertRaises(recorder.RecordingError, list, recorder.read_recording(file_name))
+
+class Test_02_Replayer(unittest.TestCase):
+    """
+    Tests the timing of the replay.
+    """
+    def setUp(self):
+        self.file_name = self.mktemp()
+        tap = recorder.SessionRecorder(self.file_name)
+        now = [100.0]
+        self.patch(recorder, "_now", lambda: now[0])
+        for i in range(4):
+            tap.sent("note %d ;\r\n" % (i))
+            tap.received("ignored ;\r\n")
+            now[0] += 1.0
+        tap.close()
+        self.transport = proto_helpers.StringTransport()
+        self.protocol = fudi.FUDIProtocol()
+        self.protocol.makeConnection(self.transport)
+
+    def test_01_speed(self):
+        replayer = recorder.Replayer(self.file_name, self.protocol, speed=2.0)
+        replayer.clock = task.Clock()
+        result = []
+        replayer.start().addCallback(result.append)
+        self.assertEqual(self.transport.value(), "note 0 ;\r\n")
+        replayer.clock.advance(0.5)
+        self.assertEqual(self.transport.value().count("note"), 2)
+        replayer.clock.advance(1.0)
+        self.assertEqual(result, [4])
+        self.assertEqual(self.transport.value(), "".join(["note %d ;\r\n" % (i) for i in range(4)]))
+
+    def test_02_max_speed(self):
+        replayer = recorder.Replayer(self.file_name, self.protocol, speed=None, records_per_iteration=3)
+        replayer.clock = task.Clock()
+        result = []
+        replayer.start().addCallback(result.append)
+        self.assertEqual(self.transport.value().count("note"), 3)
+        replayer.clock.advance(0)
+        self.assertEqual(result, [4])
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the exchange of samples through sound files.
+"""
+import os
+import struct
+
+from twisted.trial import unittest
+from twisted.internet import task
+
+from purity import codec
+from purity import samples
+from purity.test.fakes import FakeClient
+
+numpy = samples.numpy
+
+class Test_01_Wav(unittest.TestCase):
+    if numpy is None:
+        skip = "NumPy is not available."
+
+    def test_01_write_and_map(self):
+        path = self.mktemp()
+        data = numpy.random.uniform(-1, 1, (1000, 2)).astype(numpy.float32)
+        samples.write_wav(path, data, 48000)
+        self.assertEqual(os.path.getsize(path), 44 + 8000)
+        mapped = samples.map_wav(path)
+        self.assertEqual(mapped.shape, (1000, 2))
+        self.assertTrue(numpy.array_equal(mapped, data))
+
+    def test_02_not_a_wav(self):
+        path = self.mktemp()
+        open(path, "w").write("hello world!")
+        self.assertRaises(samples.SampleError, samples.map_wav, path)
+
+    def test_03_extensible(self):
+        path = self.mktemp()
+        data = numpy.arange(8, dtype=numpy.int16).reshape(4, 2)
+        guid = struct.pack("<H14s", samples.WAVE_FORMAT_PCM, b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71")
+        fmt = struct.pack("<HHIIHHHHI", samples.WAVE_FORMAT_EXTENSIBLE, 2, 44100, 44100 * 4, 4, 16, 22, 16, 3) + guid
+        f = open(path, "wb")
+        f.write(struct.pack("<4sI4s4sI", b"RIFF", 4 + 8 + len(fmt) + 8 + data.nbytes, b"WAVE", b"fmt ", len(fmt)))
+        f.write(fmt)
+        f.write(struct.pack("<4sI", b"data", data.nbytes))
+        f.write(data.tostring())
+        f.close()
+        mapped = samples.map_wav(path)
+        self.assertEqual(mapped.dtype, numpy.int16)
+        self.assertTrue(numpy.array_equal(mapped, data))
+
+class Test_02_SampleExchange(unittest.TestCase):
+    if numpy is None:
+        skip = "NumPy is not available."
+
+    def setUp(self):
+        self.client = FakeClient()
+        self.directory = self.mktemp()
+        os.mkdir(self.directory)
+        self.exchange = samples.SampleExchange(self.client, self.directory, timeout=1.0)
+        self.exchange.clock = task.Clock()
+        self.exchange.start()
+
+    def test_01_send(self):
+        results = []
+        self.exchange.send("table", numpy.ones(100)).addCallback(results.append)
+        path = self.exchange.get_path("table")
+        self.assertEqual(self.client.sent, [["__soundfiler__", 0, "read", "-resize", path, "table"]])
+        self.assertTrue(numpy.array_equal(samples.map_wav(path)[:, 0], numpy.ones(100)))
+        self.exchange.send("table", numpy.zeros(100)).addCallback(results.append)
+        self.assertTrue(numpy.array_equal(samples.map_wav(path)[:, 0], numpy.zeros(100)))
+        self.client.callbacks["__soundfiler_done__"](None, 0, 100)
+        self.client.callbacks["__soundfiler_done__"](None, 1, 100)
+        self.assertEqual(results, [100, 100])
+        self.assertEqual(self.exchange.clock.getDelayedCalls(), [])
+        self.exchange.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_02_receive(self):
+        results = []
+        self.exchange.receive(["left", "right"]).addCallback(results.append)
+        path = self.exchange.get_path(["left", "right"])
+        self.assertEqual(self.client.sent, [["__soundfiler__", 0, "write", "-bytes", 4, path, "left", "right"]])
+        # what Pd would do
+        data = numpy.arange(20, dtype=numpy.float32).reshape(10, 2)
+        samples.write_wav(path, data)
+        self.client.callbacks["__soundfiler_done__"](None, 0, 10)
+        self.assertTrue(numpy.array_equal(results[0], data))
+        self.exchange.release(["left", "right"])
+        self.assertEqual(self.exchange.files, {})
+
+    def test_03_path_with_spaces(self):
+        directory = os.path.join(self.directory, "my samples;")
+        os.mkdir(directory)
+        exchange = samples.SampleExchange(self.client, directory)
+        exchange.clock = task.Clock()
+        d = exchange.send("table", numpy.ones(10))
+        path = exchange.get_path("table")
+        txt = codec.to_fudi(*self.client.sent[0])
+        self.assertEqual(codec.FUDIParser().feed(txt), [["__soundfiler__", 0, "read", "-resize", path, "table"]])
+        exchange.close()
+        return self.assertFailure(d, samples.SampleError)
+
+    def test_04_timeout(self):
+        results = []
+        failed = self.exchange.send("missing", numpy.ones(10))
+        self.exchange.clock.advance(0.5)
+        self.exchange.send("table", numpy.ones(10)).addCallback(results.append)
+        self.exchange.clock.advance(0.5)
+        self.client.callbacks["__soundfiler_done__"](None, 0, 10) # too late
+        self.assertEqual(results, [])
+        self.client.callbacks["__soundfiler_done__"](None, 1, 10)
+        self.assertEqual(results, [10])
+        self.exchange.close()
+        return self.assertFailure(failed, samples.SampleError)
+
+    def test_05_empty_and_odd_names(self):
+        self.exchange.send("empty", numpy.zeros(0))
+        self.exchange.send("empty", [])
+        self.assertEqual(samples.map_wav(self.exchange.get_path("empty")).shape, (0, 1))
+        path = self.exchange.get_path(["a/b", "../c"])
+        self.assertEqual(os.path.dirname(path), self.directory)
+        self.assertNotEqual(path, self.exchange.get_path(["a_b", ".._c"]))
+        for request_id in range(2):
+            self.client.callbacks["__soundfiler_done__"](None, request_id, 0)
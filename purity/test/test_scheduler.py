@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the messages sent ahead of time.
+"""
+import os
+
+from twisted.trial import unittest
+from twisted.internet import task
+
+from purity import client
+from purity import scheduler
+from purity import server
+from purity.test.fakes import FakeClient
+
+class Test_01_FutureSender(unittest.TestCase):
+    """
+    Tests the allocation of the slots of the Pd voices.
+    """
+    def setUp(self):
+        self.client = FakeClient()
+        self.sender = scheduler.FutureSender(self.client, voices=2, slots=2, margin=0.05)
+        self.sender.clock = task.Clock()
+        self.sender.clock.advance(1000.0)
+        self.sender.start()
+
+    def test_01_targets(self):
+        self.sender.send_at(0.5, "note", 60)
+        self.sender.send_at(0.25, "bang")
+        self.assertEqual(self.client.sent, [
+            ["__at_sync__"],
+            ["__at_0__", 0, 500.0, "note", 60],
+            ["__at_1__", 0, 250.0, "bang"],
+            ])
+
+    def test_02_wait_for_free_slot(self):
+        for i in range(6):
+            self.sender.send_at(0.1 * (i + 1), "note", i)
+        self.assertEqual([message[:2] for message in self.client.sent[1:]], [
+            ["__at_0__", 0], ["__at_1__", 0], ["__at_0__", 1], ["__at_1__", 1]])
+        self.assertEqual(self.sender.stats["waited"], 2)
+        self.sender.clock.advance(0.15)
+        self.assertEqual(self.client.sent[5], ["__at_0__", 0, 500.0, "note", 4])
+        self.sender.clock.advance(0.1)
+        self.assertEqual(self.client.sent[6][:2], ["__at_1__", 0])
+        self.assertAlmostEqual(self.client.sent[6][2], 600.0)
+        self.assertEqual(self.sender.stats["sent"], 6)
+
+    def test_03_resync(self):
+        self.sender.clock.advance(10.0)
+        self.sender.resync()
+        self.sender.send_at(10.5, "note", 60)
+        self.assertEqual(self.client.sent[-1], ["__at_0__", 0, 500.0, "note", 60])
+
+    def test_04_not_started(self):
+        purity_client = client.PurityClient()
+        self.assertRaises(RuntimeError, purity_client.send_at, 1.0, "note", 60)
+
+class Test_02_Patch(unittest.TestCase):
+    """
+    Checks the voices in the Purity patch.
+    """
+    def test_01_voices(self):
+        directory = os.path.dirname(server.DYNAMIC_PATCH)
+        self.assertTrue(os.path.exists(os.path.join(directory, "purity_at.pd")))
+        txt = open(server.DYNAMIC_PATCH).read()
+        for i in range(scheduler.VOICES):
+            self.assertTrue("purity_at %d;" % (i) in txt)
+        txt = open(os.path.join(directory, "purity_at.pd")).read()
+        self.assertTrue("#X msg 400 110 %d;" % (scheduler.SLOTS) in txt)
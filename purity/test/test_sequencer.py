@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the NumPy pattern sequencer.
+"""
+from twisted.trial import unittest
+from twisted.internet import task
+
+from purity import codec
+from purity import scheduler
+from purity import sequencer
+from purity.test.fakes import FakeClient
+
+numpy = sequencer.numpy
+
+class _FakeClient(FakeClient):
+    def __init__(self, clock):
+        FakeClient.__init__(self)
+        self.future_sender = scheduler.FutureSender(self)
+        self.future_sender.clock = clock
+        self.future_sender.start()
+    def send_at(self, logical_time, selector, *args):
+        self.future_sender.send_at(logical_time, selector, *args)
+
+class Test_01_Pattern(unittest.TestCase):
+    """
+    Tests the vectorized transformations of patterns.
+    """
+    if numpy is None:
+        skip = "NumPy is not available."
+
+    def test_01_euclidean(self):
+        pattern = sequencer.Pattern.euclidean(3, 8, 2.0, "kick", [1, 100])
+        self.assertEqual(list(pattern.times), [0.0, 0.75, 1.5])
+        self.assertEqual(pattern.values.shape, (3, 2))
+
+    def test_02_transform(self):
+        pattern = sequencer.Pattern.euclidean(4, 4, 1.0, "note", [60])
+        self.assertEqual(list(pattern.transpose(12).values[:, 0]), [72] * 4)
+        self.assertEqual(list(pattern.values[:, 0]), [60] * 4)
+        self.assertEqual(list(pattern.shift(0.5).times), [0.0, 0.25, 0.5, 0.75])
+        masked = pattern.mask(numpy.array([1, 0, 1, 0]))
+        self.assertEqual(list(masked.times), [0.0, 0.5])
+        self.assertEqual(len(pattern.mask(0.5, numpy.random.RandomState(1))) <= 4, True)
+
+    def test_03_merge_and_window(self):
+        kick = sequencer.Pattern.euclidean(2, 4, 1.0, "kick", [1])
+        note = sequencer.Pattern.euclidean(4, 4, 2.0, "note", [60, 0.5])
+        both = kick.merge(note)
+        self.assertEqual(both.selectors, ["kick", "note"])
+        self.assertEqual(both.length, 2.0)
+        self.assertEqual(len(both), 6)
+        block = kick.window(0.75, 1.75)
+        self.assertEqual(list(block.times), [0.25, 0.75])
+        self.assertEqual(block.length, 1.0)
+
+    def test_04_encode_block(self):
+        pattern = sequencer.Pattern([0.1, 0.25], [0, 1], [[60], [1]], 0.5, ["note", "kick"])
+        txt, count = sequencer.encode_block(pattern, 1)
+        self.assertEqual(count, 3)
+        self.assertEqual(codec.FUDIParser().feed(txt), [
+            ["__seq_1__", "clear"],
+            ["__seq_1__", "add", 100, "note", 60],
+            ["__seq_1__", "add", 150, "kick", 1],
+            ])
+
+    def test_05_empty(self):
+        pattern = sequencer.Pattern.euclidean(1, 4, 1.0, "note", [60, 100])
+        block = pattern.window(0.25, 0.75)
+        self.assertEqual(len(block), 0)
+        self.assertEqual(block.values.shape, (0, 2))
+        masked = pattern.mask(0.0)
+        self.assertEqual(len(masked), 0)
+        self.assertEqual(masked.transpose(12).merge(pattern).values.shape, (1, 2))
+        empty = sequencer.Pattern([], [], [], 1.0, ["note"], width=2)
+        self.assertEqual(empty.values.shape, (0, 2))
+
+class Test_02_Sequencer(unittest.TestCase):
+    """
+    Tests that blocks are sent ahead of time.
+    """
+    if numpy is None:
+        skip = "NumPy is not available."
+
+    def test_01_blocks(self):
+        clock = task.Clock()
+        client = _FakeClient(clock)
+        pattern = sequencer.Pattern.euclidean(4, 4, 1.0, "note", [60])
+        seq = sequencer.Sequencer(client, pattern, block_duration=0.5, lookahead=0.2)
+        seq.clock = clock
+        seq.transforms.append(lambda block: block.transpose(1))
+        seq.start()
+        self.assertEqual(client.sent[1:], [
+            ["__seq_0__", "clear"],
+            ["__seq_0__", "add", 0, "note", 61],
+            ["__seq_0__", "add", 250, "note", 61],
+            ["__at_0__", 0, 200.0, "__seq_0__", "bang"],
+            ])
+        clock.advance(0.5)
+        self.assertEqual(client.sent[-1], ["__at_1__", 0, 700.0, "__seq_1__", "bang"])
+        seq.stop()
+        self.assertEqual(seq.stats, {"blocks": 2, "events": 4})
+        self.assertRaises(ValueError, sequencer.Sequencer, client, pattern, 0.5, 0.5)
+
+    def test_02_sparse_pattern(self):
+        clock = task.Clock()
+        client = _FakeClient(clock)
+        pattern = sequencer.Pattern.euclidean(1, 4, 2.0, "note", [60])
+        seq = sequencer.Sequencer(client, pattern, block_duration=0.5, lookahead=0.2)
+        seq.clock = clock
+        seq.transforms.append(lambda block: block.mask(1.0))
+        seq.start()
+        clock.pump([0.5] * 4)
+        seq.stop()
+        self.assertEqual(seq.stats, {"blocks": 5, "events": 2})
+        self.assertEqual(len([message for message in client.sent if message[1:] == ["add", 0, "note", 60]]), 2)
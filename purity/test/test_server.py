@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for loading patches when Pure Data starts.
+"""
+import os
+from twisted.trial import unittest
+
+from purity import canvas
+from purity import client
+from purity import server
+
+class Test_01_Startup_Patches(unittest.TestCase):
+    """
+    Tests the files given to Pd.
+    """
+    def setUp(self):
+        self.main = canvas.get_main_patch()
+        self.osc = self.main.obj("osc~", 440)
+        self.osc.connect(self.main.obj("dac~"))
+
+    def test_01_dynamic_patch(self):
+        lines = server.get_dynamic_patch(self.main).splitlines()
+        original = open(server.DYNAMIC_PATCH).read().splitlines()
+        index = [line.split()[-2:] for line in lines].index(["__main__", "0;"])
+        self.assertEqual(lines[index + 1:index + 4], canvas.get_pd_lines(self.main))
+        self.assertEqual(lines[:index + 1] + lines[index + 4:], original)
+
+    def test_02_command(self):
+        pure_data = server.PureData(main_patch=self.main, open_patches=["my patches/big.pd"])
+        # nothing is written until write_patch()
+        self.assertEqual(pure_data.patch, server.DYNAMIC_PATCH)
+        self.assertNotEqual(self.main.get_edit_script(), [])
+        self.assertRaises(RuntimeError, pure_data.get_command)
+        file_name = pure_data.write_patch()
+        self.addCleanup(server._remove_file, file_name)
+        self.assertEqual(pure_data.write_patch(), file_name)
+        command = pure_data.get_command()
+        self.assertEqual(command[-5:], ["-path", server.DATA_DIR, "-open", "my patches/big.pd", pure_data.patch])
+        self.assertNotEqual(pure_data.patch, server.DYNAMIC_PATCH)
+        # the content is in Pd already
+        self.assertEqual(self.main.get_edit_script(), [])
+        command = server.PureData().get_command()
+        self.assertEqual(command[-1], server.DYNAMIC_PATCH)
+        self.assertFalse("-path" in command)
+
+    def test_03_stop_removes_patch(self):
+        pure_data = server.PureData(main_patch=self.main)
+        pure_data.write_patch()
+        self.assertTrue(os.path.exists(pure_data.patch))
+        self.assertRaises(NotImplementedError, pure_data.stop)
+        self.assertFalse(os.path.exists(pure_data.patch))
+
+    def test_04_open_patch(self):
+        purity_client = client.PurityClient()
+        sent = []
+        purity_client.send_message = lambda *args: sent.append(list(args))
+        synth = canvas.SubPatch("synth")
+        synth.obj("noise~")
+        directory = self.mktemp()
+        os.mkdir(directory)
+        file_name = purity_client.open_patch(synth, directory)
+        self.assertEqual(sent, [["pd", "open", "purity-synth.pd", os.path.dirname(file_name)]])
+        self.assertEqual(synth.get_edit_script(), [])
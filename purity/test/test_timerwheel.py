@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the timer wheel.
+"""
+import random
+
+from twisted.trial import unittest
+from twisted.internet import task
+
+from purity import timerwheel
+
+class Test_01_TimerWheel(unittest.TestCase):
+    """
+    Tests the timer wheel with a fake clock.
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self.wheel = timerwheel.TimerWheel(tick=0.001, bits=4, levels=2)
+        self.wheel.clock = self.clock
+        self.called = []
+
+    def test_01_order_and_cascade(self):
+        random.seed(0)
+        delays = [random.randint(1, 400) * 0.001 for i in range(200)]
+        for i, delay in enumerate(delays):
+            self.wheel.call_later(delay, self.called.append, (delay, i))
+        self.assertEqual(len(self.wheel), 200)
+        self.clock.pump([0.001] * 450)
+        self.assertEqual(self.called, sorted(self.called))
+        self.assertEqual(len(self.called), 200)
+        self.assertEqual(len(self.wheel), 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_02_cancel(self):
+        timers = [self.wheel.call_later(0.05, self.called.append, i) for i in range(10)]
+        for timer in timers[::2]:
+            timer.cancel()
+        timers[0].cancel()
+        self.assertEqual(len(self.wheel), 5)
+        self.clock.advance(0.1)
+        self.assertEqual(self.called, [1, 3, 5, 7, 9])
+        self.assertFalse(timers[1].active())
+
+    def test_03_batch_when_late(self):
+        for i in range(5):
+            self.wheel.call_later(0.01 * i, self.called.append, i)
+        self.clock.advance(1.0)
+        self.assertEqual(self.called, [0, 1, 2, 3, 4])
+
+    def test_04_overflow(self):
+        self.wheel.call_later(2.0, self.called.append, "late")
+        self.wheel.call_later(0.003, self.called.append, "soon")
+        self.clock.pump([0.1] * 19)
+        self.assertEqual(self.called, ["soon"])
+        self.clock.pump([0.1] * 2)
+        self.assertEqual(self.called, ["soon", "late"])
+
+class Test_02_DelayedWrapper(unittest.TestCase):
+    """
+    Tests the replacement of purity.process.DelayedWrapper.
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self.wheel = timerwheel.TimerWheel()
+        self.wheel.clock = self.clock
+
+    def test_01_call_later(self):
+        delayed = timerwheel.DelayedWrapper(self.wheel)
+        results = []
+        delayed.call_later(0.01, lambda a, b=None: (a, b), 1, b=2).addCallback(results.append)
+        self.clock.advance(0.01)
+        self.assertEqual(results, [(1, 2)])
+
+    def test_02_cancel(self):
+        delayed = timerwheel.DelayedWrapper(self.wheel)
+        results = []
+        delayed.call_later(0.01, self.fail, "never").addCallback(results.append)
+        delayed.cancel("Cancelled")
+        self.clock.advance(0.1)
+        self.assertEqual(results, ["Cancelled"])
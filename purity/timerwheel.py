@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The Purity library for Pure Data dynamic patching.
+#
+# Copyright 2009 Alexandre Quessy
+# <alexandre@quessy.net>
+# http://alexandre.quessy.net
+#
+# Purity is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Purity is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the gnu general public license
+# along with Purity.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Hierarchical timer wheel, for many pending timers such as note-offs.
+
+Time is divided in ticks. Level 0 of the wheel has a slot for each of
+the next ticks, level 1 a slot for each of the next groups of ticks, and
+so on. Adding and cancelling a timer is O(1). When the wheel enters a
+group, the timers of its slot are moved to the lower level. All the
+timers due when the wheel is advanced are called in a single reactor
+call, in the order of their deadlines.
+
+The reactor is only woken up for the ticks that have timers.
+
+Usage::
+
+  wheel = timerwheel.get_default_wheel()
+  timer = wheel.call_later(0.5, send_note_off, 60)
+  timer.cancel()
+"""
+from twisted.internet import reactor
+from twisted.internet import defer
+from twisted.python import failure
+from twisted.python import log
+
+class Timer(object):
+    """
+    Function to call at a tick of a TimerWheel.
+    """
+    __slots__ = ["wheel", "tick", "function", "args", "kwargs", "cancelled", "called"]
+
+    def __init__(self, wheel, tick, function, args, kwargs):
+        self.wheel = wheel
+        self.tick = tick
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self.called = False
+
+    def active(self):
+        return not (self.cancelled or self.called)
+
+    def cancel(self):
+        self.wheel.cancel(self)
+
+class TimerWheel(object):
+    """
+    Schedules calls with a resolution of one tick.
+
+    Cancelled timers are only marked as such and are dropped when their
+    slot is reached.
+    """
+    def __init__(self, tick=0.001, bits=8, levels=4):
+        """
+        :param tick: float Duration of a tick in seconds.
+        :param bits: int Each level has 2 ** bits slots.
+        :param levels: int Number of levels. Timers further than
+        2 ** (bits * levels) ticks wait in an overflow list.
+        """
+        self.tick = tick
+        self.bits = bits
+        self.levels = levels
+        self.clock = reactor
+        self._mask = (1 << bits) - 1
+        self._limits = [1 << (bits * (level + 1)) for level in range(levels)]
+        self._wheels = [[[] for i in range(1 << bits)] for level in range(levels)]
+        self._overflow = []
+        self._current = None # last tick processed
+        self._count = 0 # number of active timers
+        self._wake_call = None
+        self._wake_tick = None
+
+    def __len__(self):
+        return self._count
+
+    def _now(self):
+        return int(self.clock.seconds() / self.tick)
+
+    def call_later(self, delay, function, *args, **kwargs):
+        """
+        Calls a function after a delay, rounded up to the next tick.
+        :return: Timer
+        """
+        now = self._now()
+        if self._current is None or self._count == 0:
+            self._current = now
+        ticks = int(delay / self.tick)
+        if ticks * self.tick < delay:
+            ticks += 1
+        tick = now + ticks
+        if tick <= self._current:
+            tick = self._current + 1
+        timer = Timer(self, tick, function, args, kwargs)
+        self._insert(timer)
+        self._count += 1
+        self._schedule_wake(timer.tick)
+        return timer
+
+    def cancel(self, timer):
+        """
+        Cancels a timer. Does nothing if it has already been called or cancelled.
+        """
+        if timer.active():
+            timer.cancelled = True
+            self._count -= 1
+            if self._count == 0:
+                self._clear()
+
+    def _insert(self, timer):
+        delta = timer.tick - self._current
+        level = 0
+        for limit in self._limits:
+            if delta < limit:
+                index = (timer.tick >> (self.bits * level)) & self._mask
+                self._wheels[level][index].append(timer)
+                return
+            level += 1
+        self._overflow.append(timer)
+
+    def _clear(self):
+        """
+        Drops all the cancelled timers.
+        """
+        for wheel in self._wheels:
+            for slot in wheel:
+                del slot[:]
+        del self._overflow[:]
+        if self._wake_call is not None and self._wake_call.active():
+            self._wake_call.cancel()
+        self._wake_call = None
+        self._wake_tick = None
+
+    def _schedule_wake(self, tick):
+        """
+        Makes sure the reactor calls us back at a tick, or before.
+        """
+        if self._wake_tick is not None and self._wake_tick <= tick:
+            return
+        if self._wake_call is not None and self._wake_call.active():
+            self._wake_call.cancel()
+        self._wake_tick = tick
+        delay = max(0.0, tick * self.tick - self.clock.seconds())
+        self._wake_call = self.clock.callLater(delay, self._wake)
+
+    def _wake(self):
+        self._wake_call = None
+        self._wake_tick = None
+        self.advance(self._now())
+        if self._count > 0:
+            self._schedule_wake(self._next_tick())
+
+    def _next_tick(self):
+        """
+        Returns the next tick with a timer in level 0, or the next tick
+        at which a level must be cascaded.
+        """
+        tick = self._current + 1
+        while tick & self._mask:
+            if self._wheels[0][tick & self._mask]:
+                return tick
+            tick += 1
+        return tick
+
+    def advance(self, tick):
+        """
+        Processes all the ticks until the given one, included, and calls
+        their timers.
+        """
+        due = []
+        while self._count > 0 and self._current < tick:
+            self._current += 1
+            self._cascade(self._current)
+            slot = self._wheels[0][self._current & self._mask]
+            if slot:
+                for timer in slot:
+                    if not timer.cancelled:
+                        timer.called = True
+                        self._count -= 1
+                        due.append(timer)
+                del slot[:]
+        if self._count == 0:
+            self._current = tick
+            self._clear()
+        for timer in due:
+            try:
+                timer.function(*timer.args, **timer.kwargs)
+            except:
+                log.err()
+
+    def _cascade(self, tick):
+        """
+        Moves the timers of the groups starting at a tick to the lower levels.
+        """
+        for level in range(1, self.levels):
+            shift = self.bits * level
+            if tick & ((1 << shift) - 1):
+                return
+            slot = self._wheels[level][(tick >> shift) & self._mask]
+            timers = [timer for timer in slot if not timer.cancelled]
+            del slot[:]
+            for timer in timers:
+                self._insert(timer)
+        overflow = [timer for timer in self._overflow if not timer.cancelled]
+        del self._overflow[:]
+        for timer in overflow:
+            self._insert(timer)
+
+_default_wheel = None
+
+def get_default_wheel():
+    """
+    Returns the wheel shared by the DelayedWrapper instances.
+    """
+    global _default_wheel
+    if _default_wheel is None:
+        _default_wheel = TimerWheel()
+    return _default_wheel
+
+class DelayedWrapper(object):
+    """
+    Drop-in replacement for purity.process.DelayedWrapper using a TimerWheel.
+    """
+    def __init__(self, wheel=None):
+        self.wheel = wheel
+        if self.wheel is None:
+            self.wheel = get_default_wheel()
+        self.timer = None
+        self.deferred = None
+        self.is_called = False
+        self.is_cancelled = False
+        self.is_scheduled = False
+
+    def call_later(self, delay, function, *args, **kwargs):
+        """
+        Returns a Deferred called with the result of the function.
+        @see purity.process.DelayedWrapper.call_later
+        """
+        self.deferred = defer.Deferred()
+        self.timer = self.wheel.call_later(delay, self._call_it, function, args, kwargs)
+        self.is_scheduled = True
+        return self.deferred
+
+    def _call_it(self, function, args, kwargs):
+        self.is_called = True
+        try:
+            result = function(*args, **kwargs)
+        except:
+            result = failure.Failure()
+        if isinstance(result, failure.Failure):
+            self.deferred.errback(result)
+        else:
+            self.deferred.callback(result)
+
+    def cancel(self, result):
+        """
+        Cancels the delayed call and calls the Deferred with the result,
+        or its errback if it is a Failure.
+        """
+        if self.is_scheduled and not self.is_cancelled and not self.is_called:
+            self.wheel.cancel(self.timer)
+            self.is_cancelled = True
+            if isinstance(result, failure.Failure):
+                self.deferred.errback(result)
+            else:
+                self.deferred.callback(result)